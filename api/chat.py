@@ -1,49 +1,155 @@
 """
-Chat processor for handling user messages.
-This module processes chat messages and prepares prompts for the model.
+Chat API endpoint implementation.
+This module answers chat messages over HTTP, for API clients and for peers
+in the agent pool, which forward chats to each other through it.
 """
-from flask import current_app
+import json
+from flask import jsonify, current_app, Response, stream_with_context
+from core.agent_pool import FORWARDED_HEADER
+from core.backends import GENERATION_FAILED, GenerationError
+from core.conversation import issue_session, verify_session
+from core.scheduler import ClientQueueFullError, QueueFullError
 
-class ChatProcessor:
-    """Processes chat messages and manages conversation context."""
-    
-    def __init__(self, model_manager):
-        """
-        Initialize the chat processor.
-        
-        Args:
-            model_manager (ModelManager): The model manager instance
-        """
-        self.model_manager = model_manager
-        
-    def process_message(self, message, mode='normal'):
-        """
-        Process a user message and generate a response.
-        
-        Args:
-            message (str): The user's message
-            mode (str): The operating mode
-            
-        Returns:
-            str: The assistant's response
-        """
-        # Create a prompt for the model
-        prompt = self._create_prompt(message)
-        
-        # Generate response using the model
-        response = self.model_manager.generate_response(prompt, mode)
-        
-        return response
-        
-    def _create_prompt(self, message):
-        """
-        Create a prompt for the model based on the user message.
-        
-        Args:
-            message (str): The user's message
+def chat_endpoint(request, chat_processor, scheduler=None):
+    """
+    Answer a chat message, streamed as NDJSON if requested.
+    
+    The request body holds message, mode, session_token and stream. A chat
+    without a session_token starts a new conversation; the answer carries
+    the session_token that continues it. Streamed answers are lines of
+    {"chunk": ...} ending with {"done": true}, or with {"error": ...} if
+    generation failed; closing the connection cancels the generation.
+    
+    Args:
+        request (Request): The Flask request object
+        chat_processor (ChatProcessor): The chat processor instance
+        scheduler (InferenceScheduler): The inference scheduler instance
+    
+    Returns:
+        Response: JSON with the response, or an NDJSON stream of chunks
+    """
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '')
+    mode = data.get('mode', 'normal')
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    if mode not in current_app.config['MODES']:
+        return jsonify({'error': f"Unknown mode {mode}"}), 400
+    
+    # Chats forwarded by a peer are answered here, never forwarded again
+    forwarded_by_peer = request.headers.get(FORWARDED_HEADER)
+    if forwarded_by_peer and not _from_peer(request, chat_processor):
+        return jsonify({'error': 'Invalid agent pool token'}), 403
+    
+    # Peers name the session they forward; clients must hold its signed token
+    token = None
+    if forwarded_by_peer:
+        session_id = data.get('session_id') or None
+        client_id = session_id or request.remote_addr
+    elif data.get('session_token'):
+        token = data['session_token']
+        session_id = client_id = verify_session(token, current_app.config['SECRET_KEY'])
+        if session_id is None:
+            return jsonify({'error': 'Invalid session_token'}), 400
+    else:
+        session_id, token = issue_session(current_app.config['SECRET_KEY'])
+        client_id = request.remote_addr
+    
+    chunks = None
+    agent_id = current_app.config['AGENT_ID']
+    if not forwarded_by_peer:
+        forwarded = chat_processor.forward_message_stream(message, mode, session_id)
+        if forwarded is not None:
+            peer, chunks = forwarded
+            agent_id = peer.agent_id
+    
+    # Otherwise the message waits its turn on the local scheduler
+    job = None
+    if chunks is None and scheduler is not None:
+        try:
+            job = scheduler.submit(
+                client_id,
+                lambda: chat_processor.process_message_stream(message, mode, session_id,
+                                                              client_id)
+            )
+        except ClientQueueFullError as e:
+            return jsonify({'error': 'Too many requests waiting', 'pending': e.pending}), 429
+        except QueueFullError as e:
+            return jsonify({'error': 'Server busy', 'position': e.position}), 429
+        chunks = job.stream()
+    elif chunks is None:
+        chunks = chat_processor.process_message_stream(message, mode, session_id, client_id)
+    
+    if not data.get('stream', False):
+        try:
+            response = ''.join(chunks).strip()
+        except GenerationError as e:
+            return jsonify({'error': str(e)}), 500
+        if job is not None and job.error:
+            return jsonify({'error': _error_message(job.error)}), 500
+        return jsonify({'response': response, 'mode': mode, 'agent_id': agent_id,
+                        'session_token': token})
+    
+    def generate():
+        finished = False
+        try:
+            try:
+                for chunk in chunks:
+                    yield json.dumps({'chunk': chunk}) + '\n'
+            except GenerationError as e:
+                error = e
+            else:
+                error = job.error if job is not None else None
+            finished = True
             
-        Returns:
-            str: The formatted prompt
-        """
-        # Simple prompt format - can be expanded to include context
-        return f"USER: {message}\nASSISTANT:"
\ No newline at end of file
+            # Headers are already sent, so a failed generation ends the stream with an error line
+            if error is not None:
+                yield json.dumps({'error': _error_message(error)}) + '\n'
+                return
+            yield json.dumps({'done': True, 'agent_id': agent_id, 'session_token': token}) + '\n'
+        finally:
+            # A client that went away stops the generation
+            if not finished:
+                if job is not None:
+                    job.cancel()
+                chunks.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _error_message(error):
+    """Get what to tell a client about a failed generation."""
+    return str(error) if isinstance(error, GenerationError) else GENERATION_FAILED
+
+def clear_endpoint(request, chat_processor):
+    """
+    Forget the history of the chat session named by the body's session_token.
+    
+    Args:
+        request (Request): The Flask request object
+        chat_processor (ChatProcessor): The chat processor instance
+    
+    Returns:
+        Response: JSON confirmation
+    """
+    data = request.get_json(silent=True) or {}
+    
+    # Peers clearing a session they forwarded only clear it here
+    if request.headers.get(FORWARDED_HEADER):
+        if not _from_peer(request, chat_processor):
+            return jsonify({'error': 'Invalid agent pool token'}), 403
+        session_id = data.get('session_id')
+        if not session_id:
+            return jsonify({'error': 'session_id is required'}), 400
+        chat_processor.conversations.clear(session_id)
+        return jsonify({'cleared': True})
+    
+    session_id = verify_session(data.get('session_token'), current_app.config['SECRET_KEY'])
+    if session_id is None:
+        return jsonify({'error': 'A valid session_token is required'}), 400
+    chat_processor.clear_conversation(session_id)
+    return jsonify({'cleared': True})
+
+def _from_peer(request, chat_processor):
+    """Check that a request marked as forwarded carries the agent pool's token."""
+    agent_pool = chat_processor.agent_pool
+    return agent_pool is not None and agent_pool.authorized(request.headers)
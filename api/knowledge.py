@@ -3,33 +3,367 @@ Knowledge API endpoint implementation.
 This module handles knowledge database operations.
 """
 import sqlite3
-from flask import jsonify, current_app
+from flask import jsonify, current_app, Response, stream_with_context
 import json
+import re
+import threading
+from features.knowledgeBase.database import bulk_insert, get_connection_pool
+from features.knowledgeBase.retrieval import get_retriever
+
+# Columns that can be requested from the listing endpoint
+LISTING_FIELDS = ('id', 'title', 'content', 'tags', 'created_at')
+
+# Rows fetched from the cursor per chunk of a streamed response
+STREAM_BATCH_SIZE = 500
+
+# Columns returned by search results; content is replaced by a snippet
+SEARCH_COLUMNS = 'k.id, k.title, k.tags, k.created_at'
+
+# Restrict to entries carrying every requested tag, using the tag join table
+TAG_FILTER = '''
+    k.id IN (
+        SELECT kt.knowledge_id FROM knowledge_tags kt
+        JOIN tags t ON t.id = kt.tag_id
+        WHERE t.name IN ({placeholders})
+        GROUP BY kt.knowledge_id
+        HAVING COUNT(*) = ?
+    )
+'''
 
 def get_db_connection():
-    """Create a connection to the SQLite database."""
-    conn = sqlite3.connect(current_app.config['DB_PATH'])
-    conn.row_factory = sqlite3.Row
-    return conn
+    """
+    Check out a pooled connection to the SQLite database.
+    
+    Calling close() on the connection returns it to the pool.
+    """
+    return get_connection_pool().connect()
+
+def _update_index(update):
+    """
+    Apply an incremental change to the knowledge vector index.
+    
+    Index failures are logged rather than failing the request; the index
+    is reconciled with the table on the next startup.
+    
+    Args:
+        update (callable): Receives the KnowledgeRetriever to modify
+    """
+    try:
+        retriever = get_retriever()
+        if retriever.available:
+            update(retriever)
+    except Exception as e:
+        current_app.logger.error(f"Error updating knowledge index: {e}")
+
+def _get_table_version(conn):
+    """
+    Get the knowledge table's change counter, maintained by triggers.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection
+        
+    Returns:
+        int: Version number, incremented on every insert, update and delete
+    """
+    row = conn.execute('SELECT version FROM knowledge_version WHERE id = 1').fetchone()
+    return row['version'] if row else 0
+
+def _parse_fields(fields):
+    """
+    Parse a comma separated field projection.
+    
+    Args:
+        fields (str): Requested field names, or None for all fields
+        
+    Returns:
+        list: Column names to select; id is always included for paging
+        
+    Raises:
+        ValueError: If an unknown field is requested
+    """
+    if not fields:
+        return list(LISTING_FIELDS)
+    
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in LISTING_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    return ['id'] + [field for field in requested if field != 'id']
+
+def _stream_rows(cursor, conn):
+    """
+    Yield query results as newline-delimited JSON, a batch of rows at a time.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor with an executed query
+        conn (sqlite3.Connection): Connection to close once exhausted
+        
+    Yields:
+        str: One JSON document per line
+    """
+    try:
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield ''.join(json.dumps(dict(row)) + '\n' for row in rows)
+    finally:
+        conn.close()
+
+def _sync_index_in_background():
+    """Embed newly imported entries without holding up the request."""
+    try:
+        retriever = get_retriever()
+    except Exception as e:
+        current_app.logger.error(f"Error updating knowledge index: {e}")
+        return
+    if retriever.available:
+        threading.Thread(target=retriever.sync, daemon=True).start()
+
+def _read_ndjson(stream):
+    """
+    Parse a newline-delimited JSON request body lazily.
+    
+    Args:
+        stream (IO): The request body stream
+        
+    Yields:
+        dict or ValueError: Each parsed line, or the error for a bad line
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+def bulk_add_knowledge(request):
+    """
+    Add many knowledge entries from a JSON array or an NDJSON stream.
+    
+    Args:
+        request (Request): The Flask request object, with optional batch_size
+        
+    Returns:
+        Response: JSON with the inserted count, ids and per-row errors
+    """
+    batch_size = request.args.get('batch_size', current_app.config['KNOWLEDGE_BULK_BATCH_SIZE'], type=int)
+    batch_size = max(1, min(batch_size, current_app.config['KNOWLEDGE_BULK_MAX_BATCH_SIZE']))
+    
+    # NDJSON is consumed line by line instead of being buffered
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        entries = _read_ndjson(request.stream)
+    else:
+        entries = request.get_json(silent=True)
+        if not isinstance(entries, list):
+            return jsonify({'error': 'Expected a JSON array or NDJSON body'}), 400
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        result = bulk_insert(conn, entries, batch_size=batch_size)
+    
+    except sqlite3.Error as e:
+        # Drop the unfinished batch before the connection goes back to the pool
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    finally:
+        if conn is not None:
+            conn.close()
+    
+    if result['ids']:
+        _sync_index_in_background()
+    
+    return jsonify({
+        'inserted': len(result['ids']),
+        'ids': result['ids'],
+        'errors': result['errors']
+    })
 
-def get_knowledge():
+def export_knowledge():
     """
-    Retrieve all knowledge entries from the database.
+    Export every knowledge entry as a streamed NDJSON download.
     
     Returns:
-        Response: JSON with knowledge entries
+        Response: NDJSON with one entry per line, oldest first
     """
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM knowledge ORDER BY created_at DESC')
-        knowledge = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        cursor.execute(f"SELECT {', '.join(LISTING_FIELDS)} FROM knowledge ORDER BY id")
+    
+    except sqlite3.Error as e:
+        if conn is not None:
+            conn.close()
+        return jsonify({'error': str(e)}), 500
+    
+    response = Response(stream_with_context(_stream_rows(cursor, conn)),
+                        mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename=knowledge.ndjson'
+    return response
+
+def get_knowledge(request):
+    """
+    Retrieve knowledge entries from the database, newest first.
+    
+    Supports keyset pagination (after_id, limit), field projection (fields),
+    NDJSON streaming (format=ndjson) and conditional requests via ETag.
+    
+    Args:
+        request (Request): The Flask request object
+        
+    Returns:
+        Response: JSON or NDJSON with knowledge entries
+    """
+    after_id = request.args.get('after_id', type=int)
+    stream = request.args.get('format') == 'ndjson'
+    default_limit = None if stream else current_app.config['KNOWLEDGE_PAGE_SIZE']
+    limit = request.args.get('limit', default_limit, type=int)
+    if limit is not None:
+        limit = max(1, min(limit, current_app.config['KNOWLEDGE_MAX_PAGE_SIZE']))
+    
+    try:
+        fields = _parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Ids only grow, so paging on id is stable while rows are added
+    sql = f"SELECT {', '.join(fields)} FROM knowledge"
+    params = []
+    if after_id is not None:
+        sql += ' WHERE id < ?'
+        params.append(after_id)
+    sql += ' ORDER BY id DESC'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        
+        # Answer unchanged polls without touching the rows
+        etag = f"kb-{_get_table_version(conn)}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        
+        if stream:
+            # The stream closes the connection once the rows are sent
+            response = Response(stream_with_context(_stream_rows(cursor, conn)),
+                                mimetype='application/x-ndjson')
+            conn = None
+        else:
+            knowledge = [dict(row) for row in cursor.fetchall()]
+            
+            next_after_id = knowledge[-1]['id'] if limit is not None and len(knowledge) == limit else None
+            response = jsonify({'knowledge': knowledge, 'next_after_id': next_after_id})
         
-        return jsonify({'knowledge': knowledge})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        if conn is not None:
+            conn.close()
+
+def _build_match_query(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+    
+    Every word must match; the last word also matches as a prefix so
+    results update while the user is still typing.
+    
+    Args:
+        query (str): The user's search text
+        
+    Returns:
+        str: FTS5 query, or an empty string if the text has no words
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_knowledge(request):
+    """
+    Search knowledge entries by text and tags, ranked by BM25.
+    
+    Args:
+        request (Request): The Flask request object with q, tags and limit
+        
+    Returns:
+        Response: JSON with ranked results and highlighted snippets
+    """
+    match = _build_match_query(request.args.get('q', ''))
+    tags = [tag.strip().lower() for tag in request.args.get('tags', '').split(',') if tag.strip()]
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    
+    if not match and not tags:
+        return jsonify({'error': 'No search query or tags provided'}), 400
+    
+    conditions = []
+    params = []
+    if match:
+        conditions.append('knowledge_fts MATCH ?')
+        params.append(match)
+    if tags:
+        conditions.append(TAG_FILTER.format(placeholders=', '.join('?' * len(tags))))
+        params.extend(tags)
+        params.append(len(tags))
+    params.append(limit)
+    
+    if match:
+        # Title matches weigh more than content matches
+        sql = f'''
+            SELECT {SEARCH_COLUMNS},
+                   snippet(knowledge_fts, -1, '<mark>', '</mark>', '...', 24) AS snippet,
+                   -bm25(knowledge_fts, 10.0, 1.0) AS score
+            FROM knowledge_fts
+            JOIN knowledge k ON k.id = knowledge_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY score DESC
+            LIMIT ?
+        '''
+    else:
+        sql = f'''
+            SELECT {SEARCH_COLUMNS}, substr(k.content, 1, 200) AS snippet, 0.0 AS score
+            FROM knowledge k
+            WHERE {' AND '.join(conditions)}
+            ORDER BY k.id DESC
+            LIMIT ?
+        '''
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        results = [dict(row) for row in cursor.fetchall()]
+        
+        return jsonify({'results': results})
+    
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    
+    finally:
+        if conn is not None:
+            conn.close()
 
 def add_knowledge(request):
     """
@@ -53,6 +387,7 @@ def add_knowledge(request):
     # Convert tags to JSON string
     tags_json = json.dumps(tags)
     
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -62,12 +397,18 @@ def add_knowledge(request):
         )
         conn.commit()
         knowledge_id = cursor.lastrowid
-        conn.close()
-        
-        return jsonify({'id': knowledge_id, 'message': 'Knowledge added successfully'})
     
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        if conn is not None:
+            conn.close()
+    
+    # Embed only the new entry rather than rebuilding the index
+    _update_index(lambda retriever: retriever.add_entry(knowledge_id, title, content))
+    
+    return jsonify({'id': knowledge_id, 'message': 'Knowledge added successfully'})
 
 def delete_knowledge(knowledge_id):
     """
@@ -79,14 +420,20 @@ def delete_knowledge(knowledge_id):
     Returns:
         Response: JSON confirmation or error
     """
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM knowledge WHERE id = ?', (knowledge_id,))
         conn.commit()
-        conn.close()
-        
-        return jsonify({'message': 'Knowledge deleted successfully'})
     
     except sqlite3.Error as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+    
+    finally:
+        if conn is not None:
+            conn.close()
+    
+    _update_index(lambda retriever: retriever.remove_entry(knowledge_id))
+    
+    return jsonify({'message': 'Knowledge deleted successfully'})
\ No newline at end of file
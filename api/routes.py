@@ -2,37 +2,83 @@
 API route definitions for the Local AI Assistant.
 This module registers all API endpoints with the Flask application.
 """
-from flask import request, jsonify
-# from .chat import chat_endpoint
-from .knowledge import get_knowledge, add_knowledge, delete_knowledge
-from .search import search_endpoint, get_webpage_endpoint
+from flask import request, jsonify, Response
+from .chat import chat_endpoint, clear_endpoint
+from .knowledge import (get_knowledge, search_knowledge, add_knowledge, delete_knowledge,
+                        bulk_add_knowledge, export_knowledge)
+from .search import (search_endpoint, get_webpage_endpoint, get_webpages_endpoint,
+                     search_cache_stats_endpoint)
+from core.agent_pool import PeerRejected
+from utils.sqlite_pool import all_pool_stats
+from utils import metrics
 
-def register_routes(app, chat_processor):
+def register_routes(app, chat_processor, scheduler=None, agent_pool=None):
     """
     Register all API routes.
     
     Args:
         app (Flask): The Flask application
         chat_processor (ChatProcessor): The chat processor instance
+        scheduler (InferenceScheduler): The inference scheduler instance
+        agent_pool (AgentPool): The agent pool instance
     """
-    # # Register chat endpoint
-    # @app.route('/api/chat', methods=['POST'])
-    # def chat():
-    #     return chat_endpoint(request, chat_processor)
+    # Chat endpoints, also used by peers forwarding chats
+    @app.route('/api/chat', methods=['POST'])
+    def chat():
+        return chat_endpoint(request, chat_processor, scheduler)
+    
+    @app.route('/api/chat/clear', methods=['POST'])
+    def chat_clear():
+        return clear_endpoint(request, chat_processor)
+    
+    # Agent pool endpoints, only for instances holding the pool's token
+    if agent_pool is not None:
+        @app.route('/api/agents', methods=['GET'])
+        def api_agents():
+            if not agent_pool.authorized(request.headers):
+                return jsonify({'error': 'Invalid agent pool token'}), 403
+            return jsonify(agent_pool.stats())
+        
+        @app.route('/api/agents/announce', methods=['POST'])
+        def api_agents_announce():
+            if not agent_pool.authorized(request.headers):
+                return jsonify({'error': 'Invalid agent pool token'}), 403
+            try:
+                return jsonify(agent_pool.receive(request.get_json(silent=True) or {}))
+            except PeerRejected as e:
+                return jsonify({'error': str(e)}), 403
+            except (ValueError, TypeError) as e:
+                return jsonify({'error': str(e)}), 400
     
     # Knowledge base endpoints
     @app.route('/api/knowledge', methods=['GET'])
     def api_get_knowledge():
-        return get_knowledge()
+        return get_knowledge(request)
+    
+    @app.route('/api/knowledge/search', methods=['GET'])
+    def api_search_knowledge():
+        return search_knowledge(request)
     
     @app.route('/api/knowledge', methods=['POST'])
     def api_add_knowledge():
         return add_knowledge(request)
     
+    @app.route('/api/knowledge/bulk', methods=['POST'])
+    def api_bulk_add_knowledge():
+        return bulk_add_knowledge(request)
+    
+    @app.route('/api/knowledge/export', methods=['GET'])
+    def api_export_knowledge():
+        return export_knowledge()
+    
     @app.route('/api/knowledge/<int:knowledge_id>', methods=['DELETE'])
     def api_delete_knowledge(knowledge_id):
         return delete_knowledge(knowledge_id)
     
+    @app.route('/api/db/stats', methods=['GET'])
+    def api_db_stats():
+        return jsonify({'pools': all_pool_stats()})
+    
     # Search endpoints
     @app.route('/api/search', methods=['POST'])
     def api_search():
@@ -40,4 +86,52 @@ def register_routes(app, chat_processor):
     
     @app.route('/api/webpage', methods=['POST'])
     def api_get_webpage():
-        return get_webpage_endpoint(request)
\ No newline at end of file
+        return get_webpage_endpoint(request)
+    
+    @app.route('/api/webpages', methods=['POST'])
+    def api_get_webpages():
+        return get_webpages_endpoint(request)
+    
+    @app.route('/api/search/cache', methods=['GET'])
+    def api_search_cache_stats():
+        return search_cache_stats_endpoint()
+    
+    # Prometheus metrics
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+    
+    # Metrics of the out-of-process model server, scraped through the web app
+    @app.route('/metrics/model', methods=['GET'])
+    def prometheus_model_metrics():
+        model_manager = chat_processor.model_manager
+        if not hasattr(model_manager, 'metrics'):
+            return Response('', status=404)
+        return Response(model_manager.metrics(), content_type=metrics.CONTENT_TYPE)
+    
+    # Scheduler endpoints
+    @app.route('/api/scheduler/stats', methods=['GET'])
+    def api_scheduler_stats():
+        if scheduler is None:
+            return jsonify({'error': 'Scheduler not available'}), 404
+        return jsonify(scheduler.stats())
+    
+    # Health endpoint, served while the model is still loading
+    @app.route('/api/health', methods=['GET'])
+    def api_health():
+        status = chat_processor.model_manager.status()
+        health = {
+            'status': 'ok',
+            'ready': status['state'] == 'ready',
+            'model': status
+        }
+        if scheduler is not None:
+            stats = scheduler.stats()
+            health['queue_depth'] = stats['queue_depth']
+            health['running'] = stats['running']
+        return jsonify(health)
+    
+    # Model endpoints
+    @app.route('/api/models', methods=['GET'])
+    def api_models():
+        return jsonify(chat_processor.model_manager.stats())
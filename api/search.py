@@ -2,11 +2,12 @@
 Search API endpoint implementation.
 This module handles search-related API requests.
 """
-from flask import jsonify, request
-from features.connectivity.search import WebSearch
+import json
+from flask import jsonify, request, Response, stream_with_context
+from features.connectivity.search import get_web_search
 
-# Initialize web search
-web_search = WebSearch()
+# Shared with research mode so both use one cache and connection pool
+web_search = get_web_search()
 
 def search_endpoint(request):
     """
@@ -50,11 +51,52 @@ def get_webpage_endpoint(request):
     if not data or 'url' not in data:
         return jsonify({'error': 'No URL provided'}), 400
     
-    # Extract URL
+    # Extract URL and settings
     url = data.get('url', '')
+    use_cache = data.get('use_cache', True)
     
     # Get webpage content
-    content = web_search.get_webpage_content(url)
+    content = web_search.get_webpage_content(url, use_cache=use_cache)
     
     # Return the content
-    return jsonify({'content': content})
\ No newline at end of file
+    return jsonify({'content': content})
+
+def get_webpages_endpoint(request):
+    """
+    Fetch several webpages concurrently.
+    
+    Pages are streamed back as NDJSON lines in the order they finish.
+    
+    Args:
+        request (Request): The Flask request object
+        
+    Returns:
+        Response: NDJSON stream of {url, content} or {url, error} objects
+    """
+    # Get request data
+    data = request.json
+    
+    if not data or not isinstance(data.get('urls'), list) or not data['urls']:
+        return jsonify({'error': 'No URLs provided'}), 400
+    
+    # Extract URLs and settings
+    urls = [url for url in data['urls'] if isinstance(url, str) and url.strip()]
+    use_cache = data.get('use_cache', True)
+    deadline = data.get('deadline')
+    
+    def generate():
+        for url, content, error in web_search.get_webpages(urls, use_cache=use_cache,
+                                                           deadline=deadline):
+            page = {'url': url, 'content': content} if error is None else {'url': url, 'error': error}
+            yield json.dumps(page) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def search_cache_stats_endpoint():
+    """
+    Report search and webpage cache statistics.
+    
+    Returns:
+        Response: The JSON response with cache counters
+    """
+    return jsonify(web_search.cache.stats())
\ No newline at end of file
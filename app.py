@@ -2,8 +2,6 @@
 Main application entry point for the Local AI Assistant.
 This file initializes the Flask application and sets up all routes and extensions.
 """
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO
 import os
 import uuid
 from dotenv import load_dotenv
@@ -13,39 +11,38 @@ load_dotenv()
 
 # Import configuration
 from config import config_by_name
+config = config_by_name[os.getenv('FLASK_ENV', 'development')]
+
+# Eventlet and gevent must patch the standard library before Flask imports it
+from utils.concurrency import monkey_patch
+monkey_patch(config.ASYNC_MODE)
+
+from flask import Flask, render_template, request, jsonify
+from flask_socketio import SocketIO
 
 # Create Flask app
 app = Flask(__name__)
-app.config.from_object(config_by_name[os.getenv('FLASK_ENV', 'development')])
+app.config.from_object(config)
 
 # Generate unique agent ID if not set
 if 'AGENT_ID' not in app.config:
-    app.config['AGENT_ID'] = str(uuid.uuid4())[:8]
+    app.config['AGENT_ID'] = os.getenv('AGENT_ID') or str(uuid.uuid4())[:8]
 
 # Set default agent name if not set
 if 'AGENT_NAME' not in app.config:
-    app.config['AGENT_NAME'] = "Local Assistant"
+    app.config['AGENT_NAME'] = os.getenv('AGENT_NAME', "Local Assistant")
 
 # Set up Socket.IO
-socketio = SocketIO(app)
+socketio = SocketIO(app, async_mode=app.config['ASYNC_MODE'])
 app.app_context().push()
 # Initialize database
 from api.knowledge import get_db_connection
+from features.knowledgeBase.database import create_schema
 def init_db():
     """Initialize the database."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    # Create knowledge table if it doesn't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS knowledge (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            tags TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
+    # Create knowledge tables, search index and triggers if they don't exist
+    create_schema(conn)
     conn.close()
 init_db()
 # Initialize CORS
@@ -53,22 +50,101 @@ from flask_cors import CORS
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 # Initialize logging
 import logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s')
+# Trace ids for every request and request metrics, served at /metrics
+from utils import metrics, tracing
+tracing.init_app(app)
+metrics.init_app(app)
 # Set up logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 handler = logging.StreamHandler()       
 # Import core components after app initialization
 from core.model_manager import ModelManager
+from core.model_client import ModelClient
 from core.chat_processor import ChatProcessor
+from core.conversation import issue_session, verify_session
+from core.scheduler import ClientQueueFullError, InferenceScheduler, QueueFullError, worker_count
+from core.agent_pool import AgentPool
+from core.backends import GENERATION_FAILED, GenerationError
 from api.routes import register_routes
 
-# Initialize components
-model_manager = ModelManager()
-chat_processor = ChatProcessor(model_manager)
+# Fill thread and batch settings left at 0 from the autotune profile
+from core.tuning import apply_profile
+apply_profile(app.config, app.logger)
+
+# Initialize components; the model lives in this process unless a model server is configured
+if app.config['MODEL_SERVER_SOCKET']:
+    model_manager = ModelClient(app.config['MODEL_SERVER_SOCKET'], logger=app.logger,
+                                load_wait=app.config['MODEL_LOAD_WAIT'])
+else:
+    model_manager = ModelManager()
+
+def describe_agent():
+    """Report this instance's model and queue to the agent pool."""
+    status = model_manager.status()
+    stats = scheduler.stats()
+    return {
+        'name': app.config['AGENT_NAME'],
+        'modes': app.config['AGENT_MODES'] or list(app.config['MODES']),
+        'model': status['model'],
+        'ready': status['state'] == 'ready',
+        'queue_depth': stats['queue_depth'],
+        'running': stats['running'],
+        'workers': stats['workers']
+    }
+
+# Chats may be answered by less loaded peers, only when a pool is configured
+agent_pool = None
+if app.config['AGENT_PEERS'] and not app.config['AGENT_POOL_TOKEN']:
+    app.logger.warning("AGENT_PEERS is set without AGENT_POOL_TOKEN; the agent pool is disabled")
+elif app.config['AGENT_PEERS']:
+    agent_pool = AgentPool(
+        app.config['AGENT_ID'],
+        app.config['AGENT_URL'] or f"http://127.0.0.1:{app.config['PORT']}",
+        describe_agent,
+        app.config['AGENT_POOL_TOKEN'],
+        seeds=app.config['AGENT_PEERS'],
+        allowed_urls=app.config['AGENT_ALLOWED_URLS'],
+        announce_interval=app.config['AGENT_ANNOUNCE_INTERVAL'],
+        peer_ttl=app.config['AGENT_PEER_TTL'],
+        timeout=app.config['AGENT_FORWARD_TIMEOUT'],
+        max_sessions=app.config['CONVERSATION_MAX_SESSIONS'],
+        logger=app.logger
+    )
+chat_processor = ChatProcessor(model_manager, agent_pool)
+
+# Load the model in the background so the server can accept connections now
+model_manager.add_status_listener(lambda status: socketio.emit('model_status', status))
+model_manager.start_loading()
+
+# All model work runs on the scheduler's workers; several only when the
+# batch engine can decode their requests together or the model server queues them
+scheduler = InferenceScheduler(
+    max_queue_size=app.config['SCHEDULER_MAX_QUEUE'],
+    max_per_client=app.config['SCHEDULER_MAX_PER_CLIENT'],
+    workers=worker_count(app.config, remote=bool(app.config['MODEL_SERVER_SOCKET']))
+)
+scheduler.start()
+if agent_pool is not None:
+    agent_pool.start()
+
+# Reconcile the knowledge vector index in the background, now that its logs are traced
+import threading
+from features.knowledgeBase.retrieval import get_retriever
+def sync_knowledge_index():
+    """Embed knowledge entries missing from the vector index."""
+    with app.app_context():
+        try:
+            changed = get_retriever().sync()
+            app.logger.info(f"Knowledge index synced ({changed} entries changed)")
+        except Exception as e:
+            app.logger.error(f"Error syncing knowledge index: {e}")
+threading.Thread(target=sync_knowledge_index, daemon=True).start()
 
 # Register API routes
-register_routes(app, chat_processor)
+register_routes(app, chat_processor, scheduler, agent_pool)
 
 # Basic routes
 @app.route('/')
@@ -86,28 +162,127 @@ def agent_manager():
     """Render the agent manager page."""
     return render_template('agent_manager.html')
 
+# Conversation of each connected Socket.IO client, by sid
+socket_sessions = {}
+
 # Socket.IO event handlers
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle client connection to Socket.IO."""
-    print('Client connected')
+    app.logger.info(f"Client connected: {request.sid}")
+    metrics.SOCKETIO_CLIENTS.inc()
+    
+    # A client continues only a conversation whose signed token it holds
+    secret_key = app.config['SECRET_KEY']
+    token = auth.get('session_token') if isinstance(auth, dict) else None
+    session_id = verify_session(token, secret_key)
+    if session_id is None:
+        session_id, token = issue_session(secret_key)
+        socketio.emit('session', {'session_token': token}, to=request.sid)
+    socket_sessions[request.sid] = session_id
+    
+    # Tell the new client whether the model is still loading
+    socketio.emit('model_status', model_manager.status(), to=request.sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection from Socket.IO."""
-    print('Client disconnected')
+    app.logger.info(f"Client disconnected: {request.sid}")
+    metrics.SOCKETIO_CLIENTS.dec()
+    socket_sessions.pop(request.sid, None)
+    
+    # Drop any generation still queued or running for this client
+    scheduler.cancel_client(request.sid)
 
 @socketio.on('chat_message')
 def handle_message(data):
     """Process incoming chat messages via Socket.IO."""
     user_input = data.get('message', '')
     mode = data.get('mode', 'normal')
+    request_id = data.get('request_id') or str(uuid.uuid4())
+    session_id = socket_sessions.get(request.sid, request.sid)
+    metrics.SOCKETIO_MESSAGES.labels('chat_message').inc()
     
-    # Process the message
-    response = chat_processor.process_message(user_input, mode)
+    # The client's request id doubles as the trace id; jobs inherit it on submit
+    tracing.start_trace(request_id)
+    metrics.SOCKETIO_IN_FLIGHT.inc()
+    try:
+        stream_response(data, user_input, mode, request_id, session_id)
+    finally:
+        metrics.SOCKETIO_IN_FLIGHT.dec()
+
+def stream_response(data, user_input, mode, request_id, session_id):
+    """Queue a chat message on the scheduler, or forward it to a peer, and emit its response."""
+    # A less loaded peer answers without taking a place in the local queue
+    job = None
+    forwarded = chat_processor.forward_message_stream(user_input, mode, session_id)
+    if forwarded is not None:
+        _, stream = forwarded
+    else:
+        # Queue the generation on the inference worker
+        client_id = request.sid
+        try:
+            job = scheduler.submit(
+                client_id,
+                lambda: chat_processor.process_message_stream(user_input, mode, session_id,
+                                                              client_id),
+                request_id=request_id
+            )
+        except ClientQueueFullError:
+            socketio.emit('server_busy', {
+                'request_id': request_id,
+                'message': "Your earlier messages are still waiting. Please try again shortly."
+            }, to=request.sid)
+            return
+        except QueueFullError as e:
+            socketio.emit('server_busy', {
+                'request_id': request_id,
+                'position': e.position,
+                'message': f"Server busy, position {e.position}. Please try again shortly."
+            }, to=request.sid)
+            return
+        
+        # Let the client know it is waiting behind other requests
+        position = scheduler.position(job)
+        if position > 1:
+            socketio.emit('queued', {'request_id': request_id, 'position': position},
+                          to=request.sid)
+        stream = job.stream()
+    
+    # Stream chunks back to the requesting client as they are generated
+    streaming = data.get('stream', True)
+    chunks = []
+    try:
+        for chunk in stream:
+            chunks.append(chunk)
+            if streaming:
+                socketio.emit('response_chunk', {'request_id': request_id, 'chunk': chunk},
+                              to=request.sid)
+    except GenerationError as e:
+        error = e
+    else:
+        error = job.error if job is not None else None
+    
+    # A failed generation ends with an error instead of a complete response
+    if error is not None:
+        emit_response_error(request_id, error)
+        return
     
-    # Emit response back to client
-    socketio.emit('response', {'response': response})
+    # Non-streaming clients get a single response event
+    event = 'response_done' if streaming else 'response'
+    socketio.emit(event, {'request_id': request_id, 'response': ''.join(chunks)},
+                  to=request.sid)
+
+def emit_response_error(request_id, error):
+    """Tell the requesting client that its response could not be generated."""
+    message = str(error) if isinstance(error, GenerationError) else GENERATION_FAILED
+    socketio.emit('response_error', {'request_id': request_id, 'message': message},
+                  to=request.sid)
+
+@socketio.on('clear_history')
+def handle_clear_history(data):
+    """Forget the conversation history of this client's chat session."""
+    chat_processor.clear_conversation(socket_sessions.get(request.sid, request.sid))
 
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=app.config['PORT'], debug=app.config['DEBUG'])
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Benchmark for continuous batching.
+This script sends concurrent generations through the scheduler and
+ModelManager.generate_stream, once decoded one request at a time and once
+through the batch engine, at increasing concurrency, and reports aggregate
+tokens per second with per-request latency and time to first token.
+
+By default it runs against the fake backend, whose batched steps cost what
+reading the weights once does, so the run shows the scheduling behaviour
+offline. Pass --backend llama_cpp --model PATH to measure a real model.
+
+Usage:
+    python benchmarks/batch_bench.py [--backend fake|llama_cpp] [--model PATH]
+        [--concurrency 1 2 4 8 16] [--requests N] [--max-tokens N]
+        [--engines sequential batched] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from inference_bench import (create_components, git_commit, make_prompt, peak_rss_mb,
+                             run_clients, run_job, summarize)
+
+ENGINES = ('sequential', 'batched')
+
+
+def bench_engine(engine, args):
+    """Run every concurrency level with the batch engine off or on."""
+    levels = sorted(args.concurrency)
+    args.clients = max(levels)
+    model_manager, chat_processor, scheduler = create_components(args, overrides={
+        'BATCH_ENGINE_ENABLED': engine == 'batched',
+        'BATCH_ENGINE_SEQUENCES': max(levels),
+        'SCHEDULER_WORKERS': max(levels) if engine == 'batched' else 1,
+        # Repeated prompts must be generated, not replayed
+        'COMPLETION_CACHE_ENABLED': False
+    })
+    model_manager.completion_cache = None
+
+    results = {}
+    try:
+        for level in levels:
+            def send(client, index):
+                prompt = chat_processor._create_prompt(
+                    make_prompt(args.prompt_words, level * 1000 + index), args.mode)
+                tokens = model_manager.count_tokens(prompt)
+                return run_job(scheduler, f'client-{client}',
+                               lambda: model_manager.generate_stream(prompt, args.mode), tokens)
+
+            samples, wall_time = run_clients(level, args.requests, send)
+            summary = results[level] = summarize(samples, wall_time, peak_rss_mb())
+            print(f"{engine:10} x{level:<3} throughput {summary['throughput_tps']} tok/s  "
+                  f"latency p50/p95 {summary['latency_p50_s']}/{summary['latency_p95_s']}s  "
+                  f"ttft p50 {summary['ttft_p50_s']}s  errors {summary['errors']}")
+    finally:
+        # Free the model before the other engine loads its own copy
+        scheduler.shutdown()
+        model_manager.registry.unload(model_manager.default_model)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark continuous batching")
+    parser.add_argument('--backend', choices=('fake', 'llama_cpp'), default='fake',
+                        help="Model backend (default: fake)")
+    parser.add_argument('--model', help="GGUF model file (required for llama_cpp)")
+    parser.add_argument('--mode', default='normal', help="Operating mode (default: normal)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help="Concurrent clients per run (default: 1 2 4 8 16)")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--requests', type=int, default=3, help="Requests per client (default: 3)")
+    parser.add_argument('--prompt-words', type=int, default=100,
+                        help="Words per user message (default: 100)")
+    parser.add_argument('--max-tokens', type=int, default=128,
+                        help="Tokens generated per request (default: 128)")
+    parser.add_argument('--output', help="Write results as JSON")
+    args = parser.parse_args()
+
+    if args.backend == 'fake' and not args.model:
+        from core.fake_model import write_fake_gguf
+        args.model = os.path.join(tempfile.mkdtemp(prefix='bench-models-'), 'fake.gguf')
+        write_fake_gguf(args.model)
+    if not args.model:
+        parser.error("--model is required with --backend llama_cpp")
+    os.environ.update(MODEL_BACKEND=args.backend, MODEL_PATH=os.path.abspath(args.model),
+                      MODELS_DIR=os.path.dirname(os.path.abspath(args.model)))
+    os.chdir(ROOT)
+
+    results = {engine: bench_engine(engine, args) for engine in args.engines}
+
+    # Aggregate throughput of the batch engine relative to one request at a time
+    if set(ENGINES) <= set(results):
+        print()
+        for level in sorted(args.concurrency):
+            before = results['sequential'][level]['throughput_tps']
+            after = results['batched'][level]['throughput_tps']
+            if before and after:
+                print(f"x{level:<3} batched throughput {after / before:.2f}x sequential")
+
+    if args.output:
+        report = {
+            'commit': git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark for webpage content extraction.
+This script compares the streaming extractor with the previous
+BeautifulSoup pipeline over a corpus of saved HTML pages.
+
+Usage:
+    python benchmarks/extract_bench.py [--corpus DIR] [--repeat N]
+
+Without --corpus, synthetic article pages of increasing size are used.
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features.connectivity.extract import extract_text
+
+WORDS = ("the model local assistant page content search result python data query cache "
+         "server network memory thread request response token context prompt").split()
+
+
+def legacy_extract(html, max_chars=3000):
+    """
+    Extract text the way get_webpage_content did before the streaming extractor.
+
+    Args:
+        html (str): The page markup
+        max_chars (int): Characters of text to return
+
+    Returns:
+        str: Extracted text
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.extract()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+    return text[:max_chars] + "..." if len(text) > max_chars else text
+
+
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return ' '.join(words).capitalize() + rng.choice(['.', ', and more.', '.'])
+
+
+def synthetic_page(paragraphs, seed=0):
+    """
+    Build an article page with navigation, scripts, sidebars and comments.
+
+    Args:
+        paragraphs (int): Number of article paragraphs
+        seed (int): Random seed
+
+    Returns:
+        str: The page markup
+    """
+    rng = random.Random(seed)
+    nav = ''.join(f'<li><a href="/{i}">Section {i}</a></li>' for i in range(40))
+    script = '<script>' + 'var x = {"a": [1, 2, 3]};' * 200 + '</script>'
+    article = ''.join(
+        f'<h2>Heading {i}</h2>' if i % 10 == 0 else
+        f'<p>{" ".join(_sentence(rng) for _ in range(4))}</p>'
+        for i in range(paragraphs)
+    )
+    sidebar = ''.join(f'<div class="widget"><a href="/t/{i}">Tag {i}</a></div>' for i in range(60))
+    comments = ''.join(f'<div class="comment"><p>{_sentence(rng)}</p></div>'
+                       for _ in range(paragraphs))
+    return (f'<html><head><title>Page</title><style>body {{ color: red; }}</style>{script}</head>'
+            f'<body><header><nav><ul>{nav}</ul></nav></header>'
+            f'<main><article class="post-content">{article}</article></main>'
+            f'<aside class="sidebar">{sidebar}</aside>'
+            f'<section id="comments">{comments}</section>'
+            f'<footer>Copyright</footer></body></html>')
+
+
+def load_corpus(directory):
+    """
+    Load saved HTML pages.
+
+    Args:
+        directory (str): Directory of *.html / *.htm files
+
+    Returns:
+        list: (name, markup) pairs
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.htm*'))):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def measure(fn, html, repeat):
+    """
+    Time an extractor and record its peak traced memory.
+
+    Returns:
+        tuple: (median seconds, peak bytes, output length)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn(html)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak, len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare webpage extraction pipelines")
+    parser.add_argument('--corpus', help="Directory of saved HTML pages")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per page")
+    parser.add_argument('--max-chars', type=int, default=3000, help="Extraction budget")
+    args = parser.parse_args()
+
+    if args.corpus:
+        pages = load_corpus(args.corpus)
+        if not pages:
+            parser.error(f"No HTML files found in {args.corpus}")
+    else:
+        pages = [(f"synthetic-{n}p", synthetic_page(n, seed=n)) for n in (20, 200, 2000)]
+
+    extractors = [
+        ('legacy', lambda html: legacy_extract(html, args.max_chars)),
+        ('stream', lambda html: extract_text(html, args.max_chars))
+    ]
+
+    print(f"{'page':<24}{'KiB':>8}  {'extractor':<8}{'ms':>10}{'peak KiB':>12}{'chars':>8}")
+    totals = {name: 0.0 for name, _ in extractors}
+    for name, html in pages:
+        for label, fn in extractors:
+            seconds, peak, chars = measure(fn, html, args.repeat)
+            totals[label] += seconds
+            print(f"{name[:23]:<24}{len(html) / 1024:>8.0f}  {label:<8}"
+                  f"{seconds * 1000:>10.2f}{peak / 1024:>12.0f}{chars:>8}")
+
+    print()
+    for label, total in totals.items():
+        print(f"{label}: {total * 1000:.1f} ms total")
+    if totals['stream']:
+        print(f"speedup: {totals['legacy'] / totals['stream']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
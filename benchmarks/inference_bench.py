@@ -0,0 +1,419 @@
+"""
+Benchmark for inference latency and throughput.
+This script drives ModelManager, ChatProcessor and the Socket.IO chat_message
+path with concurrent simulated clients and reports time to first token,
+prompt and generation speed, latency percentiles and peak memory, optionally
+writing the results as JSON to compare across commits.
+
+By default it runs against the deterministic fake backend, so it needs no
+model file or network access. Pass --backend llama_cpp --model PATH to
+measure a real GGUF model, or --backend llama_server --model PATH to
+measure a llama.cpp server at LLAMA_SERVER_URL running that model.
+
+Usage:
+    python benchmarks/inference_bench.py [--scenario model chat socketio]
+        [--backend fake|llama_cpp|llama_server] [--model PATH] [--clients N] [--requests N]
+        [--prompt-words N] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import contextvars
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from startup_bench import free_port, get_health
+
+SCENARIOS = ('model', 'chat', 'socketio')
+
+# Question topics; each request gets a different one so the prompts differ
+TOPICS = ("caching", "threads", "memory", "batching", "latency", "sockets", "indexes",
+          "compression", "scheduling", "profiling", "streaming", "quantization")
+
+
+def make_prompt(words, index):
+    """Build a user message of about the given number of words."""
+    topic = TOPICS[index % len(TOPICS)]
+    filler = f"Please explain how {topic} affects the performance of a local assistant. "
+    text = (filler * (words // len(filler.split()) + 1)).split()[:words]
+    return ' '.join(text)
+
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb(pid=None):
+    """
+    Peak resident memory of this process or of a process and its children.
+
+    Returns:
+        float or None: Megabytes, or None where it cannot be determined
+    """
+    if pid is None:
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+    # The server may run under the debug reloader, so check its children too
+    peak = None
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        kb = int(line.split()[1])
+                        peak = max(peak or 0, kb)
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return round(peak / 1024, 1) if peak is not None else None
+
+
+def summarize(samples, wall_time, rss_mb):
+    """
+    Aggregate per-request samples.
+
+    Args:
+        samples (list): Dicts with submitted, started, first, finished, chunks,
+            prompt_tokens and error
+        wall_time (float): Seconds the whole scenario took
+        rss_mb (float): Peak resident memory
+
+    Returns:
+        dict: Summary metrics
+    """
+    done = [s for s in samples if not s['error'] and s['first'] is not None]
+    latencies = [s['finished'] - s['submitted'] for s in done]
+    ttfts = [s['first'] - s['submitted'] for s in done]
+
+    # Speeds are measured from when the request started running, excluding queueing
+    prompt_rates = [s['prompt_tokens'] / (s['first'] - s['started']) for s in done
+                    if s['prompt_tokens'] and s['started'] is not None and s['first'] > s['started']]
+    gen_rates = [(s['chunks'] - 1) / (s['finished'] - s['first']) for s in done
+                 if s['chunks'] > 1 and s['finished'] > s['first']]
+    total_tokens = sum(s['chunks'] for s in done)
+
+    def rounded(value, digits=4):
+        return round(value, digits) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - len(done),
+        'wall_time_s': rounded(wall_time),
+        'ttft_p50_s': rounded(percentile(ttfts, 0.5)),
+        'ttft_p95_s': rounded(percentile(ttfts, 0.95)),
+        'latency_p50_s': rounded(percentile(latencies, 0.5)),
+        'latency_p95_s': rounded(percentile(latencies, 0.95)),
+        'latency_p99_s': rounded(percentile(latencies, 0.99)),
+        'prompt_tps': rounded(percentile(prompt_rates, 0.5), 1),
+        'generation_tps': rounded(percentile(gen_rates, 0.5), 1),
+        'throughput_tps': rounded(total_tokens / wall_time if wall_time else None, 1),
+        'peak_rss_mb': rss_mb,
+        'first_error': next((s['error'] for s in samples if s['error']), None)
+    }
+
+
+def run_clients(clients, requests, send):
+    """
+    Run simulated clients concurrently, each sending requests one after another.
+
+    Args:
+        clients (int): Number of clients
+        requests (int): Requests per client
+        send (callable): Called with (client, index), returns a sample dict
+
+    Returns:
+        tuple: (samples, wall time in seconds)
+    """
+    samples = []
+    lock = threading.Lock()
+
+    def client(number):
+        for i in range(requests):
+            try:
+                sample = send(number, number * requests + i)
+            except Exception as e:
+                sample = {'submitted': 0, 'started': None, 'first': None, 'finished': 0,
+                          'chunks': 0, 'prompt_tokens': 0, 'error': str(e)}
+            with lock:
+                samples.append(sample)
+
+    # Clients run in copies of this context, so they see the app context
+    started = time.monotonic()
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(client, n))
+               for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def run_job(scheduler, client_id, fn, prompt_tokens):
+    """Submit a job to the scheduler and time its stream."""
+    submitted = time.monotonic()
+    job = scheduler.submit(client_id, fn)
+    first = None
+    chunks = 0
+    for _ in job.stream():
+        if first is None:
+            first = time.monotonic()
+        chunks += 1
+    return {'submitted': submitted, 'started': job.started_at, 'first': first,
+            'finished': time.monotonic(), 'chunks': chunks, 'prompt_tokens': prompt_tokens,
+            'error': str(job.error) if job.error else None}
+
+
+def create_components(args, overrides=None):
+    """Create the app context, model manager, chat processor and scheduler in-process."""
+    from flask import Flask
+    from config import config_by_name
+    from core.tuning import apply_profile
+
+    app = Flask('benchmark', root_path=ROOT)
+    app.config.from_object(config_by_name[os.getenv('FLASK_ENV', 'development')])
+    app.config['MODES'] = {name: dict(settings) for name, settings in app.config['MODES'].items()}
+    if args.max_tokens:
+        app.config['MODES'][args.mode]['max_tokens'] = args.max_tokens
+    app.config.update(overrides or {})
+    app.app_context().push()
+    apply_profile(app.config, app.logger)
+
+    from core.model_manager import ModelManager
+    from core.chat_processor import ChatProcessor
+    from core.scheduler import InferenceScheduler, worker_count
+
+    model_manager = ModelManager()
+    model_manager.start_loading()
+    if not model_manager.wait_until_loaded():
+        raise SystemExit(f"Model failed to load: {model_manager.status()['error']}")
+
+    chat_processor = ChatProcessor(model_manager)
+    scheduler = InferenceScheduler(max_queue_size=args.clients * 2,
+                                   max_per_client=args.clients, app=app,
+                                   workers=worker_count(app.config))
+    scheduler.start()
+    return model_manager, chat_processor, scheduler
+
+
+def bench_model(args, components):
+    """Drive ModelManager.generate_stream through the scheduler."""
+    model_manager, chat_processor, scheduler = components
+
+    def send(client, index):
+        prompt = chat_processor._create_prompt(make_prompt(args.prompt_words, index), args.mode)
+        tokens = model_manager.count_tokens(prompt)
+        return run_job(scheduler, f'client-{client}',
+                       lambda: model_manager.generate_stream(prompt, args.mode), tokens)
+
+    samples, wall_time = run_clients(args.clients, args.requests, send)
+    return summarize(samples, wall_time, peak_rss_mb())
+
+
+def bench_chat(args, components):
+    """Drive ChatProcessor.process_message_stream through the scheduler."""
+    model_manager, chat_processor, scheduler = components
+
+    def send(client, index):
+        message = make_prompt(args.prompt_words, index)
+        tokens = model_manager.count_tokens(chat_processor._create_prompt(message, args.mode))
+        return run_job(scheduler, f'client-{client}',
+                       lambda: chat_processor.process_message_stream(message, args.mode), tokens)
+
+    samples, wall_time = run_clients(args.clients, args.requests, send)
+    return summarize(samples, wall_time, peak_rss_mb())
+
+
+def bench_socketio(args, env):
+    """Drive the chat_message event of app.py running in a subprocess."""
+    import socketio
+
+    port = free_port()
+    terminal = os.openpty() if hasattr(os, 'openpty') else None
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=dict(env, PORT=str(port)),
+                               stdin=terminal[1] if terminal else subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Wait for the server and its model
+        deadline = time.monotonic() + args.timeout
+        while True:
+            health = get_health(port)
+            if health and health['model']['state'] == 'ready':
+                break
+            if health and health['model']['state'] == 'failed':
+                raise SystemExit(f"Model failed to load: {health['model']['error']}")
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit("Server did not become ready")
+            time.sleep(0.1)
+
+        clients = {}
+
+        def connect(number):
+            client = socketio.Client()
+            state = {}
+
+            @client.on('response_chunk')
+            def on_chunk(data):
+                if state.get('first') is None:
+                    state['first'] = time.monotonic()
+                state['chunks'] = state.get('chunks', 0) + 1
+
+            @client.on('response_done')
+            def on_done(data):
+                state['finished'] = time.monotonic()
+                state['done'].set()
+
+            @client.on('server_busy')
+            def on_busy(data):
+                state['error'] = data['message']
+                state['done'].set()
+
+            client.connect(f'http://127.0.0.1:{port}')
+            clients[number] = (client, state)
+
+        def send(number, index):
+            if number not in clients:
+                connect(number)
+            client, state = clients[number]
+            state.clear()
+            state['done'] = threading.Event()
+            submitted = time.monotonic()
+            client.emit('chat_message', {'message': make_prompt(args.prompt_words, index),
+                                         'mode': args.mode, 'request_id': str(index)})
+            if not state['done'].wait(args.timeout):
+                state['error'] = 'timed out'
+            return {'submitted': submitted, 'started': None, 'first': state.get('first'),
+                    'finished': state.get('finished', time.monotonic()),
+                    'chunks': state.get('chunks', 0), 'prompt_tokens': 0,
+                    'error': state.get('error')}
+
+        samples, wall_time = run_clients(args.clients, args.requests, send)
+        for client, _ in clients.values():
+            client.disconnect()
+        return summarize(samples, wall_time, peak_rss_mb(process.pid))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if terminal:
+            for fd in terminal:
+                os.close(fd)
+
+
+def git_commit():
+    """Current commit of the repository, or None outside git."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the change of every metric against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for scenario, metrics in results.items():
+        before = baseline.get('results', {}).get(scenario)
+        if not before:
+            continue
+        for key, value in metrics.items():
+            old = before.get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"  {scenario:9} {key:16} {old:>10} -> {value:<10} "
+                      f"({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure inference latency and throughput")
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS, default=list(SCENARIOS),
+                        help="Paths to benchmark (default: all)")
+    parser.add_argument('--backend', choices=('fake', 'llama_cpp', 'llama_server'),
+                        default='fake',
+                        help="Model backend (default: fake)")
+    parser.add_argument('--model', help="GGUF model file (required for llama_cpp and llama_server)")
+    parser.add_argument('--mode', default='normal', help="Operating mode (default: normal)")
+    parser.add_argument('--clients', type=int, default=4, help="Concurrent clients (default: 4)")
+    parser.add_argument('--requests', type=int, default=5, help="Requests per client (default: 5)")
+    parser.add_argument('--prompt-words', type=int, default=200,
+                        help="Words per user message (default: 200)")
+    parser.add_argument('--max-tokens', type=int,
+                        help="Override the mode's max_tokens (in-process scenarios only)")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds to wait for the server")
+    parser.add_argument('--output', help="Write results as JSON")
+    parser.add_argument('--compare', help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    # Settings go through the environment so the Socket.IO server picks them up too
+    env = dict(os.environ, MODEL_BACKEND=args.backend)
+    if args.backend == 'fake' and not args.model:
+        from core.fake_model import write_fake_gguf
+        args.model = os.path.join(tempfile.mkdtemp(prefix='bench-models-'), 'fake.gguf')
+        write_fake_gguf(args.model)
+    if not args.model:
+        parser.error(f"--model is required with --backend {args.backend}")
+    env.update(MODEL_PATH=os.path.abspath(args.model),
+               MODELS_DIR=os.path.dirname(os.path.abspath(args.model)))
+    os.environ.update(env)
+    os.chdir(ROOT)
+
+    results = {}
+    components = None
+    for scenario in args.scenario:
+        if scenario == 'socketio':
+            results[scenario] = bench_socketio(args, env)
+        else:
+            components = components or create_components(args)
+            runner = bench_model if scenario == 'model' else bench_chat
+            results[scenario] = runner(args, components)
+
+        summary = results[scenario]
+        print(f"{scenario:9} ttft p50 {summary['ttft_p50_s']}s  latency p50/p95/p99 "
+              f"{summary['latency_p50_s']}/{summary['latency_p95_s']}/{summary['latency_p99_s']}s  "
+              f"prompt {summary['prompt_tps']} tok/s  generation {summary['generation_tps']} tok/s  "
+              f"rss {summary['peak_rss_mb']} MB  errors {summary['errors']}")
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': {'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                 'python': platform.python_version()},
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'compare')},
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Load test for the Socket.IO and HTTP server.
+This script starts app.py with the fake model backend in a chosen async
+mode, holds hundreds of idle websocket connections open, and meanwhile
+streams chat messages and hammers HTTP endpoints (health, SQLite-backed
+knowledge search, metrics), reporting latencies, errors and server memory.
+
+The client side needs websocket-client for the websocket transport
+(pip install websocket-client); without it clients fall back to polling.
+
+Usage:
+    python benchmarks/load_test.py [--async-mode threading|eventlet|gevent]
+        [--idle N] [--api-clients N] [--api-requests N] [--chats N]
+        [--chat-requests N] [--output results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from startup_bench import free_port, get_health
+from inference_bench import percentile, peak_rss_mb, make_prompt
+
+# HTTP endpoints exercised while chats stream
+ENDPOINTS = (
+    ('health', '/api/health'),
+    ('knowledge_search', '/api/knowledge/search?q=performance'),
+    ('metrics', '/metrics')
+)
+
+
+def start_server(args, port, extra_env=None):
+    """Start app.py with the fake backend and wait until its model is ready."""
+    from core.fake_model import write_fake_gguf
+
+    models_dir = tempfile.mkdtemp(prefix='load-models-')
+    model_path = os.path.join(models_dir, 'fake.gguf')
+    write_fake_gguf(model_path)
+    env = dict(os.environ, PORT=str(port), ASYNC_MODE=args.async_mode, MODEL_BACKEND='fake',
+               MODEL_PATH=model_path, MODELS_DIR=models_dir, FLASK_ENV='production',
+               **(extra_env or {}))
+
+    # Flask-SocketIO only starts the Werkzeug server from a terminal
+    terminal = os.openpty() if hasattr(os, 'openpty') else None
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env,
+                               stdin=terminal[1] if terminal else subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        health = get_health(port)
+        if health and health['model']['state'] in ('ready', 'failed'):
+            break
+        time.sleep(0.1)
+    else:
+        stop_server(process, terminal)
+        raise SystemExit("Server did not start")
+    return process, terminal
+
+
+def stop_server(process, terminal):
+    """Terminate the server and release its terminal."""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    if terminal:
+        for fd in terminal:
+            os.close(fd)
+
+
+def open_idle_clients(url, count, workers=32):
+    """
+    Connect Socket.IO clients that stay idle.
+
+    Returns:
+        tuple: (connected clients, number of failed connections, seconds taken)
+    """
+    import socketio
+
+    clients = []
+    failures = []
+    lock = threading.Lock()
+    remaining = list(range(count))
+
+    def connect():
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                remaining.pop()
+            client = socketio.Client(reconnection=False)
+            try:
+                client.connect(url, wait_timeout=30)
+                with lock:
+                    clients.append(client)
+            except Exception as e:
+                with lock:
+                    failures.append(str(e))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=connect) for _ in range(min(workers, count))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients, len(failures), time.monotonic() - started
+
+
+def run_api_client(port, requests, results, lock):
+    """Call the HTTP endpoints in turn, recording each latency or error."""
+    for i in range(requests):
+        name, path = ENDPOINTS[i % len(ENDPOINTS)]
+        started = time.monotonic()
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=30) as response:
+                response.read()
+            error = None
+        except (urllib.error.URLError, ConnectionError, OSError) as e:
+            error = str(e)
+        with lock:
+            results.setdefault(name, {'latencies': [], 'errors': 0})
+            if error:
+                results[name]['errors'] += 1
+            else:
+                results[name]['latencies'].append(time.monotonic() - started)
+
+
+def run_chat_client(url, requests, number, samples, lock, timeout):
+    """Send chat messages one after another, timing first chunk and completion."""
+    import socketio
+
+    client = socketio.Client(reconnection=False)
+    state = {}
+
+    @client.on('response_chunk')
+    def on_chunk(data):
+        state.setdefault('first', time.monotonic())
+
+    @client.on('response_done')
+    def on_done(data):
+        state['done'].set()
+
+    @client.on('server_busy')
+    def on_busy(data):
+        state['error'] = data['message']
+        state['done'].set()
+
+    client.connect(url, wait_timeout=30)
+    try:
+        for i in range(requests):
+            state.clear()
+            state['done'] = threading.Event()
+            started = time.monotonic()
+            client.emit('chat_message', {'message': make_prompt(50, number * requests + i),
+                                         'request_id': f'load-{number}-{i}'})
+            finished = state['done'].wait(timeout)
+            with lock:
+                samples.append({
+                    'ttft': state['first'] - started if 'first' in state else None,
+                    'latency': time.monotonic() - started,
+                    'error': state.get('error') or (None if finished else 'timed out')
+                })
+    finally:
+        client.disconnect()
+
+
+def summarize_latencies(values):
+    """p50/p95/p99 and maximum of a list of seconds."""
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+    return {
+        'count': len(values),
+        'p50_ms': ms(percentile(values, 0.5)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(max(values) if values else None)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Socket.IO and HTTP server")
+    parser.add_argument('--async-mode', choices=('threading', 'eventlet', 'gevent'),
+                        default='eventlet', help="Server async mode (default: eventlet)")
+    parser.add_argument('--idle', type=int, default=300, help="Idle websocket connections")
+    parser.add_argument('--api-clients', type=int, default=20, help="Concurrent HTTP clients")
+    parser.add_argument('--api-requests', type=int, default=30, help="Requests per HTTP client")
+    parser.add_argument('--chats', type=int, default=4, help="Concurrent chatting clients")
+    parser.add_argument('--chat-requests', type=int, default=3, help="Messages per chat client")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for the server")
+    parser.add_argument('--output', help="Write results as JSON")
+    args = parser.parse_args()
+
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    process, terminal = start_server(args, port)
+    try:
+        idle, connect_failures, connect_time = open_idle_clients(url, args.idle)
+        print(f"{len(idle)} idle clients connected in {connect_time:.1f}s "
+              f"({connect_failures} failed)")
+
+        # Chats and API calls run at the same time, on top of the idle connections
+        api_results = {}
+        chat_samples = []
+        lock = threading.Lock()
+        threads = [threading.Thread(target=run_api_client,
+                                    args=(port, args.api_requests, api_results, lock))
+                   for _ in range(args.api_clients)]
+        threads += [threading.Thread(target=run_chat_client,
+                                     args=(url, args.chat_requests, n, chat_samples, lock,
+                                           args.timeout))
+                    for n in range(args.chats)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        load_time = time.monotonic() - started
+
+        still_connected = sum(1 for client in idle if client.connected)
+        rss = peak_rss_mb(process.pid)
+        for client in idle:
+            client.disconnect()
+    finally:
+        stop_server(process, terminal)
+
+    report = {
+        'async_mode': args.async_mode,
+        'idle_connections': {'requested': args.idle, 'connected': len(idle),
+                             'failed': connect_failures, 'still_connected': still_connected,
+                             'connect_time_s': round(connect_time, 2)},
+        'load_time_s': round(load_time, 2),
+        'api': {name: dict(summarize_latencies(result['latencies']), errors=result['errors'])
+                for name, result in sorted(api_results.items())},
+        'chat': {
+            'ttft': summarize_latencies([s['ttft'] for s in chat_samples if s['ttft'] is not None]),
+            'latency': summarize_latencies([s['latency'] for s in chat_samples if not s['error']]),
+            'errors': sum(1 for s in chat_samples if s['error'])
+        },
+        'server_peak_rss_mb': rss
+    }
+
+    print(f"{still_connected}/{len(idle)} idle clients still connected after {load_time:.1f}s of load")
+    for name, summary in report['api'].items():
+        print(f"{name:17} p50 {summary['p50_ms']}ms  p95 {summary['p95_ms']}ms  "
+              f"p99 {summary['p99_ms']}ms  errors {summary['errors']}")
+    chat = report['chat']
+    print(f"chat              ttft p50 {chat['ttft']['p50_ms']}ms  latency p95 "
+          f"{chat['latency']['p95_ms']}ms  errors {chat['errors']}")
+    print(f"server peak RSS {rss} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
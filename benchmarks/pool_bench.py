@@ -0,0 +1,200 @@
+"""
+Benchmark for the agent pool.
+This script starts several instances of app.py on this host with the fake
+model backend, lets them find each other through AGENT_PEERS, and sends
+concurrent multi-turn chats to the first instance over /api/chat. It
+reports aggregate throughput, which instance answered each chat, and
+whether every session stayed on one instance, for one instance and for
+the whole pool.
+
+Usage:
+    python benchmarks/pool_bench.py [--instances 3] [--sessions 6] [--turns 3]
+        [--async-mode threading|eventlet|gevent] [--output results.json]
+"""
+import argparse
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from startup_bench import free_port
+from inference_bench import make_prompt, percentile
+from load_test import start_server, stop_server
+
+# Secret shared by the benchmark's instances
+POOL_TOKEN = secrets.token_hex(16)
+
+
+def get_json(port, path):
+    """GET a JSON endpoint of an instance, with the pool's token."""
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}',
+                                     headers={'X-Agent-Token': POOL_TOKEN})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def chat(port, message, session_token, timeout):
+    """
+    Stream one chat through /api/chat.
+
+    Returns:
+        dict: Answering agent_id, session_token, chunk count, time to first
+        chunk and latency
+    """
+    body = {'message': message, 'stream': True}
+    if session_token:
+        body['session_token'] = session_token
+    body = json.dumps(body).encode()
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/api/chat', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    started = time.monotonic()
+    sample = {'agent_id': None, 'session_token': session_token, 'chunks': 0, 'ttft': None,
+              'error': None}
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            for line in response:
+                event = json.loads(line)
+                if 'chunk' in event:
+                    sample['chunks'] += 1
+                    if sample['ttft'] is None:
+                        sample['ttft'] = time.monotonic() - started
+                elif event.get('done'):
+                    sample['agent_id'] = event.get('agent_id')
+                    sample['session_token'] = event.get('session_token')
+    except (OSError, ValueError) as e:
+        sample['error'] = str(e)
+    sample['latency'] = time.monotonic() - started
+    return sample
+
+
+def start_pool(args, count):
+    """Start instances and wait until each sees every other one alive with its model loaded."""
+    ports = [free_port() for _ in range(count)]
+    servers = []
+    try:
+        for index, port in enumerate(ports):
+            servers.append(start_server(args, port, extra_env={
+                'AGENT_ID': f'agent-{index}',
+                'AGENT_NAME': f'Instance {index}',
+                'AGENT_PEERS': ','.join(f'http://127.0.0.1:{p}' for p in ports if p != port),
+                'AGENT_POOL_TOKEN': POOL_TOKEN,
+                'AGENT_ANNOUNCE_INTERVAL': str(args.announce_interval),
+                # Repeated prompts must reach a model, not the completion cache
+                'COMPLETION_CACHE_ENABLED': 'False'
+            }))
+
+        # A single instance has no peers and runs without a pool
+        if count == 1:
+            return ports, servers
+
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            known = [sum(peer['alive'] and peer['ready']
+                         for peer in get_json(port, '/api/agents')['peers'])
+                     for port in ports]
+            if all(n == count - 1 for n in known):
+                return ports, servers
+            time.sleep(0.2)
+        raise SystemExit("Instances did not find each other or load their models")
+    except BaseException:
+        for process, terminal in servers:
+            stop_server(process, terminal)
+        raise
+
+
+def bench_pool(args, count):
+    """Run every session against the first instance of a pool of count instances."""
+    ports, servers = start_pool(args, count)
+    samples = []
+    lock = threading.Lock()
+
+    def run_session(number):
+        # Later turns continue the session the first answer handed out
+        session_token = None
+        for turn in range(args.turns):
+            sample = chat(ports[0], make_prompt(args.prompt_words, number * args.turns + turn),
+                          session_token, args.timeout)
+            session_token = sample['session_token']
+            sample['session'] = number
+            with lock:
+                samples.append(sample)
+
+    try:
+        started = time.monotonic()
+        threads = [threading.Thread(target=run_session, args=(n,)) for n in range(args.sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.monotonic() - started
+        agents = get_json(ports[0], '/api/agents') if count > 1 else {'fallbacks': 0}
+    finally:
+        for process, terminal in servers:
+            stop_server(process, terminal)
+
+    # A session answered by more than one instance lost its history
+    answered_by = {}
+    for sample in samples:
+        if sample['agent_id']:
+            answered_by.setdefault(sample['session'], set()).add(sample['agent_id'])
+    latencies = [s['latency'] for s in samples if not s['error']]
+    ttfts = [s['ttft'] for s in samples if s['ttft'] is not None]
+    return {
+        'instances': count,
+        'chats': len(samples),
+        'errors': sum(1 for s in samples if s['error']),
+        'wall_time_s': round(wall_time, 2),
+        'throughput_tps': round(sum(s['chunks'] for s in samples) / wall_time, 1),
+        'latency_p50_s': round(percentile(latencies, 0.5) or 0, 3),
+        'latency_p95_s': round(percentile(latencies, 0.95) or 0, 3),
+        'ttft_p50_s': round(percentile(ttfts, 0.5) or 0, 3),
+        'answered_by': dict(Counter(s['agent_id'] for s in samples)),
+        'split_sessions': sum(1 for agent_ids in answered_by.values() if len(agent_ids) > 1),
+        'fallbacks': agents['fallbacks']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent pool on one host")
+    parser.add_argument('--instances', type=int, default=3, help="Instances in the pool (default: 3)")
+    parser.add_argument('--sessions', type=int, default=6, help="Concurrent chat sessions (default: 6)")
+    parser.add_argument('--turns', type=int, default=3, help="Messages per session (default: 3)")
+    parser.add_argument('--prompt-words', type=int, default=50,
+                        help="Words per user message (default: 50)")
+    parser.add_argument('--announce-interval', type=float, default=1.0,
+                        help="Seconds between announcements (default: 1)")
+    parser.add_argument('--async-mode', choices=('threading', 'eventlet', 'gevent'),
+                        default='threading', help="Server async mode (default: threading)")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for servers")
+    parser.add_argument('--output', help="Write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for count in sorted({1, args.instances}):
+        result = bench_pool(args, count)
+        results.append(result)
+        print(f"x{count:<2} instances  throughput {result['throughput_tps']} tok/s  "
+              f"latency p50/p95 {result['latency_p50_s']}/{result['latency_p95_s']}s  "
+              f"ttft p50 {result['ttft_p50_s']}s  errors {result['errors']}  "
+              f"split sessions {result['split_sessions']}")
+        print(f"    answered by {result['answered_by']}")
+
+    if len(results) > 1 and results[0]['throughput_tps']:
+        print(f"\npool throughput {results[-1]['throughput_tps'] / results[0]['throughput_tps']:.2f}x "
+              f"a single instance")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark for speculative decoding.
+This script generates answers to code-mode prompts in the application's
+prompt format with plain decoding, prompt lookup decoding and a draft
+model, and reports generation speed, the share of drafted tokens the main
+model accepted and the speedup over plain decoding.
+
+It needs llama-cpp-python and real GGUF models; the draft model must share
+the main model's tokenizer (for Mistral-7B, a small Mistral or Llama-2
+vocabulary model).
+
+Usage:
+    python benchmarks/speculative_bench.py --model PATH [--draft-model PATH]
+        [--methods plain prompt_lookup draft] [--draft-tokens N] [--max-tokens N]
+        [--temperature T] [--prompts N] [--output results.json]
+"""
+import argparse
+import ast
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config
+from core.model_manager import STOP_SEQUENCES
+from core.tuning import apply_profile, resolve_settings
+from inference_bench import git_commit
+
+METHODS = ('plain', 'prompt_lookup', 'draft')
+
+# Source files whose functions the code prompts ask about
+SOURCE_FILES = ('core/tuning.py', 'core/completion_cache.py', 'core/model_registry.py',
+                'utils/concurrency.py')
+
+# Requests made about each function; edits repeat much of the prompt, questions do not
+TASKS = (
+    "Add type hints to this function and return the full updated code:",
+    "Rewrite this function with clearer variable names, keeping its behaviour:",
+    "Explain what this function does and point out any edge cases:"
+)
+
+
+def code_prompts(count):
+    """
+    Build code-mode prompts from functions in the repository.
+
+    Args:
+        count (int): Number of prompts
+
+    Returns:
+        list: Prompts in the application's USER/ASSISTANT format
+    """
+    functions = []
+    for path in SOURCE_FILES:
+        with open(os.path.join(ROOT, path)) as f:
+            source = f.read()
+        for node in ast.walk(ast.parse(source)):
+            if isinstance(node, ast.FunctionDef) and 8 <= node.end_lineno - node.lineno <= 40:
+                functions.append(ast.get_source_segment(source, node))
+
+    preamble = Config.SYSTEM_PROMPT + "\n\n" if Config.SYSTEM_PROMPT else ""
+    prompts = []
+    for i in range(count):
+        task = TASKS[i % len(TASKS)]
+        code = functions[(i * 7) % len(functions)]
+        prompts.append(f"{preamble}USER: {task}\n```python\n{code}\n```\nASSISTANT:")
+    return prompts
+
+
+def load_model(path, args, logits_all=False):
+    """Load a model with the configured threads and batch size."""
+    from llama_cpp import Llama
+
+    config = {key: value for key, value in vars(Config).items() if key.isupper()}
+    apply_profile(config)
+    settings = resolve_settings(config)
+    return Llama(model_path=path, n_ctx=args.n_ctx, n_batch=settings['n_batch'],
+                 n_threads=settings['n_threads'], n_threads_batch=settings['n_threads_batch'],
+                 logits_all=logits_all, seed=args.seed, verbose=False)
+
+
+def generate(model, prompt, args, drafter=None):
+    """
+    Generate one answer from a cold context.
+
+    Returns:
+        dict: Text, token count, time to first token and generation speed
+    """
+    model.reset()
+    model.draft_model = drafter
+    if drafter is not None:
+        drafter.begin()
+    started = time.perf_counter()
+    first = None
+    texts = []
+    for chunk in model(prompt, max_tokens=args.max_tokens, temperature=args.temperature,
+                       top_p=Config.MODES['code']['top_p'], stop=STOP_SEQUENCES,
+                       seed=args.seed, stream=True):
+        if first is None:
+            first = time.perf_counter()
+        texts.append(chunk['choices'][0]['text'])
+    finished = time.perf_counter()
+    model.draft_model = None
+
+    tokens = len(texts)
+    generation = finished - (first or finished)
+    return {
+        'text': ''.join(texts),
+        'tokens': tokens,
+        'ttft_s': (first or finished) - started,
+        'gen_tps': (tokens - 1) / generation if tokens > 1 and generation > 0 else None
+    }
+
+
+def run_method(method, model, prompts, args, draft_model=None):
+    """Generate every prompt with one method and aggregate the results."""
+    from core.speculative import create_drafter
+
+    drafter = None
+    if method != 'plain':
+        drafter = create_drafter(method, num_pred_tokens=args.draft_tokens,
+                                 max_ngram_size=args.max_ngram, draft_model=draft_model)
+
+    runs = []
+    for i, prompt in enumerate(prompts):
+        run = generate(model, prompt, args, drafter)
+        runs.append(run)
+        print(f"{method:13} prompt {i + 1}/{len(prompts)}: {run['tokens']} tokens, "
+              f"{run['gen_tps'] or 0:.1f} tok/s")
+
+    tokens = sum(run['tokens'] for run in runs)
+    gen_time = sum((run['tokens'] - 1) / run['gen_tps'] for run in runs if run['gen_tps'])
+    return {
+        'tokens': tokens,
+        'gen_tps': round((tokens - len(runs)) / gen_time, 2) if gen_time else None,
+        'ttft_s': round(sum(run['ttft_s'] for run in runs) / len(runs), 3),
+        'drafted': drafter.drafted if drafter else None,
+        'accepted': drafter.accepted if drafter else None,
+        'acceptance_rate': (round(drafter.acceptance_rate(), 3)
+                            if drafter and drafter.drafted else None),
+        'texts': [run['text'] for run in runs]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speculative decoding")
+    parser.add_argument('--model', default=Config.MODEL_PATH, help="Main GGUF model")
+    parser.add_argument('--draft-model', default=Config.MODEL_DRAFT_PATH,
+                        help="Draft GGUF model sharing the main model's tokenizer")
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+    parser.add_argument('--draft-tokens', type=int, default=Config.SPECULATIVE_NUM_PRED_TOKENS,
+                        help="Tokens drafted per step")
+    parser.add_argument('--max-ngram', type=int, default=Config.SPECULATIVE_MAX_NGRAM,
+                        help="Longest n-gram matched by prompt lookup")
+    parser.add_argument('--max-tokens', type=int, default=256, help="Tokens generated per prompt")
+    parser.add_argument('--temperature', type=float, default=Config.MODES['code']['temperature'],
+                        help="Sampling temperature (default: code mode's)")
+    parser.add_argument('--prompts', type=int, default=6, help="Number of prompts")
+    parser.add_argument('--n-ctx', type=int, default=Config.MODEL_CTX_SIZE, help="Context size")
+    parser.add_argument('--seed', type=int, default=1234, help="Sampling seed")
+    parser.add_argument('--output', help="Write results as JSON")
+    args = parser.parse_args()
+
+    if 'draft' in args.methods and not (args.draft_model and os.path.exists(args.draft_model)):
+        parser.error("--draft-model is required for the draft method")
+
+    prompts = code_prompts(args.prompts)
+    results = {}
+
+    # The baseline uses the plain load; speculative methods need logits for every position
+    if 'plain' in args.methods:
+        model = load_model(args.model, args)
+        results['plain'] = run_method('plain', model, prompts, args)
+        del model
+
+    speculative = [method for method in args.methods if method != 'plain']
+    if speculative:
+        model = load_model(args.model, args, logits_all=True)
+        draft_model = load_model(args.draft_model, args) if 'draft' in speculative else None
+        for method in speculative:
+            results[method] = run_method(method, model, prompts, args, draft_model)
+
+    plain = results.get('plain')
+    for method, result in results.items():
+        if plain and plain['gen_tps'] and result['gen_tps']:
+            result['speedup'] = round(result['gen_tps'] / plain['gen_tps'], 2)
+        # Greedy decoding must not change the answer, whatever was drafted
+        if plain and args.temperature == 0:
+            result['matches_plain'] = result['texts'] == plain['texts']
+
+    print()
+    print(f"{'method':13} {'tok/s':>8} {'ttft s':>7} {'accepted':>9} {'speedup':>8}")
+    for method, result in results.items():
+        rate = result['acceptance_rate']
+        print(f"{method:13} {result['gen_tps'] or 0:8.1f} {result['ttft_s']:7.2f} "
+              f"{f'{rate:.1%}' if rate is not None else '-':>9} "
+              f"{result.get('speedup', '-'):>8}")
+
+    if args.output:
+        report = {
+            'commit': git_commit(),
+            'model': os.path.basename(args.model),
+            'draft_model': os.path.basename(args.draft_model) if args.draft_model else None,
+            'settings': {key: value for key, value in vars(args).items()
+                         if key not in ('output', 'model', 'draft_model')},
+            'results': {method: {key: value for key, value in result.items() if key != 'texts'}
+                        for method, result in results.items()}
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
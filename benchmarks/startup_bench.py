@@ -0,0 +1,115 @@
+"""
+Benchmark for application startup.
+This script starts app.py in a subprocess and measures the time until the
+first HTTP 200 from /api/health and until the model reports ready.
+
+Usage:
+    python benchmarks/startup_bench.py [--runs N] [--port PORT] [--timeout SECONDS]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    """Pick a free TCP port on localhost."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get_health(port):
+    """
+    Query the health endpoint.
+
+    Returns:
+        dict or None: The health payload, or None if the server is not answering
+    """
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1) as response:
+            if response.status == 200:
+                return json.loads(response.read())
+    except (urllib.error.URLError, ConnectionError, OSError):
+        pass
+    return None
+
+
+def run_once(port, timeout):
+    """
+    Start the app once and time its startup.
+
+    Returns:
+        dict: Seconds to first HTTP 200 and to model ready (None if never), final state
+    """
+    env = dict(os.environ, PORT=str(port))
+
+    # Flask-SocketIO only starts the Werkzeug server from a terminal
+    terminal = os.openpty() if hasattr(os, 'openpty') else None
+    stdin = terminal[1] if terminal else subprocess.DEVNULL
+
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env, stdin=stdin,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {'first_200': None, 'model_ready': None, 'state': None}
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                result['state'] = f"exited ({process.returncode})"
+                break
+            health = get_health(port)
+            if health is not None:
+                elapsed = time.perf_counter() - started
+                if result['first_200'] is None:
+                    result['first_200'] = elapsed
+                result['state'] = health['model']['state']
+                if result['state'] == 'ready':
+                    result['model_ready'] = elapsed
+                    break
+                if result['state'] == 'failed':
+                    break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if terminal:
+            for fd in terminal:
+                os.close(fd)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure application startup time")
+    parser.add_argument('--runs', type=int, default=3, help="Number of cold starts")
+    parser.add_argument('--port', type=int, help="Port to run on (default: a free port)")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds to wait per run")
+    args = parser.parse_args()
+
+    results = []
+    for run in range(args.runs):
+        result = run_once(args.port or free_port(), args.timeout)
+        results.append(result)
+        first = f"{result['first_200']:.2f}s" if result['first_200'] is not None else '-'
+        ready = f"{result['model_ready']:.2f}s" if result['model_ready'] is not None else '-'
+        print(f"run {run + 1}: first 200 {first}, model ready {ready} ({result['state']})")
+
+    for key, label in (('first_200', 'time to first HTTP 200'), ('model_ready', 'time to model ready')):
+        values = [r[key] for r in results if r[key] is not None]
+        if values:
+            print(f"{label}: median {statistics.median(values):.2f}s, "
+                  f"min {min(values):.2f}s, max {max(values):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,20 +15,168 @@ class Config:
     TESTING = False
     PORT = int(os.getenv('PORT', 3000)) # due to conflict with other services
     
+    # Server concurrency: 'threading', or 'eventlet'/'gevent' to serve many idle
+    # websockets from one event loop (model and SQLite calls run on a thread pool)
+    ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading')
+    
     # Model settings
-    MODEL_PATH = os.path.join('static', 'models', 'mistral-7b-instruct-v0.2.Q4_K_M.gguf')
+    MODELS_DIR = os.getenv('MODELS_DIR', os.path.join('static', 'models'))
+    MODEL_PATH = os.getenv('MODEL_PATH',
+                           os.path.join(MODELS_DIR, 'mistral-7b-instruct-v0.2.Q4_K_M.gguf'))
+    
+    # Inference backend: 'llama_cpp' in this process, 'llama_server' for a
+    # local llama.cpp server, or 'fake' for a deterministic offline stand-in
+    # with fixed token rates (benchmarks and CI)
+    MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'llama_cpp')
+    # llama_server generates up to LLAMA_SERVER_SLOTS requests at once; start
+    # the server with the same -np and MODEL_PATH's model (read for metadata)
+    LLAMA_SERVER_URL = os.getenv('LLAMA_SERVER_URL', 'http://127.0.0.1:8080')
+    LLAMA_SERVER_SLOTS = int(os.getenv('LLAMA_SERVER_SLOTS', 4))
+    LLAMA_SERVER_TIMEOUT = float(os.getenv('LLAMA_SERVER_TIMEOUT', 300))
+    FAKE_MODEL_PROMPT_TPS = float(os.getenv('FAKE_MODEL_PROMPT_TPS', 2000))
+    FAKE_MODEL_GEN_TPS = float(os.getenv('FAKE_MODEL_GEN_TPS', 200))
+    FAKE_MODEL_REPLY_TOKENS = int(os.getenv('FAKE_MODEL_REPLY_TOKENS', 64))
     MODEL_CTX_SIZE = 4096
-    MODEL_BATCH_SIZE = 512
+    # Seconds a chat waits for a loading model before it is told to retry
+    MODEL_LOAD_WAIT = float(os.getenv('MODEL_LOAD_WAIT', 5))
+    
+    # CPU tuning: 0 takes the value from the autotune profile (python setup.py
+    # autotune), else the library default; n_threads_batch is used for prompt evaluation
+    MODEL_THREADS = int(os.getenv('MODEL_THREADS', 0))
+    MODEL_THREADS_BATCH = int(os.getenv('MODEL_THREADS_BATCH', 0))
+    MODEL_BATCH_SIZE = int(os.getenv('MODEL_BATCH_SIZE', 0))
+    MODEL_NUMA = os.getenv('MODEL_NUMA', 'False').lower() in ('true', '1', 't')
+    MODEL_ROPE_FREQ_BASE = float(os.getenv('MODEL_ROPE_FREQ_BASE', 0))
+    MODEL_ROPE_FREQ_SCALE = float(os.getenv('MODEL_ROPE_FREQ_SCALE', 0))
+    MODEL_PROFILE_PATH = os.path.join('cache', 'model_profile.json')
+    
+    # Loaded models are evicted least recently used beyond this many bytes
+    # (0 = 75% of physical memory); mlock pins weights so they are never paged out
+    MODEL_MEMORY_BUDGET = int(os.getenv('MODEL_MEMORY_BUDGET', 0))
+    MODEL_USE_MMAP = os.getenv('MODEL_USE_MMAP', 'True').lower() in ('true', '1', 't')
+    MODEL_USE_MLOCK = os.getenv('MODEL_USE_MLOCK', 'False').lower() in ('true', '1', 't')
+    
+    # Prompt state cache settings (evaluated prefixes reused across turns)
+    PROMPT_CACHE_BYTES = int(os.getenv('PROMPT_CACHE_BYTES', 1 << 30))
+    PROMPT_CACHE_DIR = os.path.join('cache', 'prompt_states')
+    PROMPT_CACHE_PERSIST_ENTRIES = 8
+    
+    # Continuous batching: concurrent generations run as sequences of one
+    # llama.cpp context, decoded together step by step. BATCH_ENGINE_CTX_SIZE
+    # tokens are shared by all sequences (KV cache memory grows with it)
+    BATCH_ENGINE_ENABLED = os.getenv('BATCH_ENGINE_ENABLED', 'False').lower() in ('true', '1', 't')
+    BATCH_ENGINE_SEQUENCES = int(os.getenv('BATCH_ENGINE_SEQUENCES', 8))
+    BATCH_ENGINE_CTX_SIZE = int(os.getenv('BATCH_ENGINE_CTX_SIZE', 16384))
+    
+    # Out-of-process model server: when set, web workers send model work to
+    # the server started with `python -m core.model_server` on this Unix socket
+    MODEL_SERVER_SOCKET = os.getenv('MODEL_SERVER_SOCKET', '')
+    
+    # Speculative decoding: drafted tokens are verified by the main model in one
+    # batch. 'draft' proposes them with MODEL_DRAFT_PATH, a small model sharing
+    # the main model's tokenizer; 'prompt_lookup' copies them from the prompt
+    MODEL_DRAFT_PATH = os.getenv('MODEL_DRAFT_PATH', '')
+    SPECULATIVE_NUM_PRED_TOKENS = int(os.getenv('SPECULATIVE_NUM_PRED_TOKENS', 10))
+    SPECULATIVE_MAX_NGRAM = int(os.getenv('SPECULATIVE_MAX_NGRAM', 2))
     
-    # Mode settings
+    # Mode settings ('model' names a file in MODELS_DIR; None uses MODEL_PATH).
+    # A mode may also set n_threads, n_threads_batch and n_batch, 'cache'
+    # (True/False) and 'cache_ttl' to override the completion cache defaults,
+    # and 'speculative' ('draft', 'prompt_lookup' or None) with 'draft_tokens'
     MODES = {
-        'normal': {'temperature': 0.7, 'top_p': 0.9, 'max_tokens': 512},
-        'code': {'temperature': 0.2, 'top_p': 0.95, 'max_tokens': 1024},
-        'creative': {'temperature': 0.9, 'top_p': 1.0, 'max_tokens': 750}
+        'normal': {'temperature': 0.7, 'top_p': 0.9, 'max_tokens': 512,
+                   'model': os.getenv('NORMAL_MODEL')},
+        'code': {'temperature': 0.2, 'top_p': 0.95, 'max_tokens': 1024,
+                 'model': os.getenv('CODE_MODEL'),
+                 'speculative': os.getenv('CODE_SPECULATIVE') or None},
+        'creative': {'temperature': 0.9, 'top_p': 1.0, 'max_tokens': 750,
+                     'model': os.getenv('CREATIVE_MODEL')},
+        'research': {'temperature': 0.3, 'top_p': 0.9, 'max_tokens': 768,
+                     'model': os.getenv('RESEARCH_MODEL')}
     }
     
+    # Completion cache: answers in modes at or below the temperature limit are
+    # replayed for repeated prompts instead of being generated again
+    COMPLETION_CACHE_ENABLED = os.getenv('COMPLETION_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+    COMPLETION_CACHE_PATH = os.path.join('cache', 'completion_cache.sqlite')
+    COMPLETION_CACHE_TTL = 86400
+    COMPLETION_CACHE_MAX_TEMPERATURE = 0.2
+    COMPLETION_CACHE_MEMORY_ENTRIES = 128
+    COMPLETION_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    
+    # Conversation settings
+    SYSTEM_PROMPT = os.getenv('SYSTEM_PROMPT', 'You are a helpful AI assistant running locally on the user\'s machine.')
+    CONVERSATION_MAX_SESSIONS = 256
+    CONTEXT_SUMMARY_TOKENS = 256
+    CONTEXT_TRIM_RATIO = 0.75
+    
+    # Inference scheduler settings
+    SCHEDULER_MAX_QUEUE = int(os.getenv('SCHEDULER_MAX_QUEUE', 32))
+    SCHEDULER_MAX_PER_CLIENT = int(os.getenv('SCHEDULER_MAX_PER_CLIENT', 4))
+    # Jobs run at the same time; 0 runs one, LLAMA_SERVER_SLOTS with llama_server,
+    # or BATCH_ENGINE_SEQUENCES with the batch engine
+    SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', 0))
+    
+    # Agent pool: instances announce their load to AGENT_PEERS (comma-separated
+    # base URLs) and forward chats to the least loaded one serving the mode.
+    # The pool is off unless AGENT_PEERS and AGENT_POOL_TOKEN, a secret shared
+    # by every instance, are set. Peers are only accepted at AGENT_PEERS or
+    # AGENT_ALLOWED_URLS. AGENT_URL is where peers reach this instance;
+    # AGENT_MODES limits the modes it serves to peers (empty serves all)
+    AGENT_PEERS = [url.strip() for url in os.getenv('AGENT_PEERS', '').split(',') if url.strip()]
+    AGENT_POOL_TOKEN = os.getenv('AGENT_POOL_TOKEN', '')
+    AGENT_ALLOWED_URLS = [url.strip() for url in os.getenv('AGENT_ALLOWED_URLS', '').split(',')
+                          if url.strip()]
+    AGENT_URL = os.getenv('AGENT_URL', '')
+    AGENT_MODES = [mode.strip() for mode in os.getenv('AGENT_MODES', '').split(',') if mode.strip()]
+    AGENT_ANNOUNCE_INTERVAL = float(os.getenv('AGENT_ANNOUNCE_INTERVAL', 5))
+    AGENT_PEER_TTL = float(os.getenv('AGENT_PEER_TTL', 15))
+    AGENT_FORWARD_TIMEOUT = 300.0
+    
     # Knowledge base settings
     DB_PATH = 'knowledge.sqlite'
+    DB_POOL_SIZE = 8
+    DB_POOL_TIMEOUT = 30.0
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_MMAP_SIZE = 256 * 1024 * 1024
+    DB_CACHE_SIZE_KB = 64 * 1024
+    KNOWLEDGE_PAGE_SIZE = 50
+    KNOWLEDGE_MAX_PAGE_SIZE = 500
+    KNOWLEDGE_BULK_BATCH_SIZE = 500
+    KNOWLEDGE_BULK_MAX_BATCH_SIZE = 10000
+    
+    # Web search cache settings
+    SEARCH_CACHE_PATH = os.path.join('cache', 'search_cache.sqlite')
+    SEARCH_CACHE_TTL = 3600
+    WEBPAGE_CACHE_TTL = 86400
+    SEARCH_CACHE_MEMORY_ENTRIES = 256
+    SEARCH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    
+    # Web fetch settings
+    FETCH_TIMEOUT = float(os.getenv('FETCH_TIMEOUT', 10))
+    FETCH_DEADLINE = float(os.getenv('FETCH_DEADLINE', 15))
+    FETCH_POOL_SIZE = 20
+    FETCH_PER_HOST_LIMIT = 4
+    FETCH_MAX_WORKERS = 8
+    FETCH_MAX_BYTES = 2 * 1024 * 1024
+    WEBPAGE_MAX_CHARS = 3000
+    
+    # Research mode settings (web sources are cited in the answer)
+    RESEARCH_MAX_PAGES = 3
+    RESEARCH_FETCH_DEADLINE = 8
+    RESEARCH_PASSAGE_CHARS = 500
+    RESEARCH_MAX_TOKENS = 1500
+    
+    # Knowledge retrieval settings (a small embedding model keeps queries fast)
+    EMBEDDING_MODEL_PATH = os.getenv('EMBEDDING_MODEL_PATH', os.path.join('static', 'models', 'nomic-embed-text-v1.5.Q8_0.gguf'))
+    EMBEDDING_CTX_SIZE = 512
+    KNOWLEDGE_INDEX_DIR = os.path.join('cache', 'knowledge_index')
+    KNOWLEDGE_CHUNK_SIZE = 1000
+    KNOWLEDGE_CHUNK_OVERLAP = 150
+    RAG_ENABLED = True
+    RAG_TOP_K = 3
+    RAG_MIN_SCORE = 0.35
+    RAG_MAX_TOKENS = 600
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -39,6 +187,7 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     DB_PATH = 'test_knowledge.sqlite'
+    KNOWLEDGE_INDEX_DIR = os.path.join('cache', 'test_knowledge_index')
 
 class ProductionConfig(Config):
     """Production configuration."""
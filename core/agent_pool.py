@@ -0,0 +1,519 @@
+"""
+Pool of assistant instances.
+This module keeps a registry of peer instances, which announce their queue
+depth, loaded model and generation speed to each other, and routes each
+chat to the least loaded instance able to serve its mode, keeping a
+session on the instance that holds its history.
+"""
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+import requests
+from requests.adapters import HTTPAdapter
+from utils.tracing import current_trace_id
+
+# Header marking a chat forwarded by a peer; such chats are never forwarded again
+FORWARDED_HEADER = 'X-Agent-Forwarded'
+
+# Header carrying the pool's shared secret on every request between peers
+TOKEN_HEADER = 'X-Agent-Token'
+
+# Weight of the newest completion in the tokens per second average
+_RATE_SMOOTHING = 0.2
+
+# Chats just routed to an instance count as queued there for this long, until
+# they show in its scheduler stats, so a burst arriving at once is spread out
+_ROUTED_SECONDS = 1.0
+
+
+class PeerError(Exception):
+    """Raised when a peer cannot be reached or does not accept a chat."""
+
+
+class PeerRejected(ValueError):
+    """Raised when an announcement comes from a URL the pool does not allow."""
+
+
+class Peer:
+    """Last announced state of an assistant instance."""
+
+    def __init__(self, agent_id, url, name=None, modes=(), model=None, ready=False,
+                 queue_depth=0, running=0, workers=1, tokens_per_second=0.0):
+        """
+        Initialize the peer.
+
+        Args:
+            agent_id (str): The instance's AGENT_ID
+            url (str): Base URL the instance serves its API on
+            name (str): The instance's AGENT_NAME
+            modes (list): Modes the instance serves to peers
+            model (str): The instance's loaded model
+            ready (bool): Whether its model is loaded
+            queue_depth (int): Jobs waiting in its scheduler
+            running (int): Jobs its scheduler is running
+            workers (int): Jobs its scheduler runs at the same time
+            tokens_per_second (float): Its recent generation speed
+        """
+        self.agent_id = agent_id
+        self.url = url.rstrip('/')
+        self.name = name
+        self.modes = list(modes)
+        self.model = model
+        self.ready = ready
+        self.queue_depth = queue_depth
+        self.running = running
+        self.workers = max(workers, 1)
+        self.tokens_per_second = tokens_per_second
+        self.last_seen = time.monotonic()
+        self.forwarded = 0
+        self.inflight = 0
+        self.routed = deque()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a peer from an announcement.
+
+        Args:
+            data (dict): The announced state
+
+        Returns:
+            Peer: The peer
+
+        Raises:
+            ValueError: If the announcement lacks an agent_id or url
+        """
+        if not data.get('agent_id') or not data.get('url'):
+            raise ValueError("Announcements need an agent_id and a url")
+        return cls(
+            str(data['agent_id']),
+            str(data['url']),
+            name=data.get('name'),
+            modes=data.get('modes') or [],
+            model=data.get('model'),
+            ready=bool(data.get('ready')),
+            queue_depth=int(data.get('queue_depth') or 0),
+            running=int(data.get('running') or 0),
+            workers=int(data.get('workers') or 1),
+            tokens_per_second=float(data.get('tokens_per_second') or 0.0)
+        )
+
+    @property
+    def load(self):
+        """float: Queued, running and just routed jobs per worker."""
+        now = time.monotonic()
+        routed = sum(1 for routed_at in list(self.routed) if now - routed_at <= _ROUTED_SECONDS)
+        # Announced counts lag behind the chats this instance is relaying to the peer
+        pending = max(self.queue_depth + self.running, self.inflight)
+        return (pending + routed) / self.workers
+
+    def add_route(self):
+        """Count a chat just routed to the instance until its stats include it."""
+        now = time.monotonic()
+        while self.routed and now - self.routed[0] > _ROUTED_SECONDS:
+            self.routed.popleft()
+        self.routed.append(now)
+
+    def update(self, other):
+        """Take the announced state of a newer record of the same instance."""
+        for name in ('url', 'name', 'modes', 'model', 'ready', 'queue_depth', 'running',
+                     'workers', 'tokens_per_second', 'last_seen'):
+            setattr(self, name, getattr(other, name))
+
+    def serves(self, mode):
+        """Check whether the peer can answer a chat in a mode."""
+        return self.ready and mode in self.modes
+
+    def to_dict(self):
+        """
+        Describe the peer for announcements and API responses.
+
+        Returns:
+            dict: The announced state with its load
+        """
+        return {
+            'agent_id': self.agent_id,
+            'url': self.url,
+            'name': self.name,
+            'modes': self.modes,
+            'model': self.model,
+            'ready': self.ready,
+            'queue_depth': self.queue_depth,
+            'running': self.running,
+            'workers': self.workers,
+            'tokens_per_second': round(self.tokens_per_second, 1),
+            'load': round(self.load, 3)
+        }
+
+
+class AgentPool:
+    """Peers announced to this instance, and the routing of chats between them."""
+
+    def __init__(self, agent_id, url, describe, token, seeds=(), allowed_urls=(),
+                 announce_interval=5.0, peer_ttl=15.0, timeout=300.0, max_sessions=256,
+                 logger=None):
+        """
+        Initialize the pool. Call start() to begin announcing.
+
+        Args:
+            agent_id (str): This instance's AGENT_ID
+            url (str): Base URL peers reach this instance on
+            describe (callable): Returns this instance's name, modes, model,
+                ready, queue_depth, running and workers
+            token (str): Secret shared by every instance of the pool
+            seeds (list): Base URLs of peers to announce to
+            allowed_urls (list): Further base URLs peers may announce themselves at
+            announce_interval (float): Seconds between announcements
+            peer_ttl (float): Seconds after which a silent peer is not routed to
+            timeout (float): Seconds to wait for each read from a peer
+            max_sessions (int): Session routes remembered, least recent dropped first
+            logger (Logger): Where pool changes are reported
+        """
+        self.agent_id = agent_id
+        self.url = url.rstrip('/')
+        self.describe = describe
+        if not token:
+            raise ValueError("The agent pool needs a shared token")
+        self.token = token
+        self.seeds = [seed.rstrip('/') for seed in seeds]
+        self.allowed_urls = set(self.seeds) | {url.rstrip('/') for url in allowed_urls}
+        self.announce_interval = announce_interval
+        self.peer_ttl = peer_ttl
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.logger = logger
+
+        self.peers = {}
+        self._discovered = set()
+        self._sessions = OrderedDict()
+        self._local_routes = deque()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.tokens_per_second = 0.0
+        self.fallbacks = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def authorized(self, headers):
+        """
+        Check that a request comes from an instance of the pool.
+
+        Args:
+            headers (Headers): The request's headers
+
+        Returns:
+            bool: Whether the request carries the pool's token
+        """
+        return hmac.compare_digest(headers.get(TOKEN_HEADER, '').encode('utf-8'),
+                                   self.token.encode('utf-8'))
+
+    def allowed(self, url):
+        """
+        Check that peers may be reached at a URL.
+
+        Args:
+            url (str): A peer's base URL
+
+        Returns:
+            bool: Whether the URL is a seed or allowed
+        """
+        return isinstance(url, str) and url.rstrip('/') in self.allowed_urls
+
+    def _headers(self):
+        return {FORWARDED_HEADER: self.agent_id, TOKEN_HEADER: self.token}
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def local(self):
+        """
+        Get this instance's current state.
+
+        Returns:
+            Peer: This instance, as peers see it
+        """
+        peer = Peer(self.agent_id, self.url, tokens_per_second=self.tokens_per_second,
+                    **self.describe())
+        peer.routed = self._local_routes
+        return peer
+
+    def record(self, tokens, seconds):
+        """
+        Update this instance's generation speed with a finished completion.
+
+        Args:
+            tokens (int): Tokens generated
+            seconds (float): Time spent generating them
+        """
+        if tokens and seconds > 0:
+            rate = tokens / seconds
+            self.tokens_per_second = rate if not self.tokens_per_second else (
+                _RATE_SMOOTHING * rate + (1 - _RATE_SMOOTHING) * self.tokens_per_second)
+
+    def start(self):
+        """
+        Announce this instance to its peers on a background thread.
+
+        Returns:
+            threading.Thread: The announcer thread
+        """
+        thread = threading.Thread(target=self._announce_loop, name='agent-pool', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Stop announcing."""
+        self._stopped.set()
+
+    def _announce_loop(self):
+        while not self._stopped.is_set():
+            self.announce()
+            self._stopped.wait(self.announce_interval)
+
+    def announce(self):
+        """
+        Send this instance's state to every seed and known peer.
+
+        Peers answer with their own state and the peers they know, so a
+        new instance only needs one seed to find the rest of the allowed
+        URLs that are running. Peers reported at other URLs are ignored.
+
+        Returns:
+            int: Number of peers that answered
+        """
+        state = self.local().to_dict()
+        with self._lock:
+            targets = set(self.seeds) | self._discovered | {peer.url for peer in self.peers.values()}
+        targets.discard(self.url)
+
+        answered = 0
+        for url in sorted(targets):
+            try:
+                response = self.session.post(url + '/api/agents/announce', json=state,
+                                             headers=self._headers(),
+                                             timeout=(2.0, self.announce_interval))
+                response.raise_for_status()
+                reply = response.json()
+                self.receive(reply['agent'])
+            except (requests.RequestException, ValueError, KeyError) as e:
+                self._log('debug', f"Announcement to {url} failed: {e}")
+                continue
+            answered += 1
+            with self._lock:
+                for peer in reply.get('peers', []):
+                    if peer.get('agent_id') != self.agent_id and self.allowed(peer.get('url')):
+                        self._discovered.add(peer['url'].rstrip('/'))
+        return answered
+
+    def receive(self, data):
+        """
+        Record a peer's announcement.
+
+        Args:
+            data (dict): The announced state
+
+        Returns:
+            dict: This instance's state and the live peers it knows, as the reply
+
+        Raises:
+            ValueError: If the announcement is malformed
+            PeerRejected: If the peer's URL is not a seed or allowed
+        """
+        peer = Peer.from_dict(data)
+        if not self.allowed(peer.url):
+            raise PeerRejected(f"Peer URL {peer.url} is not allowed")
+        if peer.agent_id != self.agent_id:
+            with self._lock:
+                # Counters of chats relayed to the peer live on its first record
+                previous = self.peers.get(peer.agent_id)
+                alive = previous is not None and self._alive(previous)
+                if previous is None:
+                    self.peers[peer.agent_id] = peer
+                else:
+                    previous.update(peer)
+                self._discovered.discard(peer.url)
+            if not alive:
+                self._log('info', f"Peer {peer.name or peer.agent_id} joined at {peer.url}")
+        return {'agent': self.local().to_dict(),
+                'peers': [{'agent_id': p.agent_id, 'url': p.url} for p in self.live_peers()]}
+
+    def _alive(self, peer):
+        return time.monotonic() - peer.last_seen <= self.peer_ttl
+
+    def live_peers(self):
+        """
+        Get the peers heard from within the TTL.
+
+        Returns:
+            list: Live peers
+        """
+        with self._lock:
+            return [peer for peer in self.peers.values() if self._alive(peer)]
+
+    def mark_down(self, peer):
+        """
+        Stop routing to a peer until it announces itself again.
+
+        Args:
+            peer (Peer): The unreachable peer
+        """
+        with self._lock:
+            peer.last_seen = float('-inf')
+            self.fallbacks += 1
+
+    def route(self, mode, session_id=None):
+        """
+        Choose the instance to answer a chat.
+
+        A session stays where it was first routed while that instance is
+        alive and serves the mode, since the history lives there. Otherwise
+        the instance with the fewest queued and running jobs per worker
+        wins; ties stay local, then go to the faster instance.
+
+        Args:
+            mode (str): The chat's mode
+            session_id (str): The chat's session, if it has history
+
+        Returns:
+            Peer or None: The peer to forward to, or None to answer locally
+        """
+        local = self.local()
+        with self._lock:
+            pinned = self._sessions.get(session_id) if session_id else None
+            if pinned is not None:
+                self._sessions.move_to_end(session_id)
+                if pinned == self.agent_id:
+                    return None
+                peer = self.peers.get(pinned)
+                if peer is not None and self._alive(peer) and peer.serves(mode):
+                    peer.forwarded += 1
+                    return peer
+
+            candidates = [peer for peer in self.peers.values()
+                          if self._alive(peer) and peer.serves(mode)]
+            if local.serves(mode) or not candidates:
+                candidates.append(local)
+            best = min(candidates, key=lambda peer: (peer.load, peer is not local,
+                                                     -peer.tokens_per_second))
+
+            if session_id:
+                self._sessions[session_id] = best.agent_id
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            best.add_route()
+            if best is local:
+                return None
+            best.forwarded += 1
+            return best
+
+    def pin(self, session_id, agent_id):
+        """
+        Route a session's next chats to an instance.
+
+        Args:
+            session_id (str): The session
+            agent_id (str): The instance, this one or a peer
+        """
+        with self._lock:
+            self._sessions[session_id] = agent_id
+            self._sessions.move_to_end(session_id)
+
+    def forget(self, session_id):
+        """
+        Drop a session's route, clearing its history on the peer that served it.
+
+        Args:
+            session_id (str): The session
+        """
+        with self._lock:
+            agent_id = self._sessions.pop(session_id, None)
+            peer = self.peers.get(agent_id)
+        if peer is None:
+            return
+        try:
+            self.session.post(peer.url + '/api/chat/clear', json={'session_id': session_id},
+                              headers=self._headers(), timeout=(2.0, 10.0))
+        except requests.RequestException as e:
+            self._log('warning', f"Could not clear session on peer {peer.agent_id}: {e}")
+
+    def forward(self, peer, message, mode, session_id=None):
+        """
+        Send a chat to a peer and stream its answer.
+
+        The request is made before returning, so an unreachable or busy peer
+        raises here and the chat can still be answered locally.
+
+        Args:
+            peer (Peer): The peer chosen by route()
+            message (str): The user's message
+            mode (str): The operating mode
+            session_id (str): The chat's session
+
+        Returns:
+            iterator: Chunks of the peer's response
+
+        Raises:
+            PeerError: If the peer does not accept the chat
+        """
+        headers = self._headers()
+        trace_id = current_trace_id()
+        if trace_id:
+            headers['X-Trace-Id'] = trace_id
+        try:
+            response = self.session.post(
+                peer.url + '/api/chat',
+                json={'message': message, 'mode': mode, 'session_id': session_id, 'stream': True},
+                headers=headers, stream=True, timeout=(2.0, self.timeout))
+        except requests.RequestException as e:
+            raise PeerError(f"Peer {peer.agent_id} unreachable: {e}")
+        if response.status_code != 200:
+            response.close()
+            raise PeerError(f"Peer {peer.agent_id} answered HTTP {response.status_code}")
+        return self._relay(peer, response)
+
+    def _relay(self, peer, response):
+        """Yield the chunks of a peer's NDJSON answer."""
+        with self._lock:
+            peer.inflight += 1
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if 'error' in event:
+                    raise PeerError(f"Peer {peer.agent_id} failed: {event['error']}")
+                if event.get('done'):
+                    return
+                yield event['chunk']
+            raise PeerError(f"Peer {peer.agent_id} ended the answer early")
+        except (requests.RequestException, ValueError) as e:
+            raise PeerError(f"Peer {peer.agent_id} connection failed: {e}")
+        finally:
+            # Closing the connection makes the peer cancel the generation
+            response.close()
+            with self._lock:
+                peer.inflight -= 1
+
+    def stats(self):
+        """
+        Get this instance's state and its peers.
+
+        Returns:
+            dict: This instance, live and silent peers, and routing counters
+        """
+        with self._lock:
+            peers = [dict(peer.to_dict(), alive=self._alive(peer), forwarded=peer.forwarded,
+                          inflight=peer.inflight,
+                          last_seen_s=round(time.monotonic() - peer.last_seen, 1)
+                          if peer.last_seen != float('-inf') else None)
+                     for peer in self.peers.values()]
+            sessions = len(self._sessions)
+        return {'self': self.local().to_dict(), 'peers': peers, 'sessions': sessions,
+                'fallbacks': self.fallbacks}
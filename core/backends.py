@@ -0,0 +1,407 @@
+"""
+Inference backends.
+This module defines the interface ModelManager generates through and its
+implementations: llama-cpp-python in this process, a local llama.cpp
+server generating in parallel slots over pooled HTTP connections, and the
+deterministic fake model for benchmarks and load tests.
+"""
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+import requests
+from requests.adapters import HTTPAdapter
+from core.tuning import resolve_settings
+from utils.concurrency import iterate_blocking, run_blocking
+
+
+# Shown to users when a response fails for a reason they cannot act on
+GENERATION_FAILED = "Sorry, I encountered an error generating a response."
+
+
+class BackendError(RuntimeError):
+    """Raised when a backend cannot load or serve its model."""
+
+
+class GenerationError(RuntimeError):
+    """Raised when no response can be generated; the message is shown to the user."""
+
+    def __init__(self, message=GENERATION_FAILED):
+        super().__init__(message)
+
+
+def model_unavailable(status):
+    """
+    Get the error for a request the model is not ready to answer.
+
+    Args:
+        status (dict): The model manager's status
+
+    Returns:
+        GenerationError: Asks the user to retry while the model is still loading
+    """
+    if status['state'] == 'loading':
+        return GenerationError("The model is still loading. Please try again shortly.")
+    return GenerationError("Model not loaded. Please check logs for details.")
+
+
+class InferenceBackend(ABC):
+    """
+    A loaded model that ModelManager tokenizes and generates with.
+
+    Subclasses implement load, tokenize and complete; one missing any of
+    them cannot be instantiated.
+    """
+
+    # Backends holding the model in this process expose it as .model, for the
+    # batch engine, speculative decoding, thread tuning and prompt state caching
+    in_process = True
+    supports_prompt_cache = False
+    model = None
+
+    # Whether MODEL_PATH must be a readable GGUF file, for loading or metadata
+    needs_model_file = True
+
+    @classmethod
+    @abstractmethod
+    def load(cls, info, config, n_batch, logits_all=False):
+        """
+        Load a model with this backend.
+
+        Args:
+            info (ModelInfo): The model to load
+            config (dict): The application config
+            n_batch (int): Prompt batch size to load with
+            logits_all (bool): Keep the logits of every position (speculative decoding)
+
+        Returns:
+            InferenceBackend: The loaded backend
+        """
+
+    @abstractmethod
+    def tokenize(self, text, add_bos=True):
+        """
+        Split text into the model's tokens.
+
+        Args:
+            text (str): The text
+            add_bos (bool): Prepend the beginning-of-sequence token
+
+        Returns:
+            list: Token ids
+        """
+
+    @abstractmethod
+    def complete(self, prompt, max_tokens, temperature, top_p, stop):
+        """
+        Stream a completion. Closing the iterator stops the generation.
+
+        Args:
+            prompt (str): The prompt
+            max_tokens (int): Maximum tokens to generate
+            temperature (float): Sampling temperature
+            top_p (float): Nucleus sampling threshold
+            stop (list): Strings that end the completion
+
+        Returns:
+            iterator: Text of each generated token
+        """
+
+    def prefill(self, text):
+        """
+        Evaluate a prompt prefix so the next completion starting with it reuses it.
+
+        Args:
+            text (str): The prompt prefix
+
+        Returns:
+            int: Number of tokens evaluated
+        """
+        return 0
+
+    def stats(self):
+        """
+        Get backend statistics.
+
+        Returns:
+            dict: Backend-specific counters
+        """
+        return {}
+
+    def close(self):
+        """Release the backend's resources."""
+
+
+class LlamaCppBackend(InferenceBackend):
+    """llama-cpp-python model loaded in this process."""
+
+    supports_prompt_cache = True
+
+    def __init__(self, model):
+        """
+        Initialize the backend.
+
+        Args:
+            model (Llama): The loaded model
+        """
+        self.model = model
+
+    @classmethod
+    def load(cls, info, config, n_batch, logits_all=False):
+        from llama_cpp import Llama
+
+        settings = resolve_settings(config)
+
+        # Rope overrides are only passed when set; 0 keeps the model's own values
+        rope = {}
+        if config['MODEL_ROPE_FREQ_BASE']:
+            rope['rope_freq_base'] = config['MODEL_ROPE_FREQ_BASE']
+        if config['MODEL_ROPE_FREQ_SCALE']:
+            rope['rope_freq_scale'] = config['MODEL_ROPE_FREQ_SCALE']
+
+        return cls(Llama(
+            model_path=info.path,
+            n_ctx=config['MODEL_CTX_SIZE'],
+            n_batch=n_batch,
+            n_threads=settings['n_threads'],
+            n_threads_batch=settings['n_threads_batch'],
+            use_mmap=config['MODEL_USE_MMAP'],
+            use_mlock=config['MODEL_USE_MLOCK'],
+            numa=config['MODEL_NUMA'],
+            logits_all=logits_all,
+            **rope
+        ))
+
+    def tokenize(self, text, add_bos=True):
+        return self.model.tokenize(text.encode('utf-8'), add_bos=add_bos)
+
+    def complete(self, prompt, max_tokens, temperature, top_p, stop):
+        stream = self.model(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            echo=False,
+            stream=True
+        )
+
+        # Each token step runs off the event loop in eventlet/gevent mode
+        return (chunk['choices'][0]['text'] for chunk in iterate_blocking(stream))
+
+    def prefill(self, text):
+        # Tokenized like create_completion does, so the ids line up
+        model = self.model
+        tokens = self.tokenize(text)
+        matched = 0
+
+        # In llama-cpp-python 0.2.x (0.2.90 is pinned) input_ids holds the ids
+        # of the context's first n_tokens positions, and rewinding is done by
+        # lowering n_tokens, as Llama.generate does itself
+        for evaluated, token in zip(model.input_ids[:model.n_tokens].tolist(), tokens):
+            if evaluated != token:
+                break
+            matched += 1
+        model.n_tokens = matched
+        if matched < len(tokens):
+            run_blocking(model.eval, tokens[matched:])
+        return len(tokens) - matched
+
+
+class FakeBackend(LlamaCppBackend):
+    """Deterministic fake model with fixed token rates, for benchmarks and CI."""
+
+    # The fake model has no state to save and never reads the model file
+    supports_prompt_cache = False
+    needs_model_file = False
+
+    @classmethod
+    def load(cls, info, config, n_batch, logits_all=False):
+        from core.fake_model import FakeLlama
+
+        return cls(FakeLlama(
+            info.path,
+            n_ctx=config['MODEL_CTX_SIZE'],
+            n_batch=n_batch,
+            n_threads=resolve_settings(config)['n_threads'],
+            prompt_tps=config['FAKE_MODEL_PROMPT_TPS'],
+            gen_tps=config['FAKE_MODEL_GEN_TPS'],
+            reply_tokens=config['FAKE_MODEL_REPLY_TOKENS']
+        ))
+
+
+class LlamaServerBackend(InferenceBackend):
+    """
+    Model served by a local llama.cpp server (llama-server).
+
+    The server decodes concurrent requests together in its parallel slots
+    (started with -np N) and reuses each slot's evaluated prompt, so several
+    scheduler workers can generate at once. Closing a completion closes its
+    connection, which makes the server stop generating for it.
+    """
+
+    in_process = False
+
+    def __init__(self, url, slots=4, timeout=300.0, connect_timeout=5.0):
+        """
+        Initialize the backend.
+
+        Args:
+            url (str): Base URL of the server, e.g. http://127.0.0.1:8080
+            slots (int): Parallel slots, and connections kept open to the server
+            timeout (float): Seconds to wait for each read from the server
+            connect_timeout (float): Seconds to wait for a connection
+        """
+        self.url = url.rstrip('/')
+        self.slots = slots
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(slots, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requests = 0
+        self.errors = 0
+        self.problems = []
+
+    @classmethod
+    def load(cls, info, config, n_batch, logits_all=False):
+        backend = cls(
+            config['LLAMA_SERVER_URL'],
+            slots=config['LLAMA_SERVER_SLOTS'],
+            timeout=config['LLAMA_SERVER_TIMEOUT']
+        )
+        backend.wait_until_ready(config['LLAMA_SERVER_TIMEOUT'])
+        backend.check_model(info.name)
+        return backend
+
+    def _post(self, path, payload, stream=False):
+        """Send a JSON request, raising BackendError on failure."""
+        self.requests += 1
+        try:
+            response = self.session.post(self.url + path, json=payload, stream=stream,
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            self.errors += 1
+            raise BackendError(f"llama.cpp server request to {path} failed: {e}")
+
+    def wait_until_ready(self, timeout):
+        """
+        Wait while the server is still loading its model.
+
+        Args:
+            timeout (float): Seconds to wait
+
+        Raises:
+            BackendError: If the server is unreachable or not ready in time
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = self.session.get(self.url + '/health', timeout=self.timeout)
+            except requests.RequestException as e:
+                raise BackendError(f"llama.cpp server unavailable at {self.url}: {e}")
+
+            # The server answers 503 until its model is loaded
+            if response.status_code == 200:
+                return
+            if response.status_code != 503 or time.monotonic() > deadline:
+                raise BackendError(f"llama.cpp server not ready: HTTP {response.status_code}")
+            time.sleep(0.5)
+
+    def check_model(self, name):
+        """
+        Compare the server's model and slot count with the configuration.
+
+        Mismatches are kept in problems for the caller to report.
+
+        Args:
+            name (str): The model file ModelManager expects
+
+        Returns:
+            list: Problems found, empty if the server matches
+        """
+        try:
+            props = self.session.get(self.url + '/props', timeout=self.timeout).json()
+        except (requests.RequestException, ValueError):
+            return self.problems
+
+        # Older servers report fewer properties; missing ones are not checked
+        served = os.path.basename(props.get('default_generation_settings', {}).get('model') or '')
+        if served and served != name:
+            self.problems.append(f"server runs {served}, not {name}")
+        slots = props.get('total_slots')
+        if slots and slots < self.slots:
+            self.problems.append(f"server has {slots} slots, {self.slots} configured")
+        return self.problems
+
+    def tokenize(self, text, add_bos=True):
+        response = self._post('/tokenize', {'content': text, 'add_special': add_bos})
+        return response.json()['tokens']
+
+    def complete(self, prompt, max_tokens, temperature, top_p, stop):
+        payload = {
+            'prompt': prompt,
+            'n_predict': max_tokens,
+            'temperature': temperature,
+            'top_p': top_p,
+            'stop': stop,
+            'stream': True,
+            'cache_prompt': True
+        }
+        return self._stream(self._post('/completion', payload, stream=True))
+
+    def _stream(self, response):
+        """Yield the content of each server-sent event until the server stops."""
+        try:
+            for line in response.iter_lines():
+                if not line.startswith(b'data: '):
+                    continue
+                event = json.loads(line[len(b'data: '):])
+                if event.get('content'):
+                    yield event['content']
+                if event.get('stop'):
+                    return
+        finally:
+            # Dropping the connection cancels the slot's generation
+            response.close()
+
+    def prefill(self, text):
+        response = self._post('/completion', {'prompt': text, 'n_predict': 0,
+                                              'cache_prompt': True})
+        return response.json().get('tokens_evaluated', 0)
+
+    def stats(self):
+        return {'url': self.url, 'slots': self.slots, 'requests': self.requests,
+                'errors': self.errors, 'problems': self.problems}
+
+    def close(self):
+        self.session.close()
+
+
+# Backends selectable with MODEL_BACKEND
+BACKENDS = {
+    'llama_cpp': LlamaCppBackend,
+    'llama_server': LlamaServerBackend,
+    'fake': FakeBackend
+}
+
+
+def backend_class(name):
+    """
+    Get the backend selected by MODEL_BACKEND.
+
+    Args:
+        name (str): The backend name
+
+    Returns:
+        type: The InferenceBackend subclass
+
+    Raises:
+        ValueError: If no backend has that name
+    """
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown MODEL_BACKEND {name!r}, expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,476 @@
+"""
+Continuous batching engine for concurrent generations.
+This module decodes several prompts as separate sequences of one llama.cpp
+context. Each step evaluates the next token of every running sequence
+together with chunks of waiting prompts, admits new requests between steps
+and retires finished ones, so concurrent users share each pass over the
+model weights instead of queueing for them.
+"""
+import codecs
+import queue
+import threading
+import time
+import numpy as np
+from utils.concurrency import run_blocking
+
+# Marker put on a request's output queue once it has finished
+_DONE = object()
+
+# Candidates kept before top-p, as llama-cpp-python's default top_k
+TOP_K = 40
+
+
+class LlamaBatchBackend:
+    """A llama.cpp context of its own on a loaded model's weights, holding many sequences."""
+
+    def __init__(self, model, n_ctx, n_batch, n_threads, n_threads_batch, max_sequences):
+        """
+        Create the context.
+
+        Args:
+            model (Llama): Loaded model whose weights and tokenizer are shared
+            n_ctx (int): Tokens held across all sequences
+            n_batch (int): Maximum tokens evaluated per step
+            n_threads (int): Threads for steps of single tokens
+            n_threads_batch (int): Threads for steps with prompt chunks
+            max_sequences (int): Sequences held at the same time
+        """
+        import llama_cpp
+        from llama_cpp._internals import _LlamaBatch, _LlamaContext
+
+        self.model = model
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx
+        params.n_batch = n_batch
+        params.n_ubatch = n_batch
+        params.n_seq_max = max_sequences
+        params.n_threads = n_threads
+        params.n_threads_batch = n_threads_batch
+        self._ctx = _LlamaContext(model=model._model, params=params, verbose=False)
+        self._batch = _LlamaBatch(n_tokens=n_batch, embd=0, n_seq_max=1, verbose=False)
+        self.n_vocab = model.n_vocab()
+
+    def tokenize(self, text):
+        """Tokenize a prompt like create_completion does."""
+        return self.model.tokenize(text)
+
+    def detokenize(self, tokens):
+        """Turn tokens into UTF-8 bytes."""
+        return self.model.detokenize(tokens)
+
+    def token_eos(self):
+        """Get the end-of-sequence token."""
+        return self.model.token_eos()
+
+    def decode(self, entries):
+        """
+        Evaluate one step.
+
+        Args:
+            entries (list): (seq_id, tokens, start position, wants logits) tuples
+
+        Returns:
+            list: Logits of the last token of each entry that wants them
+        """
+        batch = self._batch.batch
+        n = 0
+        outputs = []
+        for seq_id, tokens, position, wants_logits in entries:
+            for i, token in enumerate(tokens):
+                batch.token[n] = token
+                batch.pos[n] = position + i
+                batch.n_seq_id[n] = 1
+                batch.seq_id[n][0] = seq_id
+                batch.logits[n] = False
+                n += 1
+            if wants_logits:
+                batch.logits[n - 1] = True
+                outputs.append(n - 1)
+        batch.n_tokens = n
+        self._ctx.decode(self._batch)
+        return [np.ctypeslib.as_array(self._ctx.get_logits_ith(i), shape=(self.n_vocab,)).copy()
+                for i in outputs]
+
+    def remove(self, seq_id):
+        """Drop a sequence's tokens from the KV cache."""
+        self._ctx.kv_cache_seq_rm(seq_id, -1, -1)
+
+    def close(self):
+        """Free the context."""
+        self._batch.close()
+        self._ctx.close()
+
+
+class BatchRequest:
+    """A generation running in the batch engine."""
+
+    def __init__(self, tokens, max_tokens, temperature, top_p, stop, seed=None):
+        """
+        Initialize the request.
+
+        Args:
+            tokens (list): Prompt tokens
+            max_tokens (int): Maximum tokens to generate
+            temperature (float): Sampling temperature; 0 decodes greedily
+            top_p (float): Nucleus sampling threshold
+            stop (list): Strings that end the completion
+            seed (int): Sampling seed, random if None
+        """
+        self.tokens = tokens
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.stop = stop or []
+        self.rng = np.random.default_rng(seed)
+        self.seq_id = None
+        self.n_past = 0
+        self.generated = 0
+        self.last_token = None
+        self.finish_reason = None
+        self.submitted_at = time.monotonic()
+        self.first_token_at = None
+        self.finished_at = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._held = ''
+        self._cancelled = threading.Event()
+        self._output = queue.Queue()
+
+    @property
+    def reserved(self):
+        """int: Context cells the request may use, reserved on admission."""
+        return len(self.tokens) + self.max_tokens
+
+    @property
+    def prefilling(self):
+        """bool: Whether prompt tokens are still being evaluated."""
+        return self.n_past < len(self.tokens)
+
+    @property
+    def cancelled(self):
+        """bool: Whether the caller stopped reading."""
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop the request; the engine retires it before the next step."""
+        self._cancelled.set()
+
+    def stream(self):
+        """
+        Iterate over the generated text.
+
+        Yields:
+            str: Text of each generated token, empty while a stop string may be forming
+
+        Raises:
+            Exception: The error that failed the request
+        """
+        try:
+            while True:
+                item = self._output.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Closing the stream early frees the sequence for other requests
+            self.cancel()
+
+    def _accept(self, token, piece, eos):
+        """Record a sampled token and emit its text. Returns True when finished."""
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        if token == eos:
+            return self._finish('stop')
+
+        self.generated += 1
+        self.last_token = token
+        self._held += self._decoder.decode(piece)
+
+        # Text is held back while it could be the start of a stop string
+        for stop in self.stop:
+            index = self._held.find(stop)
+            if index >= 0:
+                self._output.put(self._held[:index])
+                self._held = ''
+                return self._finish('stop')
+        hold = max((length for stop in self.stop for length in range(len(stop), 0, -1)
+                    if self._held.endswith(stop[:length])), default=0)
+        self._output.put(self._held[:len(self._held) - hold])
+        self._held = self._held[len(self._held) - hold:]
+
+        if self.generated >= self.max_tokens:
+            return self._finish('length')
+        return False
+
+    def _finish(self, reason, error=None):
+        """Flush held text and close the output."""
+        self.finish_reason = reason
+        self.finished_at = time.monotonic()
+        if error is not None:
+            self._output.put(error)
+        elif self._held:
+            self._output.put(self._held)
+            self._held = ''
+        self._output.put(_DONE)
+        return True
+
+
+class BatchEngine:
+    """Runs requests as sequences of one context, decoded together step by step."""
+
+    def __init__(self, backend, max_sequences=8, n_ctx=16384, n_batch=512, logger=None,
+                 on_step=None):
+        """
+        Initialize the engine and start its decoding thread.
+
+        Args:
+            backend (LlamaBatchBackend): Context the sequences live in
+            max_sequences (int): Sequences decoded at the same time
+            n_ctx (int): Tokens held across all sequences
+            n_batch (int): Maximum tokens evaluated per step
+            logger (Logger): Where errors are reported
+            on_step (callable): Called with the number of running sequences after each step
+        """
+        self.backend = backend
+        self.max_sequences = max_sequences
+        self.n_ctx = n_ctx
+        self.n_batch = n_batch
+        self.logger = logger
+        self.on_step = on_step
+
+        self._waiting = []
+        self._active = []
+        self._free_ids = list(range(max_sequences))
+        self._reserved = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._eos = backend.token_eos()
+
+        # Counters
+        self._steps = 0
+        self._tokens_generated = 0
+        self._prompt_tokens = 0
+        self._busy_time = 0.0
+        self._completed = 0
+
+        self._thread = threading.Thread(target=self._run, name='batch-engine', daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, max_tokens=256, temperature=0.8, top_p=0.95, stop=None, seed=None):
+        """
+        Queue a completion.
+
+        Args:
+            prompt (str): The prompt
+            max_tokens (int): Maximum tokens to generate
+            temperature (float): Sampling temperature; 0 decodes greedily
+            top_p (float): Nucleus sampling threshold
+            stop (list): Strings that end the completion
+            seed (int): Sampling seed, random if None
+
+        Returns:
+            BatchRequest: The request; iterate request.stream() for its text
+
+        Raises:
+            ValueError: If the prompt does not fit in the context
+        """
+        tokens = self.backend.tokenize(prompt.encode('utf-8'))
+        if len(tokens) >= self.n_ctx:
+            raise ValueError(f"Prompt of {len(tokens)} tokens exceeds the batch context "
+                             f"of {self.n_ctx}")
+        max_tokens = min(max_tokens, self.n_ctx - len(tokens))
+        request = BatchRequest(tokens, max_tokens, temperature, top_p, stop, seed)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Batch engine is closed")
+            self._waiting.append(request)
+            self._cond.notify()
+        return request
+
+    def generate(self, prompt, **kwargs):
+        """
+        Stream a completion's text.
+
+        Args:
+            prompt (str): The prompt
+            **kwargs: Sampling arguments of submit()
+
+        Yields:
+            str: Text of each generated token
+        """
+        yield from self.submit(prompt, **kwargs).stream()
+
+    def close(self):
+        """Stop the decoding thread, fail unfinished requests and free the context."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self.backend.close()
+
+    def stats(self):
+        """
+        Get engine counters.
+
+        Returns:
+            dict: Running and waiting sequences, steps, tokens and throughput
+        """
+        with self._cond:
+            return {
+                'active': len(self._active),
+                'waiting': len(self._waiting),
+                'max_sequences': self.max_sequences,
+                'reserved_tokens': self._reserved,
+                'n_ctx': self.n_ctx,
+                'steps': self._steps,
+                'completed': self._completed,
+                'prompt_tokens': self._prompt_tokens,
+                'tokens_generated': self._tokens_generated,
+                'tokens_per_step': (round(self._tokens_generated / self._steps, 2)
+                                    if self._steps else 0.0),
+                'generation_tps': (round(self._tokens_generated / self._busy_time, 2)
+                                   if self._busy_time else 0.0)
+            }
+
+    def _admit(self):
+        """Move waiting requests into free sequences, in arrival order. Caller holds the lock."""
+        while self._waiting and self._free_ids:
+            request = self._waiting[0]
+            if request.cancelled:
+                self._waiting.pop(0)
+                request._finish('cancelled')
+                continue
+            if self._reserved + request.reserved > self.n_ctx:
+                break
+            self._waiting.pop(0)
+            request.seq_id = self._free_ids.pop(0)
+            self._reserved += request.reserved
+            self._active.append(request)
+
+    def _retire(self, request):
+        """Free a finished sequence. Caller holds the lock."""
+        self._active.remove(request)
+        self.backend.remove(request.seq_id)
+        self._free_ids.append(request.seq_id)
+        self._reserved -= request.reserved
+        self._completed += 1
+
+    def _plan(self):
+        """
+        Choose the tokens of the next step. Caller holds the lock.
+
+        Running sequences each contribute their last token first, so answers
+        keep streaming while long prompts are evaluated in chunks in the
+        remaining room.
+        """
+        plan = []
+        room = self.n_batch
+        for request in self._active:
+            if not request.prefilling:
+                plan.append((request, [request.last_token]))
+                room -= 1
+        for request in self._active:
+            if request.prefilling and room > 0:
+                chunk = request.tokens[request.n_past:request.n_past + room]
+                plan.append((request, chunk))
+                room -= len(chunk)
+        return plan
+
+    def _run(self):
+        """Decoding loop: admit, step, sample and retire until closed."""
+        while True:
+            with self._cond:
+                for request in [r for r in self._active if r.cancelled]:
+                    request._finish('cancelled')
+                    self._retire(request)
+                self._admit()
+                while not self._active and not self._stopped:
+                    self._cond.wait()
+                    self._admit()
+                if self._stopped:
+                    for request in self._active + self._waiting:
+                        request._finish('cancelled', RuntimeError("Batch engine closed"))
+                    self._active, self._waiting = [], []
+                    return
+                plan = self._plan()
+
+            entries = [(request.seq_id, tokens, request.n_past,
+                        request.n_past + len(tokens) >= len(request.tokens))
+                       for request, tokens in plan]
+            started = time.perf_counter()
+            try:
+                rows = run_blocking(self.backend.decode, entries)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Batch decode failed: {e}")
+                with self._cond:
+                    for request, _ in plan:
+                        request._finish('error', e)
+                        self._retire(request)
+                continue
+
+            # Sample each sequence whose last evaluated token produced logits
+            finished = []
+            rows = iter(rows)
+            generated = prompt = 0
+            for (request, tokens), entry in zip(plan, entries):
+                if request.prefilling:
+                    prompt += len(tokens)
+                request.n_past += len(tokens)
+                if not entry[3]:
+                    continue
+                logits = next(rows)
+                try:
+                    token = sample(logits, request.temperature, request.top_p, request.rng)
+                    generated += 1
+                    piece = self.backend.detokenize([token]) if token != self._eos else b''
+                    if request._accept(token, piece, self._eos):
+                        finished.append(request)
+                except Exception as e:
+                    # One sequence failing ends only that request, not the engine
+                    if self.logger:
+                        self.logger.error(f"Batch sampling failed: {e}")
+                    request._finish('error', e)
+                    finished.append(request)
+
+            with self._cond:
+                for request in finished:
+                    self._retire(request)
+                self._steps += 1
+                self._tokens_generated += generated
+                self._prompt_tokens += prompt
+                self._busy_time += time.perf_counter() - started
+                active = len(self._active)
+            if self.on_step:
+                self.on_step(active)
+
+
+def sample(logits, temperature, top_p, rng):
+    """
+    Sample a token from one sequence's logits.
+
+    Args:
+        logits (np.ndarray): Scores over the vocabulary
+        temperature (float): Sampling temperature; 0 picks the most likely token
+        top_p (float): Keep the most likely tokens up to this probability mass
+        rng (np.random.Generator): Random source of the sequence
+
+    Returns:
+        int: The token
+    """
+    if temperature <= 0:
+        return int(np.argmax(logits))
+
+    # Only the top candidates are sorted, the rest cannot survive top-p anyway
+    k = min(TOP_K, len(logits))
+    candidates = np.argpartition(logits, -k)[-k:]
+    candidates = candidates[np.argsort(logits[candidates])[::-1]]
+    scaled = logits[candidates].astype(np.float64) / temperature
+    probabilities = np.exp(scaled - scaled.max())
+    probabilities /= probabilities.sum()
+    # Rounding can leave the cumulative sum just below top_p=1.0
+    keep = min(int(np.searchsorted(np.cumsum(probabilities), top_p)) + 1, k)
+    probabilities = probabilities[:keep] / probabilities[:keep].sum()
+    return int(candidates[rng.choice(keep, p=probabilities)])
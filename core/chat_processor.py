@@ -2,48 +2,366 @@
 Chat processor for handling user messages.
 This module processes chat messages and prepares prompts for the model.
 """
+import contextvars
+import threading
+import time
 from flask import current_app
+from core.agent_pool import PeerError
+from core.backends import GenerationError, model_unavailable
+from core.conversation import ConversationStore
+from features.knowledgeBase.retrieval import get_retriever
+from features.connectivity.research import gather_passages
+from features.connectivity.search import get_web_search
+from utils.concurrency import run_blocking
+from utils.tracing import span
+
+RESEARCH_INSTRUCTIONS = (
+    "Answer the question using the numbered web sources below. Cite the sources "
+    "you rely on with their number in brackets, like [1]. If the sources do not "
+    "answer the question, say so.\n\n"
+)
 
 class ChatProcessor:
     """Processes chat messages and manages conversation context."""
-    
-    def __init__(self, model_manager):
+
+    def __init__(self, model_manager, agent_pool=None):
         """
         Initialize the chat processor.
-        
+
         Args:
             model_manager (ModelManager): The model manager instance
+            agent_pool (AgentPool): Peers chats may be forwarded to, if any
         """
         self.model_manager = model_manager
-        
-    def process_message(self, message, mode='normal'):
+        self.agent_pool = agent_pool
+        self.conversations = ConversationStore(
+            max_sessions=current_app.config['CONVERSATION_MAX_SESSIONS']
+        )
+        self._preamble_tokens = None
+
+    def process_message(self, message, mode='normal', session_id=None, client_id=None):
         """
         Process a user message and generate a response.
-        
+
         Args:
             message (str): The user's message
             mode (str): The operating mode
-            
+            session_id (str): Conversation to continue, or None for no history
+            client_id (str): Scheduler client the message is queued for
+
         Returns:
             str: The assistant's response
+
+        Raises:
+            GenerationError: If no response could be generated
+        """
+        return ''.join(self.process_message_stream(message, mode, session_id, client_id)).strip()
+
+    def process_message_stream(self, message, mode='normal', session_id=None, client_id=None):
         """
+        Process a user message and stream the response as it is generated.
+
+        Args:
+            message (str): The user's message
+            mode (str): The operating mode
+            session_id (str): Conversation to continue, or None for no history
+            client_id (str): Scheduler client the message is queued for, so a
+                model server keeps queueing its work fairly
+
+        Yields:
+            str: Chunks of the assistant's response
+
+        Raises:
+            GenerationError: If the model is not ready or the response breaks
+                off; the exchange is then left out of the history
+        """
+        conversation = self.conversations.get(session_id) if session_id else None
+
+        # Requests made during startup wait briefly, so prompts are sized with the real
+        # tokenizer; a worker is not held for the whole load
+        if not self.model_manager.wait_until_loaded(current_app.config['MODEL_LOAD_WAIT']):
+            raise model_unavailable(self.model_manager.status())
+
         # Create a prompt for the model
-        prompt = self._create_prompt(message)
-        
-        # Generate response using the model
-        response = self.model_manager.generate_response(prompt, mode)
-        
-        return response
-        
-    def _create_prompt(self, message):
+        with span('build_prompt', mode=mode) as fields:
+            prompt = self._create_prompt(message, mode, conversation, client_id)
+            fields['prompt_chars'] = len(prompt)
+
+        # Stream response chunks from the model
+        chunks = []
+        first = None
+        for chunk in self.model_manager.generate_stream(prompt, mode, client_id):
+            if first is None:
+                first = time.perf_counter()
+            chunks.append(chunk)
+            yield chunk
+
+        # Peers weigh this instance by its generation speed
+        if self.agent_pool is not None and first is not None:
+            self.agent_pool.record(len(chunks) - 1, time.perf_counter() - first)
+
+        # Only completed exchanges become part of the history
+        if conversation is not None:
+            with conversation.lock:
+                conversation.add_turn(message, ''.join(chunks),
+                                      self.model_manager.count_tokens)
+
+    def forward_message_stream(self, message, mode='normal', session_id=None):
+        """
+        Send a message to a peer when the agent pool routes it to one.
+
+        A peer that cannot take the message is skipped until it announces
+        itself again, and the session is answered locally from then on.
+
+        Args:
+            message (str): The user's message
+            mode (str): The operating mode
+            session_id (str): Conversation to continue, or None for no history
+
+        Returns:
+            tuple or None: The Peer and an iterator over its response chunks,
+                or None to process locally
+        """
+        if self.agent_pool is None:
+            return None
+        peer = self.agent_pool.route(mode, session_id)
+        if peer is None:
+            return None
+
+        try:
+            with span('forward', peer=peer.agent_id, mode=mode):
+                chunks = self.agent_pool.forward(peer, message, mode, session_id)
+        except PeerError as e:
+            current_app.logger.warning(f"Answering locally: {e}")
+            self.agent_pool.mark_down(peer)
+            if session_id:
+                self.agent_pool.pin(session_id, self.agent_pool.agent_id)
+            return None
+        return peer, self._relay(chunks)
+
+    def _relay(self, chunks):
+        """Yield a peer's response, raising GenerationError if it breaks off."""
+        try:
+            yield from chunks
+        except PeerError as e:
+            current_app.logger.error(f"Error forwarding message: {e}")
+            raise GenerationError() from e
+
+    def clear_conversation(self, session_id):
+        """
+        Forget the history of a conversation, here and on the peer serving it.
+
+        Args:
+            session_id (str): The session identifier
+        """
+        self.conversations.clear(session_id)
+        if self.agent_pool is not None:
+            self.agent_pool.forget(session_id)
+
+    def _create_prompt(self, message, mode='normal', conversation=None, client_id=None):
         """
         Create a prompt for the model based on the user message.
-        
+
+        The history window is sized so that the preamble, history, new
+        message and the mode's max_tokens all fit in the model context.
+
         Args:
             message (str): The user's message
-            
+            mode (str): The operating mode
+            conversation (Conversation): History to include, if any
+            client_id (str): Scheduler client the prompt is built for
+
         Returns:
             str: The formatted prompt
         """
-        # Simple prompt format - can be expanded to include context
-        return f"USER: {message}\nASSISTANT:"
\ No newline at end of file
+        preamble = current_app.config['SYSTEM_PROMPT']
+        if preamble:
+            preamble += "\n\n"
+        request_text = f"USER: {message}\nASSISTANT:"
+
+        if mode == 'research':
+            return self._create_research_prompt(message, mode, conversation,
+                                                preamble, request_text, client_id)
+
+        # Knowledge goes after the history so the history prefix stays stable
+        knowledge = self._retrieve_knowledge(message)
+
+        history = self._fit_history(
+            conversation, mode, preamble,
+            self.model_manager.count_tokens(knowledge)
+            + self.model_manager.count_tokens(request_text)
+        )
+        return f"{preamble}{history}{knowledge}{request_text}"
+
+    def _fit_history(self, conversation, mode, preamble, reserved_tokens):
+        """
+        Trim a conversation to the tokens left over and render it.
+
+        Args:
+            conversation (Conversation): History to include, or None
+            mode (str): The operating mode
+            preamble (str): The system preamble
+            reserved_tokens (int): Tokens needed by the rest of the prompt
+
+        Returns:
+            str: The rendered history, or an empty string
+        """
+        if conversation is None:
+            return ''
+
+        # The preamble never changes, so it is only tokenized once
+        if self._preamble_tokens is None:
+            self._preamble_tokens = self.model_manager.count_tokens(preamble)
+
+        mode_settings = current_app.config['MODES'].get(
+            mode,
+            current_app.config['MODES']['normal']
+        )
+        budget = (current_app.config['MODEL_CTX_SIZE']
+                  - mode_settings['max_tokens']
+                  - self._preamble_tokens
+                  - reserved_tokens)
+
+        with conversation.lock:
+            conversation.fit(
+                max(budget, 0),
+                self.model_manager.count_tokens,
+                summary_budget=current_app.config['CONTEXT_SUMMARY_TOKENS'],
+                trim_ratio=current_app.config['CONTEXT_TRIM_RATIO']
+            )
+            return conversation.render()
+
+    def _create_research_prompt(self, message, mode, conversation, preamble, request_text,
+                                client_id=None):
+        """
+        Create a prompt that answers from web search results with citations.
+
+        Everything before the sources is known up front, so it is evaluated
+        by the model while the search and page fetches are in flight.
+
+        Args:
+            message (str): The user's message
+            mode (str): The operating mode
+            conversation (Conversation): History to include, if any
+            preamble (str): The system preamble
+            request_text (str): The formatted user turn
+            client_id (str): Scheduler client the prefill is done for
+
+        Returns:
+            str: The formatted prompt
+        """
+        config = current_app.config
+        count_tokens = self.model_manager.count_tokens
+        request_tokens = count_tokens(request_text)
+
+        history = self._fit_history(
+            conversation, mode, preamble,
+            count_tokens(RESEARCH_INSTRUCTIONS) + config['RESEARCH_MAX_TOKENS'] + request_tokens
+        )
+        prefix = f"{preamble}{history}{RESEARCH_INSTRUCTIONS}"
+
+        # Prefill on a helper thread; this thread only does network work meanwhile
+        prefill = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self.model_manager.prefill, prefix, mode, client_id),
+            daemon=True
+        )
+        prefill.start()
+        try:
+            with span('research') as fields:
+                passages = gather_passages(
+                    get_web_search(),
+                    message,
+                    max_pages=config['RESEARCH_MAX_PAGES'],
+                    passage_chars=config['RESEARCH_PASSAGE_CHARS'],
+                    deadline=config['RESEARCH_FETCH_DEADLINE']
+                )
+                fields['passages'] = len(passages)
+        except Exception as e:
+            current_app.logger.error(f"Research error: {e}")
+            passages = []
+        finally:
+            prefill.join()
+
+        mode_settings = config['MODES'][mode]
+        budget = min(config['RESEARCH_MAX_TOKENS'],
+                     config['MODEL_CTX_SIZE'] - mode_settings['max_tokens']
+                     - count_tokens(prefix) - request_tokens)
+        sources = self._format_sources(passages, budget)
+        return f"{prefix}{sources}{request_text}"
+
+    def _format_sources(self, passages, budget):
+        """
+        Lay out ranked passages as numbered sources within a token budget.
+
+        Args:
+            passages (list): Ranked passages with title, url and text
+            budget (int): Maximum tokens for the section
+
+        Returns:
+            str: Prompt section listing the sources
+        """
+        # Sources are numbered in order of their best passage
+        sources = {}
+        for passage in passages:
+            source = sources.get(passage['url'])
+            header = ''
+            if source is None:
+                header = f"[{len(sources) + 1}] {passage['title']} ({passage['url']})\n"
+            tokens = self.model_manager.count_tokens(f"{header}{passage['text']}\n")
+            if tokens > budget:
+                continue
+            budget -= tokens
+            if source is None:
+                source = sources[passage['url']] = [header]
+            source.append(passage['text'] + "\n")
+
+        if not sources:
+            return "No web sources could be retrieved for this question.\n\n"
+        return ''.join(''.join(source) + "\n" for source in sources.values())
+
+    def _retrieve_knowledge(self, message):
+        """
+        Find knowledge base notes relevant to a message.
+
+        Args:
+            message (str): The user's message
+
+        Returns:
+            str: Prompt section with the best matching notes, or an empty string
+        """
+        if not current_app.config['RAG_ENABLED']:
+            return ''
+
+        retriever = get_retriever()
+        if not retriever.available:
+            return ''
+
+        try:
+            with span('knowledge') as fields:
+                # Embedding the question runs in native code
+                hits = run_blocking(
+                    retriever.search,
+                    message,
+                    k=current_app.config['RAG_TOP_K'],
+                    min_score=current_app.config['RAG_MIN_SCORE']
+                )
+                fields['hits'] = len(hits)
+        except Exception as e:
+            current_app.logger.error(f"Knowledge retrieval error: {e}")
+            return ''
+
+        # Add notes in relevance order until the token budget is used
+        budget = current_app.config['RAG_MAX_TOKENS']
+        notes = []
+        for hit in hits:
+            note = f"[{hit['title']}]\n{hit['text']}\n\n"
+            tokens = self.model_manager.count_tokens(note)
+            if tokens > budget:
+                break
+            budget -= tokens
+            notes.append(note)
+
+        if not notes:
+            return ''
+        return "Relevant notes from the knowledge base:\n\n" + ''.join(notes)
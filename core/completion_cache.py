@@ -0,0 +1,127 @@
+"""
+Completion cache for deterministic generations.
+This module stores generated answers keyed by the normalized prompt, the
+sampling settings and the model file, so repeated prompts in low
+temperature modes are replayed instead of generated again.
+"""
+import json
+import os
+from utils.caching import TwoTierCache
+
+NAMESPACE = 'completion'
+
+
+def normalize_prompt(prompt):
+    """
+    Normalize a prompt so whitespace-only differences share a cache entry.
+
+    Indentation is kept, since it matters for code.
+
+    Args:
+        prompt (str): The prompt
+
+    Returns:
+        str: The prompt without trailing whitespace on its lines or around it
+    """
+    return '\n'.join(line.rstrip() for line in prompt.strip().splitlines())
+
+
+class CompletionCache:
+    """Two-tier cache of completions, stored as their streamed chunks."""
+
+    def __init__(self, cache_path, max_memory_entries=128, max_bytes=32 * 1024 * 1024,
+                 default_ttl=86400, max_temperature=0.2):
+        """
+        Initialize the completion cache.
+
+        Args:
+            cache_path (str): SQLite file backing the persistent tier
+            max_memory_entries (int): Entries kept in the in-process LRU
+            max_bytes (int): Size budget of the persistent tier
+            default_ttl (int): Seconds an entry stays valid unless the mode overrides it
+            max_temperature (float): Modes at or below this temperature are cached
+        """
+        self.default_ttl = default_ttl
+        self.max_temperature = max_temperature
+        self.store = TwoTierCache(
+            cache_path,
+            max_memory_entries=max_memory_entries,
+            max_bytes=max_bytes,
+            default_ttl=default_ttl
+        )
+
+    def ttl_for(self, mode_settings):
+        """
+        Decide whether a mode's completions are cached, and for how long.
+
+        A mode opts in or out with 'cache'; otherwise only modes sampling at
+        or below max_temperature are cached, since their answers repeat.
+
+        Args:
+            mode_settings (dict): Settings of the operating mode
+
+        Returns:
+            int or None: Seconds to keep entries, or None if the mode is not cached
+        """
+        enabled = mode_settings.get('cache')
+        if enabled is None:
+            enabled = mode_settings['temperature'] <= self.max_temperature
+        if not enabled:
+            return None
+        return mode_settings.get('cache_ttl', self.default_ttl)
+
+    def key(self, prompt, model_path, mode_settings, stop):
+        """
+        Build the lookup text for a completion.
+
+        Args:
+            prompt (str): The prompt
+            model_path (str): The model file that will generate the answer
+            mode_settings (dict): Sampling settings of the mode
+            stop (list): Stop strings
+
+        Returns:
+            str: Text identifying the completion
+        """
+        # Size and mtime change when the model file is replaced
+        stat = os.stat(model_path)
+        return json.dumps({
+            'prompt': normalize_prompt(prompt),
+            'model': [os.path.basename(model_path), stat.st_size, int(stat.st_mtime)],
+            'temperature': mode_settings['temperature'],
+            'top_p': mode_settings['top_p'],
+            'max_tokens': mode_settings['max_tokens'],
+            'stop': stop
+        }, sort_keys=True)
+
+    def get(self, key):
+        """
+        Look up a cached completion.
+
+        Args:
+            key (str): Text from key()
+
+        Returns:
+            list or None: The completion's chunks, or None on a miss
+        """
+        return self.store.get(NAMESPACE, key)
+
+    def set(self, key, chunks, ttl=None):
+        """
+        Store a finished completion.
+
+        Args:
+            key (str): Text from key()
+            chunks (list): The completion's chunks in order
+            ttl (int): Seconds to keep the entry, default_ttl if None
+        """
+        self.store.set(NAMESPACE, key, chunks, ttl=ttl)
+
+    def stats(self):
+        """
+        Get cache hit/miss counters.
+
+        Returns:
+            dict: Cache statistics
+        """
+        return self.store.stats()
@@ -0,0 +1,220 @@
+"""
+Conversation memory for multi-turn chats.
+This module stores per-session turns and keeps a token-budgeted window of
+recent history that changes as rarely as possible between turns.
+Sessions are named by the server and handed to clients as signed tokens,
+so a client can only continue or clear a conversation it was given.
+"""
+import secrets
+import threading
+from collections import OrderedDict
+from itsdangerous import BadSignature, URLSafeSerializer
+
+# Keeps session tokens distinct from anything else signed with SECRET_KEY
+_SESSION_SALT = 'chat-session'
+
+
+def issue_session(secret_key):
+    """
+    Create a session and the token a client presents to continue it.
+
+    Args:
+        secret_key (str): The application's SECRET_KEY
+
+    Returns:
+        tuple: (session_id, token)
+    """
+    session_id = secrets.token_urlsafe(16)
+    return session_id, URLSafeSerializer(secret_key, salt=_SESSION_SALT).dumps(session_id)
+
+
+def verify_session(token, secret_key):
+    """
+    Get the session a token was issued for.
+
+    Args:
+        token (str): Token from issue_session()
+        secret_key (str): The application's SECRET_KEY
+
+    Returns:
+        str or None: The session id, or None if the token is missing or forged
+    """
+    if not isinstance(token, str) or not token:
+        return None
+    try:
+        session_id = URLSafeSerializer(secret_key, salt=_SESSION_SALT).loads(token)
+    except BadSignature:
+        return None
+    return session_id if isinstance(session_id, str) else None
+
+
+def format_turn(user_message, assistant_message):
+    """
+    Format one exchange exactly as it appears in the prompt.
+
+    Args:
+        user_message (str): The user's message
+        assistant_message (str): The assistant's reply
+
+    Returns:
+        str: The formatted exchange
+    """
+    return f"USER: {user_message}\nASSISTANT: {assistant_message}\n"
+
+
+class Turn:
+    """A single user/assistant exchange with its cached token count."""
+
+    def __init__(self, user_message, text, tokens):
+        """
+        Initialize the turn.
+
+        Args:
+            user_message (str): The user's message, used for summaries
+            text (str): The formatted exchange
+            tokens (int): Number of tokens in text
+        """
+        self.user_message = user_message
+        self.text = text
+        self.tokens = tokens
+
+
+class Conversation:
+    """History window and running summary for one chat session."""
+
+    def __init__(self):
+        """Initialize an empty conversation."""
+        self.turns = []
+        self.summary = ''
+        self.summary_tokens = 0
+        self.lock = threading.Lock()
+        self._summary_lines = []
+        self._window_tokens = 0
+
+    def add_turn(self, user_message, assistant_message, count_tokens):
+        """
+        Append an exchange, tokenizing only the new text.
+
+        Args:
+            user_message (str): The user's message
+            assistant_message (str): The assistant's reply
+            count_tokens (callable): Returns the token count of a string
+        """
+        text = format_turn(user_message, assistant_message.strip())
+        turn = Turn(user_message, text, count_tokens(text))
+        self.turns.append(turn)
+        self._window_tokens += turn.tokens
+
+    def fit(self, budget, count_tokens, summary_budget, trim_ratio=0.75):
+        """
+        Drop the oldest turns until the history fits within budget.
+
+        The window is only trimmed once it overflows, and then down to
+        trim_ratio of the budget, so the prompt prefix stays identical for
+        several turns and llama.cpp can keep reusing its evaluated state.
+
+        Args:
+            budget (int): Tokens available for summary and turns
+            count_tokens (callable): Returns the token count of a string
+            summary_budget (int): Maximum tokens kept in the summary
+            trim_ratio (float): Fraction of budget to trim down to
+        """
+        if self.summary_tokens + self._window_tokens <= budget:
+            return
+
+        target = int(budget * trim_ratio)
+        dropped = []
+        while self.turns and self.summary_tokens + self._window_tokens > target:
+            turn = self.turns.pop(0)
+            self._window_tokens -= turn.tokens
+            dropped.append(turn)
+
+        self._fold_into_summary(dropped, count_tokens, summary_budget)
+
+        # The summary may have grown past what the window freed up
+        while self.turns and self.summary_tokens + self._window_tokens > budget:
+            turn = self.turns.pop(0)
+            self._window_tokens -= turn.tokens
+
+    def render(self):
+        """
+        Render the summary and history window as prompt text.
+
+        Returns:
+            str: Summary section followed by the formatted turns
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation:\n{self.summary}\n\n")
+        parts.extend(turn.text for turn in self.turns)
+        return ''.join(parts)
+
+    def _fold_into_summary(self, dropped, count_tokens, summary_budget):
+        """Record dropped turns as short summary lines, oldest lines first out."""
+        if not dropped or summary_budget <= 0:
+            return
+
+        for turn in dropped:
+            topic = ' '.join(turn.user_message.split())
+            if len(topic) > 120:
+                topic = topic[:117] + '...'
+            self._summary_lines.append(f"- The user asked: {topic}")
+
+        # Only the summary is re-tokenized, and only when the window moves
+        while self._summary_lines:
+            summary = '\n'.join(self._summary_lines)
+            tokens = count_tokens(summary)
+            if tokens <= summary_budget:
+                self.summary = summary
+                self.summary_tokens = tokens
+                return
+            self._summary_lines.pop(0)
+
+        self.summary = ''
+        self.summary_tokens = 0
+
+
+class ConversationStore:
+    """Thread-safe LRU of conversations keyed by session id."""
+
+    def __init__(self, max_sessions=256):
+        """
+        Initialize the store.
+
+        Args:
+            max_sessions (int): Number of sessions kept before evicting the oldest
+        """
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+        Get or create the conversation for a session.
+
+        Args:
+            session_id (str): The session identifier
+
+        Returns:
+            Conversation: The session's conversation
+        """
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+            if conversation is None:
+                conversation = Conversation()
+                self._sessions[session_id] = conversation
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return conversation
+
+    def clear(self, session_id):
+        """
+        Forget a session's history.
+
+        Args:
+            session_id (str): The session identifier
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -0,0 +1,324 @@
+"""
+Deterministic stand-in for a llama-cpp-python model.
+This module provides a model with the Llama interface the application uses,
+producing fixed text at configurable token rates so benchmarks and CI run
+offline without a real GGUF model.
+"""
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+import numpy as np
+
+# Text the fake model generates from, starting at an offset derived from the prompt
+_REPLY_TEXT = (
+    "Local models trade raw speed for privacy, so every millisecond spent on the "
+    "prompt or on each generated token is felt by the user. Caching evaluated "
+    "prefixes, sizing batches to the hardware and streaming tokens as soon as they "
+    "are produced keep the assistant responsive on ordinary laptops. "
+)
+
+# Tokens are runs of up to four characters, about what BPE vocabularies average
+_TOKEN = re.compile(r'\s?[^\s]{1,4}|\s+')
+
+
+class FakeLlama:
+    """Model with the subset of the Llama interface used by ModelManager."""
+
+    def __init__(self, model_path, n_ctx=512, n_batch=512, n_threads=None,
+                 prompt_tps=2000.0, gen_tps=200.0, reply_tokens=64, **kwargs):
+        """
+        Initialize the fake model.
+
+        Args:
+            model_path (str): Path of the model file (only used as the model name)
+            n_ctx (int): Context size
+            n_batch (int): Prompt batch size
+            n_threads (int): Thread count, accepted for compatibility
+            prompt_tps (float): Prompt evaluation speed in tokens per second
+            gen_tps (float): Generation speed in tokens per second
+            reply_tokens (int): Tokens generated before the reply ends on its own
+            **kwargs: Other Llama arguments, ignored
+        """
+        self.model_path = model_path
+        self._n_ctx = n_ctx
+        self.n_batch = min(n_ctx, n_batch)
+        self.n_threads = n_threads
+        self.prompt_tps = prompt_tps
+        self.gen_tps = gen_tps
+        self.reply_tokens = reply_tokens
+
+        self._input_ids = array('i')
+        self.cache = None
+
+        # Vocabulary grows as text is seen, so detokenize() can invert tokenize()
+        self._vocab = {}
+        self._pieces = []
+        self._vocab_lock = threading.Lock()
+        self._reply = self.tokenize(_REPLY_TEXT.encode('utf-8'), add_bos=False)
+
+    @property
+    def input_ids(self):
+        """numpy.ndarray: Ids of the evaluated tokens, like Llama.input_ids[:n_tokens]."""
+        return np.array(self._input_ids, dtype=np.intc)
+
+    @property
+    def n_tokens(self):
+        """int: Number of evaluated tokens in the context."""
+        return len(self._input_ids)
+
+    @n_tokens.setter
+    def n_tokens(self, value):
+        del self._input_ids[value:]
+
+    def n_ctx(self):
+        """Get the context size."""
+        return self._n_ctx
+
+    def set_cache(self, cache):
+        """Accept a prompt state cache; states are not saved by the fake model."""
+        self.cache = cache
+
+    def tokenize(self, text, add_bos=True):
+        """
+        Split text into tokens.
+
+        Args:
+            text (bytes): UTF-8 text
+            add_bos (bool): Prepend the beginning-of-sequence token
+
+        Returns:
+            list: Token ids
+        """
+        tokens = [1] if add_bos else []
+        with self._vocab_lock:
+            for piece in _TOKEN.findall(text.decode('utf-8', errors='ignore')):
+                token = self._vocab.get(piece)
+                if token is None:
+                    token = self._vocab[piece] = len(self._pieces) + 2
+                    self._pieces.append(piece)
+                tokens.append(token)
+        return tokens
+
+    def detokenize(self, tokens):
+        """
+        Turn tokens back into text.
+
+        Args:
+            tokens (list): Token ids
+
+        Returns:
+            bytes: UTF-8 text
+        """
+        return ''.join(self._pieces[token - 2] for token in tokens if token >= 2).encode('utf-8')
+
+    def reset(self):
+        """Forget the evaluated context."""
+        del self._input_ids[:]
+
+    def eval(self, tokens):
+        """
+        Evaluate tokens, taking the time a model of the configured speed would.
+
+        Args:
+            tokens (list): Token ids to append to the context
+
+        Raises:
+            ValueError: If the context window would overflow
+        """
+        if self.n_tokens + len(tokens) > self._n_ctx:
+            raise ValueError(f"Requested tokens ({self.n_tokens + len(tokens)}) exceed "
+                             f"context window of {self._n_ctx}")
+        rate = self.gen_tps if len(tokens) == 1 else self.prompt_tps
+        time.sleep(len(tokens) / rate)
+        self._input_ids.extend(tokens)
+
+    def __call__(self, prompt, max_tokens=16, stop=None, stream=False, **kwargs):
+        """
+        Complete a prompt.
+
+        The evaluated prefix shared with the previous prompt is reused, as
+        llama-cpp-python does.
+
+        Args:
+            prompt (str): The prompt
+            max_tokens (int): Maximum tokens to generate
+            stop (list): Strings that end the completion
+            stream (bool): Yield chunks instead of returning one completion
+            **kwargs: Sampling arguments, ignored
+
+        Returns:
+            dict or iterator: The completion, or completion chunks if streaming
+        """
+        chunks = self._complete(prompt, max_tokens, stop or [])
+        if stream:
+            return chunks
+
+        texts = []
+        finish_reason = 'length'
+        for chunk in chunks:
+            texts.append(chunk['choices'][0]['text'])
+            finish_reason = chunk['choices'][0]['finish_reason'] or finish_reason
+        return self._completion(''.join(texts), finish_reason)
+
+    def _complete(self, prompt, max_tokens, stop):
+        """Evaluate the prompt and yield one chunk per generated token."""
+        tokens = self.tokenize(prompt.encode('utf-8'))
+        matched = 0
+        for evaluated, token in zip(self._input_ids.tolist(), tokens):
+            if evaluated != token:
+                break
+            matched += 1
+
+        # Re-evaluate at least the last token, like llama-cpp-python
+        self.n_tokens = min(matched, len(tokens) - 1)
+        self.eval(tokens[self.n_tokens:])
+
+        start = zlib.crc32(prompt.encode('utf-8')) % len(self._reply)
+        limit = min(max_tokens, self.reply_tokens, self._n_ctx - self.n_tokens)
+        text = ''
+        for i in range(limit):
+            token = self._reply[(start + i) % len(self._reply)]
+            self.eval([token])
+            piece = self.detokenize([token]).decode('utf-8')
+            text += piece
+            if any(s in text for s in stop):
+                yield self._completion('', 'stop')
+                return
+            last = i == limit - 1
+            reason = None
+            if last:
+                reason = 'stop' if limit == self.reply_tokens else 'length'
+            yield self._completion(piece, reason)
+
+    def create_batch_backend(self, max_sequences=8):
+        """
+        Create a batch engine backend sharing this model's vocabulary.
+
+        Args:
+            max_sequences (int): Sequences held at the same time
+
+        Returns:
+            FakeBatchBackend: The backend
+        """
+        return FakeBatchBackend(self, max_sequences)
+
+    def _completion(self, text, finish_reason):
+        """Build a completion in llama-cpp-python's format."""
+        return {
+            'id': 'cmpl-fake',
+            'object': 'text_completion',
+            'created': int(time.time()),
+            'model': self.model_path,
+            'choices': [{'text': text, 'index': 0, 'logprobs': None,
+                         'finish_reason': finish_reason}]
+        }
+
+
+class FakeBatchBackend:
+    """
+    Batch engine backend with the cost profile of batched decoding.
+
+    A step takes as long as reading the weights once (one token at the
+    generation rate) or computing its tokens at the prompt rate, whichever
+    is longer, so decoding several sequences together is nearly free until
+    the step becomes compute bound, as on real hardware.
+    """
+
+    # Token ending every fake reply
+    EOS = 0
+
+    def __init__(self, model, max_sequences=8):
+        """
+        Initialize the backend.
+
+        Args:
+            model (FakeLlama): Model providing the vocabulary and token rates
+            max_sequences (int): Sequences held at the same time
+        """
+        self.model = model
+        self.max_sequences = max_sequences
+        self._sequences = {}
+
+    def tokenize(self, text):
+        """Tokenize a prompt like create_completion does."""
+        return self.model.tokenize(text)
+
+    def detokenize(self, tokens):
+        """Turn tokens into UTF-8 bytes."""
+        return self.model.detokenize(tokens)
+
+    def token_eos(self):
+        """Get the end-of-sequence token."""
+        return self.EOS
+
+    def decode(self, entries):
+        """
+        Evaluate one step.
+
+        Args:
+            entries (list): (seq_id, tokens, start position, wants logits) tuples
+
+        Returns:
+            list: Logits of the last token of each entry that wants them
+        """
+        model = self.model
+        count = sum(len(tokens) for _, tokens, _, _ in entries)
+        time.sleep(max(1 / model.gen_tps, count / model.prompt_tps))
+
+        outputs = []
+        for seq_id, tokens, position, wants_logits in entries:
+            sequence = self._sequences.setdefault(seq_id, {'tokens': [], 'prompt': None})
+            del sequence['tokens'][position:]
+            sequence['tokens'].extend(tokens)
+            if not wants_logits:
+                continue
+
+            # The reply starts at an offset derived from the prompt, like __call__
+            history = sequence['tokens']
+            if sequence['prompt'] is None:
+                sequence['prompt'] = len(history)
+            generated = len(history) - sequence['prompt']
+            start = zlib.crc32(array('i', history[:sequence['prompt']]).tobytes())
+            token = self.EOS if generated >= model.reply_tokens else \
+                model._reply[(start + generated) % len(model._reply)]
+
+            logits = np.zeros(len(model._pieces) + 2, dtype=np.float32)
+            logits[token] = 100.0
+            outputs.append(logits)
+        return outputs
+
+    def remove(self, seq_id):
+        """Forget a sequence."""
+        self._sequences.pop(seq_id, None)
+
+    def close(self):
+        """Release the backend."""
+        self._sequences.clear()
+
+
+def write_fake_gguf(path, context_length=4096):
+    """
+    Write a GGUF file with metadata but no tensors, for the fake backend.
+
+    The model registry reads it like any other model.
+
+    Args:
+        path (str): File to write
+        context_length (int): Context length recorded in the metadata
+    """
+    def string(value):
+        data = value.encode('utf-8')
+        return struct.pack('<Q', len(data)) + data
+
+    metadata = [
+        (string('general.architecture') + struct.pack('<I', 8) + string('fake')),
+        (string('general.name') + struct.pack('<I', 8) + string('Fake model')),
+        (string('fake.context_length') + struct.pack('<I', 4) + struct.pack('<I', context_length))
+    ]
+    with open(path, 'wb') as f:
+        f.write(b'GGUF' + struct.pack('<IQQ', 3, 0, len(metadata)))
+        for entry in metadata:
+            f.write(entry)
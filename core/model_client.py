@@ -0,0 +1,390 @@
+"""
+Client of the out-of-process model server.
+This module speaks the model server's protocol, length-prefixed JSON
+frames over a Unix socket, and offers the ModelManager interface the web
+app uses, so web workers share one loaded model and survive its crashes.
+"""
+import json
+import socket
+import struct
+import threading
+import time
+import uuid
+from core.backends import GenerationError, model_unavailable
+from utils.tracing import current_trace_id
+
+PROTOCOL_VERSION = 1
+
+# Frames larger than this are refused instead of being buffered
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+_HEADER = struct.Struct('>I')
+
+
+class ModelServerError(Exception):
+    """Raised when the model server is unreachable or reports an error."""
+
+
+def send_frame(sock, message):
+    """
+    Send one message as a length-prefixed JSON frame.
+
+    Args:
+        sock (socket.socket): Connected socket
+        message (dict): The message
+    """
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    """Read exactly size bytes, or return None if the peer closed first."""
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_frame(sock):
+    """
+    Receive one length-prefixed JSON frame.
+
+    Args:
+        sock (socket.socket): Connected socket
+
+    Returns:
+        dict or None: The message, or None if the peer closed the connection
+
+    Raises:
+        ModelServerError: If the frame is oversized or not valid JSON
+    """
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ModelServerError(f"Frame of {size} bytes exceeds the limit")
+    data = _recv_exactly(sock, size)
+    if data is None:
+        return None
+    try:
+        return json.loads(data.decode('utf-8'))
+    except ValueError as e:
+        raise ModelServerError(f"Invalid frame: {e}")
+
+
+def _client(client_id):
+    """Name the client the server's scheduler queues work for; anonymous work queues alone."""
+    return client_id or f"anonymous-{uuid.uuid4().hex}"
+
+
+class ModelClient:
+    """ModelManager stand-in that forwards every call to the model server."""
+
+    def __init__(self, socket_path, timeout=300.0, connect_timeout=5.0, logger=None,
+                 poll_interval=1.0, load_wait=5.0):
+        """
+        Initialize the client.
+
+        No connection is kept open; every call uses its own, so a restarted
+        server is picked up on the next call.
+
+        Args:
+            socket_path (str): Path of the server's Unix socket
+            timeout (float): Seconds to wait for each server reply
+            connect_timeout (float): Seconds to wait for a connection
+            logger (Logger): Where errors are reported
+            poll_interval (float): Seconds between health checks while loading
+            load_wait (float): Seconds a generation waits for a loading model
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self.load_wait = load_wait
+        self._status = {
+            'state': 'loading',
+            'model': None,
+            'progress': 0.0,
+            'error': None,
+            'load_time': None
+        }
+        self._status_lock = threading.Lock()
+        self._status_listeners = []
+        self._load_done = threading.Event()
+
+    @property
+    def model_loaded(self):
+        """bool: Whether the server's model was ready at the last health check."""
+        return self.status()['state'] == 'ready'
+
+    def _connect(self):
+        """Open a connection to the server."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ModelServerError(f"Model server unavailable at {self.socket_path}: {e}")
+        sock.settimeout(self.timeout)
+        return sock
+
+    def _request(self, op, **fields):
+        """Send one request and return its single reply."""
+        sock = self._connect()
+        try:
+            send_frame(sock, dict(fields, op=op, version=PROTOCOL_VERSION,
+                                  trace_id=current_trace_id()))
+            reply = recv_frame(sock)
+        except OSError as e:
+            raise ModelServerError(f"Model server connection failed: {e}")
+        finally:
+            sock.close()
+        if reply is None:
+            raise ModelServerError("Model server closed the connection")
+        if 'error' in reply:
+            raise ModelServerError(reply['error'])
+        return reply
+
+    def _log_error(self, message):
+        if self.logger:
+            self.logger.error(message)
+
+    def start_loading(self):
+        """
+        Follow the server's loading state on a background thread.
+
+        Returns:
+            threading.Thread: The health check thread
+        """
+        thread = threading.Thread(target=self._watch, name='model-server-health', daemon=True)
+        thread.start()
+        return thread
+
+    def _watch(self):
+        """Poll health, quickly while loading and slowly once settled."""
+        while True:
+            status = self.health()['status']
+            self._set_status(**status)
+            if status['state'] != 'loading':
+                self._load_done.set()
+            time.sleep(self.poll_interval if status['state'] == 'loading'
+                       else self.poll_interval * 5)
+
+    def health(self):
+        """
+        Check the server.
+
+        Returns:
+            dict: 'status' with the model status and, when reachable, the server's pid
+                and scheduler stats
+        """
+        try:
+            return self._request('health')
+        except ModelServerError as e:
+            return {'status': {'state': 'failed', 'model': self._status['model'],
+                               'progress': 0.0, 'error': str(e), 'load_time': None}}
+
+    def wait_until_loaded(self, timeout=None):
+        """
+        Block until the server's model is ready or failed.
+
+        Args:
+            timeout (float): Seconds to wait, forever if None
+
+        Returns:
+            bool: True if the model is ready
+        """
+        if not self._load_done.is_set():
+            self._set_status(**self.health()['status'])
+            if self._status['state'] != 'loading':
+                self._load_done.set()
+        self._load_done.wait(timeout)
+        return self.model_loaded
+
+    def add_status_listener(self, listener):
+        """
+        Register a callback for model status changes.
+
+        Args:
+            listener (callable): Called with the status dict on every change
+        """
+        self._status_listeners.append(listener)
+
+    def status(self):
+        """
+        Get the model status from the last health check.
+
+        Returns:
+            dict: state (loading, ready or failed), model, progress, error and load_time
+        """
+        with self._status_lock:
+            return dict(self._status)
+
+    def _set_status(self, **changes):
+        """Update the status and notify listeners if it changed."""
+        with self._status_lock:
+            status = dict(self._status, **changes)
+            if status == self._status:
+                return
+            self._status = status
+        for listener in self._status_listeners:
+            try:
+                listener(dict(status))
+            except Exception as e:
+                self._log_error(f"Error reporting model status: {e}")
+
+    def stats(self):
+        """
+        Get the server's model statistics.
+
+        Returns:
+            dict: The server's ModelManager stats and scheduler stats
+        """
+        try:
+            return self._request('stats')['stats']
+        except ModelServerError as e:
+            return {'error': str(e), 'status': self.status()}
+
+    def metrics(self):
+        """
+        Get the server's metrics.
+
+        Returns:
+            str: Metrics in the Prometheus text format, empty if the server is unreachable
+        """
+        try:
+            return self._request('metrics')['metrics']
+        except ModelServerError:
+            return ''
+
+    def count_tokens(self, text):
+        """
+        Count the tokens in a piece of text using the server's tokenizer.
+
+        Args:
+            text (str): The text to measure
+
+        Returns:
+            int: Number of tokens, estimated if the server is unreachable
+        """
+        if not text:
+            return 0
+        try:
+            return self._request('count_tokens', text=text)['count']
+        except ModelServerError:
+            return len(text) // 4 + 1
+
+    def prefill(self, text, mode='normal', client_id=None):
+        """
+        Evaluate a prompt prefix on the server ahead of generation.
+
+        Args:
+            text (str): The fixed leading part of an upcoming prompt
+            mode (str): The operating mode, which selects the model
+            client_id (str): Client the server's scheduler queues the work for
+
+        Returns:
+            int: Number of tokens evaluated
+        """
+        if not text:
+            return 0
+        try:
+            return self._request('prefill', text=text, mode=mode,
+                                 client=_client(client_id))['tokens']
+        except ModelServerError as e:
+            self._log_error(f"Error prefilling prompt: {e}")
+            return 0
+
+    def _stream(self, prompt, mode, client_id):
+        """
+        Stream a completion from the server.
+
+        Closing the generator sends a cancel frame, so the server stops
+        generating for a client that went away.
+
+        Yields:
+            str: Text chunks
+
+        Raises:
+            ModelServerError: If the server is unreachable or the generation failed
+        """
+        sock = self._connect()
+        finished = False
+        try:
+            send_frame(sock, {'op': 'generate', 'version': PROTOCOL_VERSION, 'prompt': prompt,
+                              'mode': mode, 'trace_id': current_trace_id(),
+                              'client': _client(client_id)})
+            while True:
+                reply = recv_frame(sock)
+                if reply is None:
+                    raise ModelServerError("Model server closed the connection")
+                if 'error' in reply:
+                    finished = True
+                    raise ModelServerError(reply['error'])
+                if reply.get('done'):
+                    finished = True
+                    return
+                yield reply['text']
+        except OSError as e:
+            raise ModelServerError(f"Model server connection failed: {e}")
+        finally:
+            if not finished:
+                try:
+                    send_frame(sock, {'op': 'cancel'})
+                except OSError:
+                    pass
+            sock.close()
+
+    def generate_response(self, prompt, mode='normal', client_id=None):
+        """
+        Generate a response on the model server.
+
+        Args:
+            prompt (str): The input prompt
+            mode (str): The operating mode, which selects the model and settings
+            client_id (str): Client the server's scheduler queues the work for
+
+        Returns:
+            str: The generated response
+
+        Raises:
+            GenerationError: If the model is not ready within load_wait seconds
+                or generation fails
+        """
+        if not self.wait_until_loaded(self.load_wait):
+            raise model_unavailable(self.status())
+        try:
+            return ''.join(self._stream(prompt, mode, client_id)).strip()
+        except ModelServerError as e:
+            self._log_error(f"Error generating response: {e}")
+            raise GenerationError() from e
+
+    def generate_stream(self, prompt, mode='normal', client_id=None):
+        """
+        Generate a response incrementally on the model server.
+
+        Args:
+            prompt (str): The input prompt
+            mode (str): The operating mode, which selects the model and settings
+            client_id (str): Client the server's scheduler queues the work for
+
+        Yields:
+            str: Chunks of generated text
+
+        Raises:
+            GenerationError: If the model is not ready within load_wait seconds
+                or generation fails
+        """
+        if not self.wait_until_loaded(self.load_wait):
+            raise model_unavailable(self.status())
+        try:
+            yield from self._stream(prompt, mode, client_id)
+        except ModelServerError as e:
+            self._log_error(f"Error generating response: {e}")
+            raise GenerationError() from e
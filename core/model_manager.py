@@ -3,77 +3,778 @@ Model manager for loading and interacting with the LLM.
 This module handles model initialization, inference, and parameter adjustments.
 """
 import os
-from llama_cpp import Llama
+import atexit
+import threading
+import time
 from flask import current_app
+from core.model_registry import ModelInfo, ModelRegistry, ModelNotFoundError, physical_memory
+from core.backends import GenerationError, backend_class, model_unavailable
+from core.batch_engine import BatchEngine, LlamaBatchBackend
+from core.completion_cache import CompletionCache
+from core.tuning import resolve_settings, set_threads
+from utils import metrics
+from utils.concurrency import run_blocking
+from utils.tracing import span
+
+# Generation stops before the model starts writing the user's next turn
+STOP_SEQUENCES = ["USER:"]
+
+# Model files are read ahead in blocks of this size to report load progress
+READ_AHEAD_BLOCK = 16 * 1024 * 1024
 
 class ModelManager:
-    """Manages the local LLM model and inference."""
+    """Manages the local LLM models and inference."""
     
     def __init__(self):
-        """Initialize the model manager."""
-        self.model = None
+        """
+        Initialize the model manager.
+        
+        No model is loaded here; call start_loading() to load the default
+        model on a background thread.
+        """
+        config = current_app.config
         self.model_loaded = False
-        self._load_model()
+        self.prompt_caches = {}
+        self._draft_models = {}
+        self._draft_lock = threading.Lock()
+        self._batch_engines = {}
+        self._batch_lock = threading.Lock()
+        self.logger = current_app.logger
+        self.backend = backend_class(config['MODEL_BACKEND'])
+        self.load_wait = config['MODEL_LOAD_WAIT']
+        
+        # Load progress, reported to listeners as it changes
+        self._status = {
+            'state': 'loading',
+            'model': os.path.basename(config['MODEL_PATH']),
+            'progress': 0.0,
+            'error': None,
+            'load_time': None
+        }
+        self._status_lock = threading.Lock()
+        self._status_listeners = []
+        self._load_done = threading.Event()
+        
+        # Kept here because states are also saved at exit, outside the app context
+        self._prompt_cache_dir = config['PROMPT_CACHE_DIR']
+        self._prompt_cache_persist_entries = config['PROMPT_CACHE_PERSIST_ENTRIES']
+        
+        # Default to 75% of RAM, leaving room for the OS and the app itself;
+        # models of a server backend use none of this process's memory
+        budget = config['MODEL_MEMORY_BUDGET']
+        if not self.backend.in_process:
+            budget = None
+        elif not budget:
+            ram = physical_memory()
+            budget = int(ram * 0.75) if ram else None
+        
+        self.registry = ModelRegistry(
+            config['MODELS_DIR'],
+            loader=self._create_model,
+            memory_budget=budget,
+            n_ctx=config['MODEL_CTX_SIZE'],
+            on_evict=self._release_model
+        )
+        self.default_model = os.path.basename(config['MODEL_PATH'])
+        
+        # Models are loaded with the largest batch any mode asks for; modes
+        # with smaller batches lower it per request
+        self._load_batch = min(
+            max(resolve_settings(config, mode)['n_batch'] for mode in config['MODES'].values()),
+            config['MODEL_CTX_SIZE']
+        )
+        atexit.register(self.save_prompt_cache)
+        
+        # Answers to repeated prompts in deterministic modes are replayed from here
+        self.completion_cache = None
+        if config['COMPLETION_CACHE_ENABLED']:
+            self.completion_cache = CompletionCache(
+                config['COMPLETION_CACHE_PATH'],
+                max_memory_entries=config['COMPLETION_CACHE_MEMORY_ENTRIES'],
+                max_bytes=config['COMPLETION_CACHE_MAX_BYTES'],
+                default_ttl=config['COMPLETION_CACHE_TTL'],
+                max_temperature=config['COMPLETION_CACHE_MAX_TEMPERATURE']
+            )
+    
+    def start_loading(self):
+        """
+        Load the default model on a background thread.
+        
+        Returns:
+            threading.Thread: The loader thread
+        """
+        app = current_app._get_current_object()
+        
+        def load():
+            with app.app_context():
+                self._load_model()
+        
+        thread = threading.Thread(target=load, name='model-loader', daemon=True)
+        thread.start()
+        return thread
+    
+    def wait_until_loaded(self, timeout=None):
+        """
+        Block until the default model has finished loading or failed.
+        
+        Args:
+            timeout (float): Seconds to wait, forever if None
+            
+        Returns:
+            bool: True if the model is ready
+        """
+        self._load_done.wait(timeout)
+        return self.model_loaded
+    
+    def add_status_listener(self, listener):
+        """
+        Register a callback for model status changes.
+        
+        Args:
+            listener (callable): Called with the status dict on every change
+        """
+        self._status_listeners.append(listener)
+    
+    def status(self):
+        """
+        Get the loading state of the default model.
+        
+        Returns:
+            dict: state (loading, ready or failed), model, progress, error and load_time
+        """
+        with self._status_lock:
+            return dict(self._status)
+    
+    def _set_status(self, **changes):
+        """Update the status and notify listeners."""
+        with self._status_lock:
+            self._status.update(changes)
+            status = dict(self._status)
+        for listener in self._status_listeners:
+            try:
+                listener(status)
+            except Exception as e:
+                self.logger.error(f"Error reporting model status: {e}")
     
     def _load_model(self):
-        """Load the LLM model."""
+        """Load the default LLM model."""
+        model_path = current_app.config['MODEL_PATH']
+        started = time.monotonic()
+        
         try:
-            model_path = current_app.config['MODEL_PATH']
+            self.registry.scan()
             
-            # Check if model exists
-            if not os.path.exists(model_path):
+            # Check if model exists; a backend that never reads it gets a placeholder
+            if not self.backend.needs_model_file and not os.path.exists(model_path):
+                self.registry.add(ModelInfo(model_path, {}, size=0))
+            elif not os.path.exists(model_path) or self.registry.register(model_path) is None:
                 current_app.logger.error(f"Model not found at {model_path}")
+                self._set_status(state='failed', error=f"Model not found at {model_path}")
                 return False
             
-            # Load model with llama-cpp-python
-            self.model = Llama(
-                model_path=model_path,
-                n_ctx=current_app.config['MODEL_CTX_SIZE'],
-                n_batch=current_app.config['MODEL_BATCH_SIZE']
-            )
-            
+            if self.backend.in_process and self.backend.needs_model_file:
+                self._read_ahead(model_path)
+            with self.registry.use(self.default_model):
+                pass
             self.model_loaded = True
-            current_app.logger.info("Model loaded successfully")
+            load_time = time.monotonic() - started
+            current_app.logger.info(f"Model loaded successfully in {load_time:.1f}s")
+            self._set_status(state='ready', progress=1.0, load_time=load_time)
             return True
-            
         except Exception as e:
             current_app.logger.error(f"Error loading model: {e}")
+            self._set_status(state='failed', error=str(e))
             return False
+        finally:
+            self._load_done.set()
     
-    def generate_response(self, prompt, mode='normal'):
+    def _read_ahead(self, model_path):
         """
-        Generate a response using the loaded model.
+        Read a model file once so the following load finds it in the page cache.
+        
+        llama.cpp offers no load progress hook, so progress is reported from
+        this pass. Files too large to stay cached are not read ahead.
         
         Args:
-            prompt (str): The input prompt
-            mode (str): The operating mode (normal, code, creative)
+            model_path (str): Path of the model file
+        """
+        size = os.path.getsize(model_path)
+        ram = physical_memory()
+        if not size or (ram and size > ram // 2):
+            return
+        
+        # The read covers most of the load time; the rest is llama.cpp setup
+        done = 0
+        reported = 0.0
+        buffer = bytearray(READ_AHEAD_BLOCK)
+        with open(model_path, 'rb', buffering=0) as f:
+            while True:
+                read = run_blocking(f.readinto, buffer)
+                if not read:
+                    break
+                done += read
+                progress = 0.9 * done / size
+                if progress - reported >= 0.01:
+                    reported = progress
+                    self._set_status(progress=round(progress, 3))
+    
+    def _create_model(self, info):
+        """
+        Load a model file with the configured backend. Called by the registry.
+        
+        Args:
+            info (ModelInfo): The model to load
             
         Returns:
-            str: The generated response
+            InferenceBackend: The loaded model
+        """
+        config = current_app.config
+        current_app.logger.info(f"Loading model {info.name} with the {config['MODEL_BACKEND']} backend")
+        with span('model_load', model=info.name):
+            started = time.monotonic()
+            
+            # Verifying drafted tokens needs the logits of every evaluated position
+            backend = run_blocking(self.backend.load, info, config, n_batch=self._load_batch,
+                                   logits_all=self._uses_speculation(info.name))
+            metrics.MODEL_LOAD_SECONDS.labels(info.name).set(time.monotonic() - started)
+            metrics.MODEL_LOADS.labels(info.name).inc()
+        for problem in backend.stats().get('problems', []):
+            current_app.logger.warning(f"Model {info.name}: {problem}")
+        
+        # Reuse evaluated prompt prefixes instead of re-evaluating them
+        if backend.supports_prompt_cache:
+            self._init_prompt_cache(backend.model, info.path)
+        return backend
+    
+    def _uses_speculation(self, name):
+        """Check whether any mode generating with a model decodes speculatively."""
+        for mode, settings in current_app.config['MODES'].items():
+            if settings.get('speculative') and (settings.get('model') or self.default_model) == name:
+                return True
+        return False
+    
+    def _release_model(self, info, backend):
+        """
+        Persist a model's prompt states before the registry drops it.
+        
+        Args:
+            info (ModelInfo): The model being evicted
+            backend (InferenceBackend): The loaded model
+        """
+        self.logger.info(f"Unloading model {info.name}")
+        cache = self.prompt_caches.pop(info.name, None)
+        if cache is not None:
+            self._save_cache(info.name, cache)
+        with self._batch_lock:
+            engine = self._batch_engines.pop(info.name, None)
+        if engine is not None:
+            engine.close()
+        backend.close()
+    
+    def _model(self, mode):
+        """
+        Borrow the model configured for a mode.
+        
+        Args:
+            mode (str): The operating mode
+            
+        Returns:
+            contextmanager: Yields the loaded InferenceBackend
         """
-        if not self.model_loaded:
-            return "Model not loaded. Please check logs for details."
+        return self.registry.use(self._model_name(mode))
+    
+    def _model_name(self, mode):
+        """Get the model a mode uses, falling back to the default if it is missing."""
+        name = self._get_mode_settings(mode).get('model') or self.default_model
+        if name != self.default_model:
+            try:
+                self.registry.resolve(name)
+            except ModelNotFoundError:
+                self.logger.warning(f"Model {name} for mode {mode} not found, using default")
+                name = self.default_model
+        return name
+    
+    def _tokenizer_backend(self):
+        """Get a loaded model to count tokens with, preferring the default model."""
+        backend = self.registry.loaded(self.default_model)
+        if backend is None:
+            for name in self.registry.stats()['loaded']:
+                return self.registry.loaded(name)
+        return backend
+    
+    def _init_prompt_cache(self, model, model_path):
+        """
+        Attach a prompt state cache to a model and restore persisted states.
+        
+        Args:
+            model (Llama): The loaded model
+            model_path (str): Path of the loaded model
+        """
+        from core.prompt_cache import PromptStateCache
+        
+        capacity = current_app.config['PROMPT_CACHE_BYTES']
+        if capacity <= 0:
+            return
+        
+        cache = PromptStateCache(model_path, capacity_bytes=capacity)
+        model.set_cache(cache)
+        self.prompt_caches[os.path.basename(model_path)] = cache
         
-        # Get settings for the selected mode
-        mode_settings = current_app.config['MODES'].get(
+        cache_path = self._prompt_cache_path(os.path.basename(model_path))
+        if not cache_path:
+            return
+        try:
+            restored = cache.load(cache_path)
+            current_app.logger.info(f"Restored {restored} prompt states")
+        except Exception as e:
+            current_app.logger.error(f"Error restoring prompt states: {e}")
+    
+    def _prompt_cache_path(self, name):
+        """Get where a model's prompt states are persisted, or None if disabled."""
+        if not self._prompt_cache_dir or self._prompt_cache_persist_entries <= 0:
+            return None
+        return os.path.join(self._prompt_cache_dir, name + '.states')
+    
+    def _save_cache(self, name, cache):
+        """Persist one prompt state cache, returning the number of states written."""
+        cache_path = self._prompt_cache_path(name)
+        if not cache_path:
+            return 0
+        try:
+            return cache.save(
+                cache_path,
+                max_entries=self._prompt_cache_persist_entries
+            )
+        except Exception as e:
+            self.logger.error(f"Error saving prompt states: {e}")
+            return 0
+    
+    def save_prompt_cache(self):
+        """
+        Persist the hottest prompt states of every loaded model to disk.
+        
+        Returns:
+            int: Number of states written
+        """
+        return sum(self._save_cache(name, cache)
+                   for name, cache in list(self.prompt_caches.items()))
+    
+    def stats(self):
+        """
+        Get model registry and prompt cache statistics.
+        
+        Returns:
+            dict: Registry contents and per-model prompt cache counters
+        """
+        stats = self.registry.stats()
+        stats['default_model'] = self.default_model
+        stats['backend'] = current_app.config['MODEL_BACKEND']
+        stats['status'] = self.status()
+        stats['prompt_caches'] = {name: cache.stats()
+                                  for name, cache in list(self.prompt_caches.items())}
+        if self.completion_cache is not None:
+            stats['completion_cache'] = self.completion_cache.stats()
+        with self._batch_lock:
+            engines = list(self._batch_engines.items())
+        if engines:
+            stats['batch_engines'] = {name: engine.stats() for name, engine in engines}
+        
+        # Server backends report their request counters
+        backend_stats = {}
+        for name in stats['loaded']:
+            backend = self.registry.loaded(name)
+            if backend is not None and not backend.in_process:
+                backend_stats[name] = backend.stats()
+        if backend_stats:
+            stats['backends'] = backend_stats
+        return stats
+    
+    def _get_mode_settings(self, mode):
+        """
+        Get the generation settings for a mode.
+        
+        Args:
+            mode (str): The operating mode, which selects the model and settings
+            
+        Returns:
+            dict: The mode settings, falling back to normal mode
+        """
+        return current_app.config['MODES'].get(
             mode, 
             current_app.config['MODES']['normal']
         )
+    
+    def count_tokens(self, text):
+        """
+        Count the tokens in a piece of text using the model's tokenizer.
         
+        Args:
+            text (str): The text to measure
+            
+        Returns:
+            int: Number of tokens, estimated if no model is loaded
+        """
+        if not text:
+            return 0
+        backend = self._tokenizer_backend()
+        if backend is None:
+            return len(text) // 4 + 1
         try:
-            # Generate response
-            response = self.model(
-                prompt,
-                max_tokens=mode_settings['max_tokens'],
-                temperature=mode_settings['temperature'],
-                top_p=mode_settings['top_p'],
-                stop=["USER:"],
-                echo=False
+            return len(backend.tokenize(text, add_bos=False))
+        except Exception as e:
+            self.logger.error(f"Error counting tokens: {e}")
+            return len(text) // 4 + 1
+    
+    def _apply_tuning(self, model, mode):
+        """
+        Apply a mode's thread and batch settings to a borrowed model.
+        
+        llama.cpp uses n_threads_batch for prompts and drafted token batches
+        and n_threads for single tokens; llama-cpp-python reads n_batch on
+        every eval, so modes can share one instance.
+        
+        Args:
+            model (Llama): The borrowed model
+            mode (str): The operating mode
+            
+        Returns:
+            dict: The resolved n_threads, n_threads_batch and n_batch
+        """
+        settings = resolve_settings(current_app.config, self._get_mode_settings(mode))
+        model.n_batch = min(settings['n_batch'], self._load_batch)
+        set_threads(model, settings['n_threads'], settings['n_threads_batch'])
+        return settings
+    
+    def _drafter(self, model, mode):
+        """
+        Create the speculative decoding drafter for a generation.
+        
+        Args:
+            model (Llama): The borrowed main model
+            mode (str): The operating mode
+            
+        Returns:
+            Drafter or None: The drafter, or None to decode token by token
+        """
+        config = current_app.config
+        mode_settings = self._get_mode_settings(mode)
+        method = mode_settings.get('speculative')
+        if not method:
+            return None
+        
+        # A model loaded for another mode's settings cannot verify drafts
+        context_params = getattr(model, 'context_params', None)
+        if not getattr(context_params, 'logits_all', False):
+            self.logger.warning(f"Model for mode {mode} was not loaded for speculative decoding")
+            return None
+        
+        from core.speculative import create_drafter
+        
+        draft_model = self._draft_model() if method == 'draft' else None
+        if method == 'draft' and draft_model is None:
+            return None
+        return create_drafter(
+            method,
+            num_pred_tokens=mode_settings.get('draft_tokens') or config['SPECULATIVE_NUM_PRED_TOKENS'],
+            max_ngram_size=config['SPECULATIVE_MAX_NGRAM'],
+            draft_model=draft_model,
+            draft_lock=self._draft_lock
+        )
+    
+    def _draft_model(self):
+        """
+        Get the draft model, loading it on first use.
+        
+        Returns:
+            Llama or None: The draft model, or None if it is not configured or failed to load
+        """
+        config = current_app.config
+        path = config['MODEL_DRAFT_PATH']
+        with self._draft_lock:
+            if path in self._draft_models:
+                return self._draft_models[path]
+            
+            model = None
+            if not path or not os.path.exists(path):
+                self.logger.warning(f"Draft model not found at {path!r}, decoding without drafts")
+            else:
+                from llama_cpp import Llama
+                
+                settings = resolve_settings(config)
+                try:
+                    with span('model_load', model=os.path.basename(path), draft=True):
+                        model = run_blocking(
+                            Llama,
+                            model_path=path,
+                            n_ctx=config['MODEL_CTX_SIZE'],
+                            n_batch=self._load_batch,
+                            n_threads=settings['n_threads'],
+                            n_threads_batch=settings['n_threads_batch'],
+                            use_mmap=config['MODEL_USE_MMAP'],
+                            verbose=False
+                        )
+                    self.logger.info(f"Loaded draft model {os.path.basename(path)}")
+                except Exception as e:
+                    self.logger.error(f"Error loading draft model: {e}")
+            self._draft_models[path] = model
+            return model
+    
+    def prefill(self, text, mode='normal', client_id=None):
+        """
+        Evaluate a prompt prefix ahead of generation.
+        
+        The next completion whose prompt starts with the same text reuses the
+        evaluated tokens through llama.cpp's prefix match (in a slot of the
+        llama.cpp server), so only the remainder is evaluated when generation
+        starts.
+        
+        Args:
+            text (str): The fixed leading part of an upcoming prompt
+            mode (str): The operating mode, which selects the model
+            client_id (str): Scheduler client the work is for; unused here, since
+                callers queue in-process model work on their own scheduler
+            
+        Returns:
+            int: Number of tokens evaluated
+        """
+        # Batched sequences live in the engine's own context, not the model's
+        if not self.model_loaded or not text or current_app.config['BATCH_ENGINE_ENABLED']:
+            return 0
+        
+        try:
+            with span('prefill', mode=mode), self._model(mode) as backend:
+                if backend.in_process:
+                    self._apply_tuning(backend.model, mode)
+                return backend.prefill(text)
+        except Exception as e:
+            self.logger.error(f"Error prefilling prompt: {e}")
+            return 0
+    
+    def _completion_stream(self, prompt, mode):
+        """
+        Stream raw completion text from the mode's model, recording timings.
+        
+        The model stays borrowed, so it cannot be evicted mid-stream. Time to
+        the first token is recorded as prompt evaluation, the rest as generation.
+        With the batch engine enabled the completion runs as one of its
+        sequences; otherwise modes with a 'speculative' setting decode with a
+        drafter attached. Both need the model in this process; server
+        backends batch and schedule completions themselves.
+        
+        Args:
+            prompt (str): The input prompt
+            mode (str): The operating mode, which selects the model and settings
+            
+        Yields:
+            str: Text of each generated token
+        """
+        mode_settings = self._get_mode_settings(mode)
+        name = self._model_name(mode)
+        
+        with span('generate', mode=mode) as fields, self.registry.use(name) as backend:
+            model = backend.model
+            engine = self._batch_engine(backend, name)
+            drafter = None
+            texts = None
+            started = time.perf_counter()
+            first = None
+            tokens = 0
+            try:
+                if engine is not None:
+                    texts = engine.generate(
+                        prompt,
+                        max_tokens=mode_settings['max_tokens'],
+                        temperature=mode_settings['temperature'],
+                        top_p=mode_settings['top_p'],
+                        stop=STOP_SEQUENCES
+                    )
+                else:
+                    if backend.in_process:
+                        self._apply_tuning(model, mode)
+                        drafter = self._drafter(model, mode)
+                        if drafter is not None:
+                            model.draft_model = drafter
+                    texts = backend.complete(
+                        prompt,
+                        max_tokens=mode_settings['max_tokens'],
+                        temperature=mode_settings['temperature'],
+                        top_p=mode_settings['top_p'],
+                        stop=STOP_SEQUENCES
+                    )
+                
+                for text in texts:
+                    if first is None:
+                        # The prompt is evaluated once the first token arrives
+                        first = time.perf_counter()
+                    tokens += 1
+                    yield text
+            finally:
+                # Stopping early must stop the generation, freeing the model or sequence
+                if texts is not None:
+                    texts.close()
+                finished = time.perf_counter()
+                if first is not None:
+                    metrics.PROMPT_EVAL_SECONDS.labels(mode).observe(first - started)
+                    metrics.GENERATION_SECONDS.labels(mode).observe(finished - first)
+                metrics.TOKENS_GENERATED.labels(mode).inc(tokens)
+                prompt_eval = (first or finished) - started
+                fields.update(tokens=tokens, prompt_eval_ms=round(prompt_eval * 1000, 2),
+                              batched=engine is not None)
+                
+                # Other modes on the same model decode without drafts
+                if drafter is not None:
+                    model.draft_model = None
+                    metrics.SPECULATIVE_DRAFTED_TOKENS.labels(mode).inc(drafter.drafted)
+                    metrics.SPECULATIVE_ACCEPTED_TOKENS.labels(mode).inc(drafter.accepted)
+                    fields.update(drafted=drafter.drafted, accepted=drafter.accepted)
+    
+    def _batch_engine(self, backend, name):
+        """
+        Get the batch engine of a model, starting it on first use.
+        
+        Args:
+            backend (InferenceBackend): The borrowed model
+            name (str): The model's name
+            
+        Returns:
+            BatchEngine or None: The engine, or None if batching is disabled
+        """
+        config = current_app.config
+        if not config['BATCH_ENGINE_ENABLED'] or not backend.in_process:
+            return None
+        model = backend.model
+        
+        with self._batch_lock:
+            engine = self._batch_engines.get(name)
+            if engine is not None:
+                return engine
+            
+            # Every sequence must fit a full-size prompt and answer
+            n_ctx = max(config['BATCH_ENGINE_CTX_SIZE'], config['MODEL_CTX_SIZE'])
+            sequences = config['BATCH_ENGINE_SEQUENCES']
+            if hasattr(model, 'create_batch_backend'):
+                backend = model.create_batch_backend(sequences)
+            else:
+                settings = resolve_settings(config)
+                backend = LlamaBatchBackend(model, n_ctx, self._load_batch, settings['n_threads'],
+                                            settings['n_threads_batch'], sequences)
+            engine = self._batch_engines[name] = BatchEngine(
+                backend,
+                max_sequences=sequences,
+                n_ctx=n_ctx,
+                n_batch=self._load_batch,
+                logger=self.logger,
+                on_step=metrics.BATCH_ACTIVE_SEQUENCES.labels(name).set
             )
+            self.logger.info(f"Started batch engine for {name} with {sequences} sequences")
+            return engine
+    
+    def _cached_completion_stream(self, prompt, mode):
+        """
+        Stream a completion, replaying it from the completion cache when possible.
+        
+        Cached answers are yielded chunk by chunk, so callers see the same
+        output as a fresh generation. Only completions that ran to the end
+        are stored.
+        
+        Args:
+            prompt (str): The input prompt
+            mode (str): The operating mode, which selects the model and settings
             
-            # Extract and return the generated text
-            return response['choices'][0]['text'].strip()
+        Yields:
+            str: Text of each generated or cached token
+        """
+        cache = self.completion_cache
+        mode_settings = self._get_mode_settings(mode)
+        ttl = cache.ttl_for(mode_settings) if cache is not None else None
+        if ttl is None:
+            yield from self._completion_stream(prompt, mode)
+            return
+        
+        try:
+            model_path = self.registry.resolve(self._model_name(mode)).path
+            key = cache.key(prompt, model_path, mode_settings, STOP_SEQUENCES)
+            cached = cache.get(key)
+        except Exception as e:
+            self.logger.error(f"Completion cache error: {e}")
+            yield from self._completion_stream(prompt, mode)
+            return
+        
+        metrics.COMPLETION_CACHE_LOOKUPS.labels(mode, 'miss' if cached is None else 'hit').inc()
+        if cached is not None:
+            with span('completion_cache_hit', mode=mode, chunks=len(cached)):
+                yield from cached
+            return
+        
+        chunks = []
+        for text in self._completion_stream(prompt, mode):
+            chunks.append(text)
+            yield text
+        try:
+            cache.set(key, chunks, ttl=ttl)
+        except Exception as e:
+            self.logger.error(f"Error saving completion to cache: {e}")
+    
+    def generate_response(self, prompt, mode='normal', client_id=None):
+        """
+        Generate a response using the loaded model.
+        
+        Args:
+            prompt (str): The input prompt
+            mode (str): The operating mode, which selects the model and settings
+            client_id (str): Scheduler client the work is for, unused here
+            
+        Returns:
+            str: The generated response
+            
+        Raises:
+            GenerationError: If the model is not ready within load_wait seconds
+                or generation fails
+        """
+        if not self.wait_until_loaded(self.load_wait):
+            raise model_unavailable(self.status())
+        
+        try:
+            # Generate response, streamed internally so token timings are recorded
+            return ''.join(self._cached_completion_stream(prompt, mode)).strip()
+            
+        except Exception as e:
+            current_app.logger.error(f"Error generating response: {e}")
+            raise GenerationError() from e
+    
+    def generate_stream(self, prompt, mode='normal', client_id=None):
+        """
+        Generate a response incrementally using the loaded model.
+        
+        Text is yielded as soon as llama.cpp produces it, so the caller can
+        forward the first tokens before the completion is finished.
+        
+        Args:
+            prompt (str): The input prompt
+            mode (str): The operating mode, which selects the model and settings
+            client_id (str): Scheduler client the work is for, unused here
+            
+        Yields:
+            str: Chunks of generated text
+            
+        Raises:
+            GenerationError: If the model is not ready within load_wait seconds
+                or generation fails
+        """
+        if not self.wait_until_loaded(self.load_wait):
+            raise model_unavailable(self.status())
+        
+        try:
+            # Drop leading whitespace to match generate_response's strip()
+            started = False
+            for text in self._cached_completion_stream(prompt, mode):
+                if not started:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    started = True
+                yield text
             
         except Exception as e:
             current_app.logger.error(f"Error generating response: {e}")
-            return "Sorry, I encountered an error generating a response."
\ No newline at end of file
+            raise GenerationError() from e
@@ -0,0 +1,403 @@
+"""
+Registry of local GGUF models.
+This module discovers model files, reads their GGUF metadata without
+loading weights, and keeps loaded models in an LRU under a memory budget.
+"""
+import glob
+import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+GGUF_MAGIC = b'GGUF'
+
+# GGUF metadata value types: struct format and size of the scalar types
+_SCALAR_TYPES = {
+    0: ('<B', 1), 1: ('<b', 1), 2: ('<H', 2), 3: ('<h', 2), 4: ('<I', 4), 5: ('<i', 4),
+    6: ('<f', 4), 7: ('<?', 1), 10: ('<Q', 8), 11: ('<q', 8), 12: ('<d', 8)
+}
+_STRING = 8
+_ARRAY = 9
+
+# Arrays longer than this (tokenizer vocabularies) are summarized by length
+_MAX_ARRAY_ITEMS = 64
+
+
+class GGUFError(ValueError):
+    """Raised when a file is not a readable GGUF model."""
+
+
+class ModelNotFoundError(KeyError):
+    """Raised when a requested model is not in the registry."""
+
+
+def _read(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise GGUFError("Unexpected end of file in GGUF header")
+    return data
+
+
+def _read_string(f, length_format):
+    (length,) = struct.unpack(length_format, _read(f, struct.calcsize(length_format)))
+    return _read(f, length).decode('utf-8', errors='replace')
+
+
+def _read_value(f, value_type, length_format):
+    if value_type in _SCALAR_TYPES:
+        fmt, size = _SCALAR_TYPES[value_type]
+        return struct.unpack(fmt, _read(f, size))[0]
+    if value_type == _STRING:
+        return _read_string(f, length_format)
+    if value_type == _ARRAY:
+        (item_type,) = struct.unpack('<I', _read(f, 4))
+        (count,) = struct.unpack(length_format, _read(f, struct.calcsize(length_format)))
+        if count > _MAX_ARRAY_ITEMS:
+            _skip_array(f, item_type, count, length_format)
+            return {'type': 'array', 'length': count}
+        return [_read_value(f, item_type, length_format) for _ in range(count)]
+    raise GGUFError(f"Unknown GGUF value type {value_type}")
+
+
+def _skip_array(f, item_type, count, length_format):
+    """Move past an array without decoding its items."""
+    # Fixed-size items are skipped with one seek, strings one length at a time
+    if item_type in _SCALAR_TYPES:
+        f.seek(_SCALAR_TYPES[item_type][1] * count, os.SEEK_CUR)
+    elif item_type == _STRING:
+        length_size = struct.calcsize(length_format)
+        for _ in range(count):
+            (length,) = struct.unpack(length_format, _read(f, length_size))
+            f.seek(length, os.SEEK_CUR)
+    else:
+        for _ in range(count):
+            _read_value(f, item_type, length_format)
+
+
+def read_gguf_metadata(path):
+    """
+    Read the key/value metadata of a GGUF file without touching the weights.
+
+    Args:
+        path (str): Path to the .gguf file
+
+    Returns:
+        dict: Metadata keys and values; long arrays are replaced by their length
+
+    Raises:
+        GGUFError: If the file is not GGUF or the header is malformed
+    """
+    with open(path, 'rb') as f:
+        if _read(f, 4) != GGUF_MAGIC:
+            raise GGUFError(f"{path} is not a GGUF file")
+        (version,) = struct.unpack('<I', _read(f, 4))
+
+        # Version 1 used 32-bit counts and string lengths
+        length_format = '<I' if version == 1 else '<Q'
+        count_size = struct.calcsize(length_format)
+        (tensor_count,) = struct.unpack(length_format, _read(f, count_size))
+        (kv_count,) = struct.unpack(length_format, _read(f, count_size))
+
+        metadata = {'gguf.version': version, 'gguf.tensor_count': tensor_count}
+        for _ in range(kv_count):
+            key = _read_string(f, length_format)
+            (value_type,) = struct.unpack('<I', _read(f, 4))
+            metadata[key] = _read_value(f, value_type, length_format)
+    return metadata
+
+
+class ModelInfo:
+    """Description of a model file on disk."""
+
+    def __init__(self, path, metadata, size=None):
+        """
+        Initialize the model description.
+
+        Args:
+            path (str): Path to the .gguf file
+            metadata (dict): GGUF metadata of the file
+            size (int): File size in bytes, read from the file if None
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = os.path.getsize(path) if size is None else size
+        self.metadata = metadata
+
+        arch = metadata.get('general.architecture', 'unknown')
+        self.architecture = arch
+        self.context_length = metadata.get(f'{arch}.context_length')
+        self.layers = metadata.get(f'{arch}.block_count')
+        self.embedding_length = metadata.get(f'{arch}.embedding_length')
+        self.head_count = metadata.get(f'{arch}.attention.head_count')
+        self.head_count_kv = metadata.get(f'{arch}.attention.head_count_kv', self.head_count)
+
+    def estimate_memory(self, n_ctx):
+        """
+        Estimate resident memory once loaded: weights plus an f16 KV cache.
+
+        Args:
+            n_ctx (int): Context size the model will be loaded with
+
+        Returns:
+            int: Estimated bytes
+        """
+        kv_bytes = 0
+        if self.layers and self.embedding_length and self.head_count:
+            kv_width = self.embedding_length * self.head_count_kv // self.head_count
+            kv_bytes = 2 * self.layers * n_ctx * kv_width * 2
+        return self.size + kv_bytes
+
+    def to_dict(self):
+        """
+        Describe the model for API responses.
+
+        Returns:
+            dict: Name, size and the main architecture parameters
+        """
+        return {
+            'name': self.name,
+            'path': self.path,
+            'size': self.size,
+            'architecture': self.architecture,
+            'model_name': self.metadata.get('general.name'),
+            'context_length': self.context_length,
+            'layers': self.layers,
+            'file_type': self.metadata.get('general.file_type')
+        }
+
+
+def physical_memory():
+    """
+    Get the machine's physical memory.
+
+    Returns:
+        int or None: Bytes of RAM, or None where it cannot be determined
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class ModelRegistry:
+    """Lazily loaded models, evicted least recently used under a memory budget."""
+
+    def __init__(self, models_dir, loader, memory_budget=None, n_ctx=4096, on_evict=None):
+        """
+        Initialize the registry. Call scan() to discover models.
+
+        Args:
+            models_dir (str): Directory searched for *.gguf files
+            loader (callable): Called with a ModelInfo, returns the loaded model
+            memory_budget (int): Bytes loaded models may use, unlimited if None
+            n_ctx (int): Context size used to estimate KV cache memory
+            on_evict (callable): Called with (ModelInfo, model) before a model is dropped
+        """
+        self.models_dir = models_dir
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.n_ctx = n_ctx
+        self.on_evict = on_evict
+
+        self.models = {}
+        self._loaded = OrderedDict()
+        self._in_use = {}
+        self._loading = set()
+        self._lock = threading.RLock()
+        self._load_done = threading.Condition(self._lock)
+        self.loads = 0
+        self.evictions = 0
+
+    def scan(self):
+        """
+        Discover model files, reading metadata for new ones.
+
+        Returns:
+            list: Names of the registered models
+        """
+        for path in sorted(glob.glob(os.path.join(self.models_dir, '*.gguf'))):
+            self.register(path)
+        return list(self.models)
+
+    def register(self, path):
+        """
+        Add a model file to the registry.
+
+        Args:
+            path (str): Path to the .gguf file
+
+        Returns:
+            ModelInfo or None: The model, or None if the file is unreadable
+        """
+        name = os.path.basename(path)
+        with self._lock:
+            if name in self.models:
+                return self.models[name]
+        try:
+            info = ModelInfo(path, read_gguf_metadata(path))
+        except (OSError, GGUFError):
+            return None
+        with self._lock:
+            return self.models.setdefault(name, info)
+
+    def add(self, info):
+        """
+        Add a model described without reading its file.
+
+        Args:
+            info (ModelInfo): The model
+
+        Returns:
+            ModelInfo: The registered model of that name
+        """
+        with self._lock:
+            return self.models.setdefault(info.name, info)
+
+    def resolve(self, name):
+        """
+        Find a registered model by file name, stem or path.
+
+        Args:
+            name (str): The model reference
+
+        Returns:
+            ModelInfo: The model
+
+        Raises:
+            ModelNotFoundError: If no registered model matches
+        """
+        base = os.path.basename(name)
+        for candidate in (base, base + '.gguf'):
+            if candidate in self.models:
+                return self.models[candidate]
+        if os.path.exists(name):
+            info = self.register(name)
+            if info is not None:
+                return info
+        raise ModelNotFoundError(name)
+
+    def loaded(self, name):
+        """
+        Get a model only if it is already in memory.
+
+        Args:
+            name (str): The model reference
+
+        Returns:
+            object or None: The loaded model
+        """
+        with self._lock:
+            try:
+                info = self.resolve(name)
+            except ModelNotFoundError:
+                return None
+            return self._loaded.get(info.name)
+
+    @contextmanager
+    def use(self, name):
+        """
+        Borrow a model, loading it if needed. It is not evicted while borrowed.
+
+        Loading happens outside the registry lock, so lookups and stats stay
+        responsive; concurrent users of the same model wait for one load.
+
+        Args:
+            name (str): The model reference
+
+        Yields:
+            object: The loaded model
+        """
+        with self._lock:
+            info = self.resolve(name)
+            self._in_use[info.name] = self._in_use.get(info.name, 0) + 1
+        try:
+            yield self._ensure_loaded(info)
+        finally:
+            with self._lock:
+                self._in_use[info.name] -= 1
+                if not self._in_use[info.name]:
+                    del self._in_use[info.name]
+                    # Loads made while everything was borrowed may have overshot
+                    self._make_room(0)
+
+    def _ensure_loaded(self, info):
+        """Return a loaded model, loading it or waiting for another thread's load."""
+        with self._lock:
+            while info.name in self._loading:
+                self._load_done.wait()
+            model = self._loaded.get(info.name)
+            if model is not None:
+                self._loaded.move_to_end(info.name)
+                return model
+            self._make_room(info.estimate_memory(self.n_ctx))
+            self._loading.add(info.name)
+
+        try:
+            model = self.loader(info)
+        except Exception:
+            with self._lock:
+                self._loading.discard(info.name)
+                self._load_done.notify_all()
+            raise
+
+        with self._lock:
+            self._loading.discard(info.name)
+            self._loaded[info.name] = model
+            self.loads += 1
+            self._load_done.notify_all()
+        return model
+
+    def _make_room(self, needed):
+        """Evict idle models, oldest first, until needed bytes fit the budget."""
+        if self.memory_budget is None:
+            return
+        for name in list(self._loaded):
+            if self._resident() + needed <= self.memory_budget:
+                break
+            if name not in self._in_use:
+                self.unload(name)
+
+    def _resident(self):
+        """Estimated bytes used by loaded models and models being loaded."""
+        return sum(self.models[name].estimate_memory(self.n_ctx)
+                   for name in list(self._loaded) + list(self._loading))
+
+    def unload(self, name):
+        """
+        Drop a loaded model from memory.
+
+        Args:
+            name (str): The model reference
+
+        Returns:
+            bool: True if the model was loaded
+        """
+        with self._lock:
+            info = self.resolve(name)
+            model = self._loaded.pop(info.name, None)
+            if model is None:
+                return False
+            self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(info, model)
+        return True
+
+    def stats(self):
+        """
+        Get registry contents and memory usage.
+
+        Returns:
+            dict: Known models, loaded models, budget and load/eviction counts
+        """
+        with self._lock:
+            return {
+                'models': [info.to_dict() for info in self.models.values()],
+                'loaded': list(self._loaded),
+                'loading': sorted(self._loading),
+                'in_use': dict(self._in_use),
+                'resident_bytes': self._resident(),
+                'memory_budget': self.memory_budget,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,237 @@
+"""
+Out-of-process model server.
+This module owns the loaded models in a standalone process and serves
+generation, token counting, prefill and health requests to web workers
+over a Unix socket, streaming tokens as they are generated. A crash in
+llama.cpp takes down only this process; web workers report the model as
+unavailable and recover once it is restarted.
+
+Usage:
+    python -m core.model_server [--socket PATH]
+"""
+import argparse
+import logging
+import os
+import select
+import signal
+import socket
+import threading
+from flask import current_app
+from core.model_client import PROTOCOL_VERSION, ModelServerError, recv_frame, send_frame
+from core.scheduler import ClientQueueFullError, QueueFullError
+from utils import metrics
+from utils.tracing import TraceIdFilter, start_trace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SOCKET_PATH = os.path.join('cache', 'model_server.sock')
+
+
+class ModelServer:
+    """Serves a ModelManager to model clients over a Unix socket."""
+
+    def __init__(self, model_manager, socket_path, scheduler, app=None):
+        """
+        Initialize the server.
+
+        Args:
+            model_manager (ModelManager): The manager owning the models
+            socket_path (str): Where to listen
+            scheduler (InferenceScheduler): Orders model work from all clients
+            app (Flask): Application whose context connections are served in
+        """
+        self.model_manager = model_manager
+        self.socket_path = socket_path
+        self.scheduler = scheduler
+        self.app = app or current_app._get_current_object()
+        self.logger = self.app.logger
+        self._sock = None
+        self._stopped = threading.Event()
+        self._handlers = {
+            'health': self._health,
+            'stats': self._stats,
+            'metrics': self._metrics,
+            'count_tokens': self._count_tokens,
+            'prefill': self._prefill,
+            'generate': self._generate
+        }
+
+    def serve_forever(self):
+        """Accept connections until shutdown(), serving each on its own thread."""
+        # A socket file left by a crashed server would make the bind fail
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        sock.listen(64)
+        self._sock = sock
+        self.logger.info(f"Model server listening on {self.socket_path}")
+
+        while not self._stopped.is_set():
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_connection, args=(conn,),
+                             name='model-server-connection', daemon=True).start()
+
+    def shutdown(self):
+        """Stop accepting connections and cancel queued work."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._sock is not None:
+            self._sock.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.scheduler.shutdown()
+
+    def _serve_connection(self, conn):
+        """Read one request from a connection and answer it."""
+        with self.app.app_context():
+            try:
+                request = recv_frame(conn)
+                if request is None:
+                    return
+
+                # Continue the web request's trace in this process
+                start_trace(request.get('trace_id'))
+                handler = self._handlers.get(request.get('op'))
+                if request.get('version') != PROTOCOL_VERSION:
+                    send_frame(conn, {'error': f"Unsupported protocol version "
+                                               f"{request.get('version')}"})
+                elif handler is None:
+                    send_frame(conn, {'error': f"Unknown operation {request.get('op')!r}"})
+                else:
+                    handler(conn, request)
+            except (OSError, ModelServerError) as e:
+                self.logger.debug(f"Model client connection ended: {e}")
+            except Exception as e:
+                self.logger.error(f"Error serving model request: {e}")
+                try:
+                    send_frame(conn, {'error': str(e)})
+                except OSError:
+                    pass
+            finally:
+                conn.close()
+
+    def _health(self, conn, request):
+        send_frame(conn, {'status': self.model_manager.status(), 'pid': os.getpid(),
+                          'scheduler': self.scheduler.stats()})
+
+    def _stats(self, conn, request):
+        stats = self.model_manager.stats()
+        stats['scheduler'] = self.scheduler.stats()
+        send_frame(conn, {'stats': stats})
+
+    def _metrics(self, conn, request):
+        send_frame(conn, {'metrics': metrics.render()})
+
+    def _count_tokens(self, conn, request):
+        send_frame(conn, {'count': self.model_manager.count_tokens(request['text'])})
+
+    def _submit(self, conn, request, fn):
+        """Queue model work for a client, answering with an error if the queue is full."""
+        try:
+            return self.scheduler.submit(request.get('client') or 'anonymous', fn,
+                                         request_id=request.get('trace_id'))
+        except ClientQueueFullError as e:
+            send_frame(conn, {'error': f"Model server busy, {e.pending} requests of this "
+                                       "client waiting"})
+            return None
+        except QueueFullError as e:
+            send_frame(conn, {'error': f"Model server busy, position {e.position}"})
+            return None
+
+    def _prefill(self, conn, request):
+        job = self._submit(conn, request, lambda: [self.model_manager.prefill(
+            request['text'], request.get('mode', 'normal'))])
+        if job is not None:
+            send_frame(conn, {'tokens': sum(job.stream())})
+
+    def _generate(self, conn, request):
+        """Stream a completion, stopping when the client cancels or disconnects."""
+        job = self._submit(conn, request, lambda: self.model_manager.generate_stream(
+            request['prompt'], request.get('mode', 'normal')))
+        if job is None:
+            return
+
+        finished = False
+        try:
+            for text in job.stream():
+                if self._cancel_requested(conn):
+                    return
+                send_frame(conn, {'text': text})
+            finished = True
+            if job.error:
+                send_frame(conn, {'error': str(job.error)})
+            else:
+                send_frame(conn, {'done': True})
+        finally:
+            if not finished:
+                job.cancel()
+
+    def _cancel_requested(self, conn):
+        """Check without blocking whether the client sent a cancel frame or hung up."""
+        readable, _, _ = select.select([conn], [], [], 0)
+        if not readable:
+            return False
+        message = recv_frame(conn)
+        return message is None or message.get('op') == 'cancel'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the local model to web workers")
+    parser.add_argument('--socket', help="Unix socket path (default: MODEL_SERVER_SOCKET or "
+                                         f"{DEFAULT_SOCKET_PATH})")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from flask import Flask
+    from config import config_by_name
+    from core.model_manager import ModelManager
+    from core.scheduler import InferenceScheduler, worker_count
+    from core.tuning import apply_profile
+
+    os.chdir(ROOT)
+    app = Flask('model_server', root_path=ROOT)
+    app.config.from_object(config_by_name[os.getenv('FLASK_ENV', 'development')])
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s')
+    for handler in logging.getLogger().handlers + app.logger.handlers:
+        handler.addFilter(TraceIdFilter())
+    apply_profile(app.config, app.logger)
+    socket_path = args.socket or app.config['MODEL_SERVER_SOCKET'] or DEFAULT_SOCKET_PATH
+
+    with app.app_context():
+        model_manager = ModelManager()
+        model_manager.start_loading()
+
+        # Requests from every web worker share one fair queue
+        scheduler = InferenceScheduler(
+            max_queue_size=app.config['SCHEDULER_MAX_QUEUE'],
+            max_per_client=app.config['SCHEDULER_MAX_PER_CLIENT'],
+            app=app,
+            workers=worker_count(app.config)
+        )
+        scheduler.start()
+
+        server = ModelServer(model_manager, socket_path, scheduler, app)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Prompt state cache for reusing evaluated prompt prefixes.
+This module keeps llama.cpp states in an LRU keyed by token prefix and can
+persist the hottest entries to disk so they survive a restart.
+"""
+import os
+import pickle
+import tempfile
+from llama_cpp import LlamaRAMCache
+
+# Bump when the on-disk layout changes
+_FORMAT_VERSION = 1
+
+
+class PromptStateCache(LlamaRAMCache):
+    """LRU of llama.cpp states with a memory budget and disk persistence."""
+
+    def __init__(self, model_path, capacity_bytes=1 << 30):
+        """
+        Initialize the prompt state cache.
+
+        Args:
+            model_path (str): Path of the model the states belong to
+            capacity_bytes (int): Memory budget for cached states
+        """
+        super().__init__(capacity_bytes=capacity_bytes)
+        self.model_path = model_path
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, key):
+        """
+        Get the state with the longest prefix in common with key.
+
+        Args:
+            key (Sequence[int]): Prompt tokens
+
+        Returns:
+            LlamaState: The cached state
+
+        Raises:
+            KeyError: If no cached state shares a prefix with key
+        """
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+    def _fingerprint(self):
+        """Identify the model file so states are never loaded into another model."""
+        stat = os.stat(self.model_path)
+        return (os.path.abspath(self.model_path), stat.st_size, int(stat.st_mtime))
+
+    def save(self, path, max_entries=8):
+        """
+        Persist the most recently used states to disk.
+
+        Args:
+            path (str): File to write
+            max_entries (int): Number of hot entries to keep
+
+        Returns:
+            int: Number of entries written
+        """
+        entries = list(self.cache_state.items())[-max_entries:]
+        payload = {
+            'version': _FORMAT_VERSION,
+            'model': self._fingerprint(),
+            'entries': entries
+        }
+
+        # Write to a temporary file first so a crash never leaves a torn file
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return len(entries)
+
+    def load(self, path):
+        """
+        Load persisted states written by save().
+
+        Args:
+            path (str): File to read
+
+        Returns:
+            int: Number of entries loaded
+        """
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+
+        # Ignore files from another model or an older layout
+        if payload.get('version') != _FORMAT_VERSION or \
+                payload.get('model') != self._fingerprint():
+            return 0
+
+        for key, state in payload['entries']:
+            self[key] = state
+        return len(payload['entries'])
+
+    def stats(self):
+        """
+        Get cache usage counters.
+
+        Returns:
+            dict: Entry count, bytes used, budget and hit/miss counts
+        """
+        return {
+            'entries': len(self.cache_state),
+            'size_bytes': self.cache_size,
+            'capacity_bytes': self.capacity_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
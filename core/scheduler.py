@@ -0,0 +1,377 @@
+"""
+Inference scheduler for serializing access to the local LLM.
+This module runs model jobs on dedicated worker threads fed by a bounded,
+fair priority queue. One worker serializes model access; several workers
+feed concurrent requests to the batching engine.
+"""
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from flask import current_app
+from utils.tracing import current_trace_id, start_trace, span
+
+# Marker put on a job's output queue once it has finished
+_DONE = object()
+
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be queued because the scheduler is saturated."""
+
+    def __init__(self, position, message="Server busy"):
+        """
+        Initialize the error.
+
+        Args:
+            position (int): The position the job would have had in the queue
+            message (str): Human readable description
+        """
+        super().__init__(message)
+        self.position = position
+
+
+class ClientQueueFullError(QueueFullError):
+    """Raised when a client already has as many jobs waiting as it may."""
+
+    def __init__(self, pending, message="Too many requests waiting"):
+        """
+        Initialize the error.
+
+        Args:
+            pending (int): Number of the client's jobs already waiting
+            message (str): Human readable description
+        """
+        super().__init__(None, message)
+        self.pending = pending
+
+
+def worker_count(config, remote=False):
+    """
+    Get how many jobs the scheduler should run at the same time.
+
+    Jobs share an in-process model only through the batch engine, so without
+    it model access is serialized on one worker. A llama.cpp server runs one
+    job per parallel slot. A web worker using the model server runs several,
+    since the server queues jobs from all web workers itself.
+
+    Args:
+        config (dict): The application config
+        remote (bool): Whether jobs are sent to the model server
+
+    Returns:
+        int: Number of workers
+    """
+    if config['SCHEDULER_WORKERS']:
+        return config['SCHEDULER_WORKERS']
+    if remote:
+        return config['BATCH_ENGINE_SEQUENCES']
+    if config['MODEL_BACKEND'] == 'llama_server':
+        return config['LLAMA_SERVER_SLOTS']
+    return config['BATCH_ENGINE_SEQUENCES'] if config['BATCH_ENGINE_ENABLED'] else 1
+
+
+class InferenceJob:
+    """A unit of work executed on the scheduler's worker thread."""
+
+    def __init__(self, client_id, fn, priority=0, request_id=None):
+        """
+        Initialize the job.
+
+        Args:
+            client_id (str): Identifier of the submitting client (Socket.IO sid)
+            fn (callable): Returns an iterable of output chunks when called
+            priority (int): Lower values are scheduled first
+            request_id (str): Optional client-side request identifier
+        """
+        self.client_id = client_id
+        self.fn = fn
+        self.priority = priority
+        self.request_id = request_id
+        self.trace_id = current_trace_id()
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._cancelled = threading.Event()
+        self._chunks = queue.Queue()
+
+    @property
+    def cancelled(self):
+        """bool: Whether the job has been cancelled."""
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Cancel the job. Running jobs stop after their current chunk."""
+        self._cancelled.set()
+        self._chunks.put(_DONE)
+
+    def stream(self):
+        """
+        Iterate over the job's output as the worker produces it.
+
+        Yields:
+            str: Output chunks, until the job finishes or is cancelled
+        """
+        while True:
+            chunk = self._chunks.get()
+            if chunk is _DONE:
+                return
+            yield chunk
+
+    def result(self):
+        """
+        Wait for the job to finish and return its joined output.
+
+        Returns:
+            str: All output chunks concatenated
+        """
+        return ''.join(self.stream())
+
+
+class InferenceScheduler:
+    """Owns model execution on worker threads and queues jobs fairly."""
+
+    def __init__(self, max_queue_size=32, max_per_client=4, app=None, workers=1):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_queue_size (int): Maximum number of jobs waiting to run
+            max_per_client (int): Maximum number of waiting jobs per client
+            app (Flask): Application whose context the workers run in
+            workers (int): Jobs run at the same time; each client still runs one at a time
+        """
+        self.max_queue_size = max_queue_size
+        self.max_per_client = max_per_client
+        self.app = app or current_app._get_current_object()
+        self.workers = max(1, workers)
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._client_vtime = {}
+        self._vtime = 0
+        self._running = []
+        self._threads = []
+        self._stopped = False
+
+        # Metrics
+        self._submitted = 0
+        self._completed = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._max_depth = 0
+        self._waits = deque(maxlen=500)
+
+    def start(self):
+        """Start the worker threads."""
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'inference-worker-{i}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self):
+        """Stop the worker threads and cancel all queued jobs."""
+        with self._cond:
+            self._stopped = True
+            for _, _, _, job in self._heap:
+                job.cancel()
+            self._heap = []
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def submit(self, client_id, fn, priority=0, request_id=None):
+        """
+        Queue a job for execution.
+
+        Args:
+            client_id (str): Identifier of the submitting client
+            fn (callable): Returns an iterable of output chunks when called
+            priority (int): Lower values are scheduled first
+            request_id (str): Optional client-side request identifier
+
+        Returns:
+            InferenceJob: The queued job
+
+        Raises:
+            ClientQueueFullError: If the client's share of the queue is full
+            QueueFullError: If the queue is full
+        """
+        job = InferenceJob(client_id, fn, priority, request_id)
+
+        with self._cond:
+            depth = self._depth()
+            pending = self._pending.get(client_id, 0)
+            if pending >= self.max_per_client:
+                self._rejected += 1
+                raise ClientQueueFullError(pending)
+            if depth >= self.max_queue_size:
+                self._rejected += 1
+                raise QueueFullError(depth + 1)
+
+            # Each client's jobs are spaced one virtual tick apart, so a client
+            # flooding the queue cannot starve the others
+            vtime = max(self._vtime, self._client_vtime.get(client_id, 0)) + 1
+            self._client_vtime[client_id] = vtime
+
+            heapq.heappush(self._heap, (priority, vtime, next(self._seq), job))
+            self._pending[client_id] = self._pending.get(client_id, 0) + 1
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, depth + 1)
+            self._cond.notify()
+
+        return job
+
+    def position(self, job):
+        """
+        Get the 1-based position of a job, counting running jobs first.
+
+        Args:
+            job (InferenceJob): The job to locate
+
+        Returns:
+            int: The job's position, or 0 if it is no longer queued
+        """
+        with self._cond:
+            if job in self._running:
+                return 1
+            for entry in self._heap:
+                if entry[3] is job:
+                    ahead = sum(1 for other in self._heap
+                                if other[:3] < entry[:3] and not other[3].cancelled)
+                    return ahead + 1 + len(self._running)
+        return 0
+
+    def cancel_client(self, client_id):
+        """
+        Cancel every queued or running job belonging to a client.
+
+        Args:
+            client_id (str): Identifier of the client
+
+        Returns:
+            int: Number of jobs cancelled
+        """
+        count = 0
+        with self._cond:
+            for _, _, _, job in self._heap:
+                if job.client_id == client_id and not job.cancelled:
+                    job.cancel()
+                    count += 1
+            for job in self._running:
+                if job.client_id == client_id and not job.cancelled:
+                    job.cancel()
+                    count += 1
+            self._pending.pop(client_id, None)
+            self._client_vtime.pop(client_id, None)
+            self._cancelled += count
+        return count
+
+    def stats(self):
+        """
+        Get queue and timing metrics.
+
+        Returns:
+            dict: Queue depth, job counters and wait times in seconds
+        """
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                'queue_depth': self._depth(),
+                'max_queue_depth': self._max_depth,
+                'queue_capacity': self.max_queue_size,
+                'running': len(self._running),
+                'workers': self.workers,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'cancelled': self._cancelled,
+                'rejected': self._rejected,
+                'avg_wait': sum(waits) / len(waits) if waits else 0.0,
+                'p95_wait': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                'max_wait': waits[-1] if waits else 0.0
+            }
+
+    def _depth(self):
+        """Count waiting jobs that have not been cancelled. Caller holds the lock."""
+        return sum(1 for entry in self._heap if not entry[3].cancelled)
+
+    def _next_job(self):
+        """Block until a runnable job is available and claim it."""
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                
+                # A client's jobs run in order, so its next job waits for the running one
+                busy = {running.client_id for running in self._running}
+                deferred = []
+                job = None
+                while self._heap:
+                    _, vtime, _, candidate = entry = heapq.heappop(self._heap)
+                    if candidate.cancelled:
+                        continue
+                    if candidate.client_id in busy:
+                        deferred.append(entry)
+                        continue
+                    job = candidate
+                    break
+                for entry in deferred:
+                    heapq.heappush(self._heap, entry)
+                
+                if job is not None:
+                    self._vtime = vtime
+                    remaining = self._pending.get(job.client_id, 0) - 1
+                    if remaining > 0:
+                        self._pending[job.client_id] = remaining
+                    else:
+                        self._pending.pop(job.client_id, None)
+
+                    job.started_at = time.monotonic()
+                    self._waits.append(job.started_at - job.enqueued_at)
+                    self._running.append(job)
+                    return job
+                self._cond.wait()
+
+    def _run(self):
+        """Worker loop: execute jobs one at a time inside the app context."""
+        with self.app.app_context():
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                self._execute(job)
+
+    def _execute(self, job):
+        """Run a job, forwarding its output until it ends or is cancelled."""
+        output = None
+        
+        # Continue the submitter's trace on the worker thread
+        start_trace(job.trace_id)
+        try:
+            with span('inference_job', client=job.client_id,
+                      queued_ms=round((job.started_at - job.enqueued_at) * 1000, 2)):
+                output = iter(job.fn())
+                for chunk in output:
+                    if job.cancelled:
+                        break
+                    job._chunks.put(chunk)
+        except Exception as e:
+            job.error = e
+            current_app.logger.error(f"Inference job failed: {e}")
+        finally:
+            # Closing the generator lets llama.cpp stop generating early
+            if output is not None and hasattr(output, 'close'):
+                output.close()
+            job.finished_at = time.monotonic()
+            job._chunks.put(_DONE)
+            with self._cond:
+                self._running.remove(job)
+                if not job.cancelled:
+                    self._completed += 1
+                # Another client's or this client's next job may now run
+                self._cond.notify_all()
@@ -0,0 +1,173 @@
+"""
+Speculative decoding drafters.
+This module proposes tokens for llama-cpp-python to verify in one batch,
+either copied from earlier in the prompt (prompt lookup) or generated by a
+small draft model sharing the main model's tokenizer, and counts how many
+drafted tokens the main model accepts.
+"""
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+SPECULATIVE_METHODS = ('prompt_lookup', 'draft')
+
+
+class Drafter(LlamaDraftModel, ABC):
+    """
+    Base class of drafters that track their acceptance rate.
+
+    llama-cpp-python calls the drafter with the verified tokens so far,
+    evaluates its proposal together with the last sampled token, and keeps
+    the drafted tokens up to the first one the main model would not have
+    sampled. How many were kept shows in the length of the next call's input.
+    Subclasses implement draft().
+    """
+
+    def __init__(self, num_pred_tokens=10):
+        """
+        Initialize the drafter.
+
+        Args:
+            num_pred_tokens (int): Maximum tokens proposed per step
+        """
+        self.num_pred_tokens = num_pred_tokens
+        self.drafted = 0
+        self.accepted = 0
+        self._pending = None
+
+    def begin(self):
+        """Start a new generation, forgetting the last unverified proposal."""
+        self._pending = None
+
+    def __call__(self, input_ids, **kwargs):
+        """
+        Propose the next tokens.
+
+        Args:
+            input_ids (np.ndarray): Verified tokens, ending with the last sampled one
+            **kwargs: Unused, part of the LlamaDraftModel interface
+
+        Returns:
+            np.ndarray: Drafted token ids (intc), possibly empty
+        """
+        # Tokens accepted from the previous proposal lie between its end and the new sample
+        if self._pending is not None:
+            length, count = self._pending
+            if len(input_ids) > length:
+                self.drafted += count
+                self.accepted += min(len(input_ids) - length - 1, count)
+
+        draft = np.asarray(self.draft(input_ids), dtype=np.intc)[:self.num_pred_tokens]
+        self._pending = (len(input_ids), len(draft)) if len(draft) else None
+        return draft
+
+    @abstractmethod
+    def draft(self, input_ids):
+        """
+        Compute a proposal.
+
+        Args:
+            input_ids (np.ndarray): Verified tokens
+
+        Returns:
+            np.ndarray: Drafted token ids
+        """
+
+    def acceptance_rate(self):
+        """
+        Get the share of drafted tokens the main model accepted.
+
+        Returns:
+            float or None: Accepted over drafted, None before any draft was verified
+        """
+        return self.accepted / self.drafted if self.drafted else None
+
+
+class PromptLookupDrafter(Drafter):
+    """Drafts the tokens that followed the latest n-gram's earlier occurrence."""
+
+    def __init__(self, num_pred_tokens=10, max_ngram_size=2):
+        """
+        Initialize the prompt lookup drafter.
+
+        Args:
+            num_pred_tokens (int): Maximum tokens proposed per step
+            max_ngram_size (int): Longest trailing n-gram searched for
+        """
+        super().__init__(num_pred_tokens)
+        self.max_ngram_size = max_ngram_size
+
+    def draft(self, input_ids):
+        return LlamaPromptLookupDecoding.find_candidate_pred_tokens(
+            input_ids=input_ids,
+            max_ngram_size=self.max_ngram_size,
+            num_pred_tokens=self.num_pred_tokens
+        )
+
+
+class ModelDrafter(Drafter):
+    """Drafts greedily with a small model that shares the main model's vocabulary."""
+
+    def __init__(self, model, num_pred_tokens=10, lock=None):
+        """
+        Initialize the model drafter.
+
+        Args:
+            model (Llama): The draft model
+            num_pred_tokens (int): Maximum tokens proposed per step
+            lock (threading.Lock): Serializes use of a draft model shared by drafters
+        """
+        super().__init__(num_pred_tokens)
+        self.model = model
+        self.lock = lock or threading.Lock()
+
+    def draft(self, input_ids):
+        model = self.model
+        with self.lock:
+            # Keep the draft context up to where it diverges from the verified tokens,
+            # re-evaluating at least the last token so its logits are current
+            shared = min(model.n_tokens, len(input_ids) - 1)
+            mismatches = np.nonzero(model.input_ids[:shared] != input_ids[:shared])[0]
+            model.n_tokens = int(mismatches[0]) if len(mismatches) else shared
+            model.eval(input_ids[model.n_tokens:].tolist())
+
+            # Greedy continuation, stopping at the end of the context or of the text
+            room = model.n_ctx() - model.n_tokens - 1
+            eos = model.token_eos()
+            draft = []
+            while len(draft) < min(self.num_pred_tokens, room):
+                token = int(np.argmax(model.scores[model.n_tokens - 1]))
+                if token == eos:
+                    break
+                draft.append(token)
+                if len(draft) < self.num_pred_tokens:
+                    model.eval([token])
+            return draft
+
+
+def create_drafter(method, num_pred_tokens=10, max_ngram_size=2, draft_model=None,
+                   draft_lock=None):
+    """
+    Create a drafter for one generation.
+
+    Args:
+        method (str): 'prompt_lookup' or 'draft'
+        num_pred_tokens (int): Maximum tokens proposed per step
+        max_ngram_size (int): Longest n-gram searched for by prompt lookup
+        draft_model (Llama): The draft model, required for 'draft'
+        draft_lock (threading.Lock): Lock shared by drafters of the same draft model
+
+    Returns:
+        Drafter: The drafter
+
+    Raises:
+        ValueError: If the method is unknown or 'draft' has no draft model
+    """
+    if method == 'prompt_lookup':
+        return PromptLookupDrafter(num_pred_tokens, max_ngram_size)
+    if method == 'draft':
+        if draft_model is None:
+            raise ValueError("Speculative method 'draft' needs a draft model")
+        return ModelDrafter(draft_model, num_pred_tokens, lock=draft_lock)
+    raise ValueError(f"Unknown speculative method {method!r}, expected one of {SPECULATIVE_METHODS}")
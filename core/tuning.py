@@ -0,0 +1,241 @@
+"""
+CPU tuning for llama.cpp inference.
+This module resolves thread and batch settings, measures prompt and
+generation throughput on the host, and stores the best settings in a
+profile that is applied at startup.
+"""
+import json
+import os
+import platform
+import time
+
+# Profile entries and the Config keys they fill when those are left at 0
+PROFILE_KEYS = {
+    'n_threads': 'MODEL_THREADS',
+    'n_threads_batch': 'MODEL_THREADS_BATCH',
+    'n_batch': 'MODEL_BATCH_SIZE'
+}
+
+DEFAULT_BATCH_SIZE = 512
+
+# Filler text for benchmark prompts; the content does not affect speed
+_BENCH_TEXT = ("The quick brown fox jumps over the lazy dog while the local assistant "
+               "evaluates a long prompt to measure how fast tokens are processed. ")
+
+
+def default_threads():
+    """
+    Get llama-cpp-python's default thread count.
+
+    Returns:
+        int: Half the logical CPUs, at least 1
+    """
+    return max((os.cpu_count() or 2) // 2, 1)
+
+
+def resolve_settings(config, mode_settings=None):
+    """
+    Work out the thread and batch settings for a mode.
+
+    Per-mode values win over Config, and 0 in Config means the tuned
+    profile value or the library default.
+
+    Args:
+        config (dict): The application config
+        mode_settings (dict): Settings of the operating mode, if any
+
+    Returns:
+        dict: n_threads, n_threads_batch and n_batch
+    """
+    mode_settings = mode_settings or {}
+    n_threads = mode_settings.get('n_threads') or config['MODEL_THREADS'] or default_threads()
+    n_threads_batch = (mode_settings.get('n_threads_batch') or config['MODEL_THREADS_BATCH']
+                       or n_threads)
+    n_batch = mode_settings.get('n_batch') or config['MODEL_BATCH_SIZE'] or DEFAULT_BATCH_SIZE
+    return {'n_threads': n_threads, 'n_threads_batch': n_threads_batch, 'n_batch': n_batch}
+
+
+def set_threads(model, n_threads, n_threads_batch):
+    """
+    Change the thread counts of a loaded model.
+
+    llama.cpp fixes them when the context is created, so they are changed
+    on the context itself; models without one (the fake backend) keep them
+    as attributes.
+
+    Args:
+        model (Llama): The loaded model
+        n_threads (int): Threads for generating single tokens
+        n_threads_batch (int): Threads for prompt and batch evaluation
+    """
+    model.n_threads = n_threads
+    model.n_threads_batch = n_threads_batch
+    if hasattr(model, 'ctx'):
+        import llama_cpp
+        llama_cpp.llama_set_n_threads(model.ctx, n_threads, n_threads_batch)
+
+
+def host_fingerprint():
+    """
+    Describe the host so a profile is not applied to different hardware.
+
+    Returns:
+        dict: CPU count, machine type and processor name
+    """
+    return {
+        'cpu_count': os.cpu_count(),
+        'machine': platform.machine(),
+        'processor': platform.processor()
+    }
+
+
+def load_profile(path):
+    """
+    Read a tuning profile written by autotune().
+
+    Args:
+        path (str): Profile file
+
+    Returns:
+        dict or None: The profile, or None if missing or made on other hardware
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        profile = json.load(f)
+    if profile.get('host') != host_fingerprint():
+        return None
+    return profile
+
+
+def apply_profile(config, logger=None):
+    """
+    Fill thread and batch settings left at 0 from the tuning profile.
+
+    Args:
+        config (dict): The application config, updated in place
+        logger (Logger): Where to report what was applied
+
+    Returns:
+        dict: The settings that were applied
+    """
+    path = config.get('MODEL_PROFILE_PATH')
+    try:
+        profile = load_profile(path)
+    except (OSError, ValueError) as e:
+        if logger:
+            logger.error(f"Error reading tuning profile {path}: {e}")
+        return {}
+    if profile is None:
+        return {}
+
+    applied = {}
+    for key, config_key in PROFILE_KEYS.items():
+        if not config.get(config_key) and profile.get(key):
+            config[config_key] = applied[config_key] = profile[key]
+    if logger and applied:
+        logger.info(f"Applied tuning profile {path}: {applied}")
+    return applied
+
+
+def _candidate_threads():
+    """Thread counts worth trying: powers of two plus the half and full CPU count."""
+    cpus = os.cpu_count() or 1
+    counts = {cpus, default_threads()}
+    count = 1
+    while count < cpus:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def _measure(model, tokens, n_threads, n_batch, gen_tokens, repeat):
+    """Best prompt and generation tokens/sec for one setting."""
+    set_threads(model, n_threads, n_threads)
+    model.n_batch = n_batch
+    best_prompt = best_gen = 0.0
+    for _ in range(repeat):
+        model.reset()
+        started = time.perf_counter()
+        model.eval(tokens)
+        best_prompt = max(best_prompt, len(tokens) / (time.perf_counter() - started))
+
+        # Single-token evals are what generation spends its time on
+        started = time.perf_counter()
+        for _ in range(gen_tokens):
+            model.eval(tokens[-1:])
+        best_gen = max(best_gen, gen_tokens / (time.perf_counter() - started))
+    return best_prompt, best_gen
+
+
+def autotune(model_path, thread_counts=None, batch_sizes=None, prompt_tokens=512,
+             gen_tokens=32, repeat=2, n_ctx=2048, log=print):
+    """
+    Measure throughput across thread counts and batch sizes.
+
+    The model is loaded once with the largest batch size; smaller batches
+    and every thread count are switched on the same instance.
+
+    Args:
+        model_path (str): Model to benchmark
+        thread_counts (list): Thread counts to try, a default ladder if None
+        batch_sizes (list): Prompt batch sizes to try
+        prompt_tokens (int): Length of the benchmark prompt
+        gen_tokens (int): Tokens generated per measurement
+        repeat (int): Runs per setting; the best is kept
+        n_ctx (int): Context size to load the model with
+        log (callable): Progress output
+
+    Returns:
+        dict: Profile with the best settings and every measurement
+    """
+    from llama_cpp import Llama
+
+    thread_counts = thread_counts or _candidate_threads()
+    batch_sizes = sorted(batch_sizes or [128, 256, 512, 1024])
+    prompt_tokens = min(prompt_tokens, n_ctx - gen_tokens - 1)
+
+    model = Llama(model_path=model_path, n_ctx=n_ctx, n_batch=max(batch_sizes), verbose=False)
+    text = _BENCH_TEXT * (prompt_tokens // 10 + 1)
+    tokens = model.tokenize(text.encode('utf-8'))[:prompt_tokens]
+
+    results = []
+    for n_batch in batch_sizes:
+        for n_threads in thread_counts:
+            prompt_tps, gen_tps = _measure(model, tokens, n_threads, n_batch, gen_tokens, repeat)
+            results.append({'n_threads': n_threads, 'n_batch': n_batch,
+                            'prompt_tps': round(prompt_tps, 2), 'gen_tps': round(gen_tps, 2)})
+            log(f"threads={n_threads:<3} batch={n_batch:<5} "
+                f"prompt {prompt_tps:8.1f} tok/s  generation {gen_tps:6.1f} tok/s")
+
+    # Prompt evaluation and generation peak at different thread counts
+    best_prompt = max(results, key=lambda r: r['prompt_tps'])
+    best_gen = max(results, key=lambda r: r['gen_tps'])
+    return {
+        'host': host_fingerprint(),
+        'model': os.path.basename(model_path),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'n_threads': best_gen['n_threads'],
+        'n_threads_batch': best_prompt['n_threads'],
+        'n_batch': best_prompt['n_batch'],
+        'prompt_tps': best_prompt['prompt_tps'],
+        'gen_tps': best_gen['gen_tps'],
+        'results': results
+    }
+
+
+def save_profile(profile, path):
+    """
+    Write a tuning profile atomically.
+
+    Args:
+        profile (dict): Profile returned by autotune()
+        path (str): Destination file
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,251 @@
+"""
+Main-content extraction for fetched webpages.
+This module parses HTML incrementally, scores text blocks the way
+readability-style extractors do and stops once enough text is collected.
+"""
+import re
+from html.parser import HTMLParser
+
+# Elements whose content is never readable text. Forms are kept, since some
+# sites wrap the whole page in one, and only their controls are skipped
+SKIP_TAGS = frozenset([
+    'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'object',
+    'button', 'select', 'textarea', 'input', 'nav', 'aside', 'footer', 'head'
+])
+
+# Headers inside these hold the content's title; elsewhere they are the page banner
+SECTIONING_TAGS = frozenset(['article', 'main', 'section'])
+
+# Elements that start a new block of text
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'blockquote', 'body', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'main', 'ol', 'p', 'pre',
+    'section', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul'
+])
+
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+
+VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'param', 'source', 'track', 'wbr'
+])
+
+# Class/id patterns borrowed from Readability: unlikely candidates are dropped
+# outright unless they also look like content, the others adjust block scores
+UNLIKELY_CANDIDATES = re.compile(
+    r'banner|breadcrumb|combx|comment|community|cover-wrap|disqus|extra|footer|gdpr|'
+    r'header|legends|menu|related|remark|replies|rss|shoutbox|sidebar|skyscraper|'
+    r'social|sponsor|supplemental|ad-break|agegate|pagination|pager|popup|cookie', re.I)
+MAYBE_CANDIDATE = re.compile(r'and|article|body|column|content|main|shadow', re.I)
+POSITIVE_HINTS = re.compile(
+    r'article|body|content|entry|hentry|h-entry|main|page|pagination|post|text|blog|story',
+    re.I)
+NEGATIVE_HINTS = re.compile(
+    r'-ad-|hidden|^hid$| hid$| hid |^hid |banner|combx|comment|com-|contact|foot|footer|'
+    r'footnote|gdpr|masthead|media|meta|outbrain|promo|related|scroll|share|shoutbox|'
+    r'sidebar|skyscraper|sponsor|shopping|tags|tool|widget', re.I)
+
+# Blocks shorter than this are treated as navigation or captions
+MIN_BLOCK_CHARS = 25
+MAX_LINK_DENSITY = 0.5
+
+# Whole documents are fed in pieces so parsing can stop early
+CHUNK_CHARS = 16 * 1024
+
+
+def _class_weight(attrs):
+    """
+    Score an element's class and id against the content hints.
+
+    Args:
+        attrs (dict): The element attributes
+
+    Returns:
+        int: Positive for content-like names, negative for boilerplate
+    """
+    weight = 0
+    for name in (attrs.get('class'), attrs.get('id')):
+        if name:
+            if NEGATIVE_HINTS.search(name):
+                weight -= 1
+            if POSITIVE_HINTS.search(name):
+                weight += 1
+    return weight
+
+
+def _is_unlikely(tag, attrs):
+    """Check whether an element looks like page furniture rather than content."""
+    if tag in ('html', 'body', 'article', 'main'):
+        return False
+    names = f"{attrs.get('class') or ''} {attrs.get('id') or ''}"
+    if attrs.get('role') in ('navigation', 'complementary', 'banner', 'contentinfo'):
+        return True
+    if attrs.get('aria-hidden') == 'true' or 'hidden' in attrs:
+        return True
+    return bool(UNLIKELY_CANDIDATES.search(names)) and not MAYBE_CANDIDATE.search(names)
+
+
+class ContentExtractor(HTMLParser):
+    """Incremental HTML parser that keeps the main-content text of a page."""
+
+    def __init__(self, max_chars=3000):
+        """
+        Initialize the extractor.
+
+        Args:
+            max_chars (int): Characters of text to collect before stopping
+        """
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.done = False
+
+        self._blocks = []
+        self._length = 0
+        self._fallback = []
+        self._fallback_length = 0
+        self._pending_heading = None
+
+        # Open elements as (tag, class weight); skipped subtrees as tag names
+        self._stack = []
+        self._skip = []
+        self._weight = 0
+        self._link_depth = 0
+
+        self._text = []
+        self._link_chars = 0
+        self._block_tag = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        attrs = dict(attrs)
+        if self._skip:
+            if tag not in VOID_TAGS:
+                self._skip.append(tag)
+            return
+        if tag in SKIP_TAGS or _is_unlikely(tag, attrs) or (
+                tag == 'header' and not any(open_tag in SECTIONING_TAGS
+                                            for open_tag, _ in self._stack)):
+            if tag not in VOID_TAGS:
+                self._flush()
+                self._skip.append(tag)
+            return
+
+        if tag in BLOCK_TAGS:
+            self._flush()
+            self._block_tag = tag
+        if tag == 'a':
+            self._link_depth += 1
+        if tag not in VOID_TAGS:
+            weight = _class_weight(attrs)
+            self._stack.append((tag, weight))
+            self._weight += weight
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.done and not self._skip and tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if self._skip:
+            # Unclosed children inside a skipped subtree are closed with it
+            if tag in self._skip:
+                while self._skip.pop() != tag:
+                    pass
+            return
+
+        if tag in BLOCK_TAGS:
+            self._flush()
+            self._block_tag = None
+        if tag == 'a' and self._link_depth:
+            self._link_depth -= 1
+        if any(open_tag == tag for open_tag, _ in self._stack):
+            while True:
+                open_tag, weight = self._stack.pop()
+                self._weight -= weight
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        if self.done or self._skip:
+            return
+        self._text.append(data)
+        if self._link_depth:
+            self._link_chars += len(data.strip())
+
+    def _flush(self):
+        """Score the text collected since the last block boundary."""
+        text = ' '.join(''.join(self._text).split())
+        link_chars = self._link_chars
+        tag = self._block_tag
+        self._text = []
+        self._link_chars = 0
+        if not text:
+            return
+
+        # Headings are kept only when the content they introduce is kept
+        if tag in HEADING_TAGS:
+            self._pending_heading = text
+            return
+
+        link_density = min(link_chars / len(text), 1.0)
+        commas = text.count(',') + text.count('，')
+        score = (1 + commas + min(len(text) // 100, 3) + self._weight) * (1 - link_density)
+
+        if len(text) >= MIN_BLOCK_CHARS and link_density <= MAX_LINK_DENSITY and score >= 1:
+            if self._pending_heading:
+                self._keep(self._pending_heading)
+            self._keep(text)
+        elif self._fallback_length < self.max_chars and link_density <= MAX_LINK_DENSITY:
+            self._fallback.append(text)
+            self._fallback_length += len(text) + 1
+        self._pending_heading = None
+
+    def _keep(self, text):
+        """Add a block to the result and stop once the budget is filled."""
+        self._blocks.append(text)
+        self._length += len(text) + 1
+        if self._length > self.max_chars:
+            self.done = True
+
+    def result(self):
+        """
+        Finish parsing and return the extracted text.
+
+        Returns:
+            str: Main-content text, truncated to max_chars with a trailing "..."
+        """
+        if not self.done:
+            self.close()
+            self._flush()
+
+        # Pages with no block that scores as content fall back to all short text
+        blocks = self._blocks or self._fallback
+        text = '\n'.join(blocks)
+        return text[:self.max_chars] + "..." if len(text) > self.max_chars else text
+
+
+def extract_text(chunks, max_chars=3000):
+    """
+    Extract the main-content text of an HTML document.
+
+    Parsing stops as soon as max_chars of content have been collected, so
+    the rest of the document is never read.
+
+    Args:
+        chunks (Iterable[str]): The document, as one string or decoded pieces
+        max_chars (int): Characters of text to return
+
+    Returns:
+        str: Extracted text
+    """
+    if isinstance(chunks, str):
+        document = chunks
+        chunks = (document[i:i + CHUNK_CHARS] for i in range(0, len(document), CHUNK_CHARS))
+    extractor = ContentExtractor(max_chars)
+    for chunk in chunks:
+        extractor.feed(chunk)
+        if extractor.done:
+            break
+    return extractor.result()
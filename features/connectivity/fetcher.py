@@ -0,0 +1,215 @@
+"""
+HTTP fetch layer for web search.
+This module provides a connection-pooled HTTP client with per-host
+concurrency limits and concurrent batch fetching under a deadline.
+"""
+import codecs
+import contextvars
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a fetch could not finish before the batch deadline."""
+
+
+def _release_on_close(response, slot):
+    """
+    Release a host slot once a streamed response is closed.
+
+    Args:
+        response (requests.Response): The streamed response
+        slot (threading.BoundedSemaphore): The host slot it holds
+
+    Returns:
+        requests.Response: The same response, whose close() also frees the slot
+    """
+    close = response.close
+    released = threading.Lock()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            # Closing twice must not free the slot twice
+            if released.acquire(blocking=False):
+                slot.release()
+
+    response.close = close_and_release
+    return response
+
+
+class HttpFetcher:
+    """Keep-alive HTTP client shared by all web search requests."""
+
+    def __init__(self, headers=None, timeout=10, pool_size=20, per_host_limit=4, max_workers=8):
+        """
+        Initialize the fetcher.
+
+        Args:
+            headers (dict): Headers sent with every request
+            timeout (float): Default per-request timeout in seconds
+            pool_size (int): Keep-alive connections kept per host
+            per_host_limit (int): Maximum concurrent requests to one host
+            max_workers (int): Threads used for batch fetches
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+
+        # One session reuses TCP/TLS connections across requests
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        retries = Retry(total=1, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                        allowed_methods=frozenset(['GET', 'HEAD']))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host_limit))
+        self._host_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='http-fetch')
+
+    def _slot(self, url):
+        """Get the concurrency limiter for a URL's host."""
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._host_lock:
+            return self._host_slots[host]
+
+    def get(self, url, timeout=None, deadline=None, **kwargs):
+        """
+        Perform a GET request through the pooled session.
+
+        A streamed response (stream=True) keeps its host slot until it is
+        closed, since its body is still being downloaded.
+
+        Args:
+            url (str): The URL to fetch
+            timeout (float): Per-request timeout, defaults to the fetcher's timeout
+            deadline (float): Absolute time.monotonic() by which to give up
+            **kwargs: Extra arguments for requests.Session.get
+
+        Returns:
+            requests.Response: The response
+
+        Raises:
+            DeadlineExceeded: If the deadline passes while waiting for the host
+            requests.RequestException: On network errors
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded fetching {url}")
+
+        slot = self._slot(url)
+        waited = time.monotonic()
+        if not slot.acquire(timeout=timeout):
+            raise DeadlineExceeded(f"Deadline exceeded fetching {url}")
+        try:
+            # Time spent queued for the host counts against the timeout
+            remaining = timeout - (time.monotonic() - waited)
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded fetching {url}")
+            response = self.session.get(url, timeout=remaining, **kwargs)
+        except Exception:
+            slot.release()
+            raise
+
+        if not kwargs.get('stream'):
+            slot.release()
+            return response
+        return _release_on_close(response, slot)
+
+    def iter_text(self, response, max_bytes=2 * 1024 * 1024, chunk_size=16 * 1024, deadline=None):
+        """
+        Decode a streamed response body incrementally, up to a byte cap.
+
+        The response should come from get(..., stream=True); it is closed
+        when iteration ends, so an oversized body is never fully downloaded.
+
+        Args:
+            response (requests.Response): The streamed response
+            max_bytes (int): Maximum body bytes to read
+            chunk_size (int): Bytes read per step
+            deadline (float): Absolute time.monotonic() after which reading stops
+
+        Yields:
+            str: Decoded text pieces
+        """
+        # requests assumes ISO-8859-1 for text/* without a charset; most pages are UTF-8
+        content_type = response.headers.get('Content-Type', '').lower()
+        encoding = response.encoding if 'charset' in content_type and response.encoding else 'utf-8'
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        received = 0
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                chunk = chunk[:max_bytes - received]
+                received += len(chunk)
+                yield decoder.decode(chunk)
+                if received >= max_bytes:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+            yield decoder.decode(b'', final=True)
+        finally:
+            response.close()
+
+    def map_unordered(self, fn, urls, deadline=None):
+        """
+        Run fn(url, deadline) for many URLs concurrently.
+
+        Results are yielded in completion order, so callers can use the
+        first pages while slower ones are still downloading.
+
+        Args:
+            fn (callable): Called with (url, deadline) on a worker thread
+            urls (Iterable[str]): URLs to process
+            deadline (float): Seconds from now after which unfinished work is abandoned
+
+        Yields:
+            tuple: (url, result, error); error is None on success
+        """
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+
+        # Workers see the caller's context (e.g. the Flask app context)
+        futures = {}
+        for url in dict.fromkeys(urls):
+            context = contextvars.copy_context()
+            futures[self._executor.submit(context.run, fn, url, deadline_at)] = url
+
+        remaining = None if deadline_at is None else max(deadline_at - time.monotonic(), 0)
+        try:
+            for future in as_completed(futures, timeout=remaining):
+                url = futures.pop(future)
+                try:
+                    yield url, future.result(), None
+                except Exception as e:
+                    yield url, None, e
+        except FuturesTimeout:
+            pass
+        finally:
+            # Anything left has missed the deadline or the caller stopped early
+            for future in futures:
+                future.cancel()
+
+        for url in futures.values():
+            yield url, None, DeadlineExceeded(f"Deadline exceeded fetching {url}")
+
+    def close(self):
+        """Close pooled connections and stop the worker threads."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
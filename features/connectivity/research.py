@@ -0,0 +1,101 @@
+"""
+Web research for search-augmented answers.
+This module searches the web, reads the top result pages concurrently and
+ranks their passages against the question.
+"""
+import math
+import re
+from collections import Counter
+from features.knowledgeBase.retrieval import chunk_text
+
+_WORD = re.compile(r'\w+')
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or so that the "
+    "this to was what when where which who why will with you your".split()
+)
+
+
+def _terms(text):
+    """Lowercased content words of a text."""
+    return [word for word in _WORD.findall(text.casefold()) if word not in STOPWORDS]
+
+
+def rank_passages(query, passages, k1=1.5, b=0.75):
+    """
+    Order passages by BM25 relevance to a query.
+
+    Document frequencies come from the passages themselves, which is all
+    the corpus a single research question has.
+
+    Args:
+        query (str): The question
+        passages (list): Dicts with at least a 'text' key
+        k1 (float): BM25 term frequency saturation
+        b (float): BM25 length normalization
+
+    Returns:
+        list: The passages with a 'score' key added, best first
+    """
+    query_terms = set(_terms(query))
+    documents = [Counter(_terms(passage['text'])) for passage in passages]
+    if not documents:
+        return []
+
+    average_length = sum(sum(doc.values()) for doc in documents) / len(documents) or 1
+    frequency = Counter(term for doc in documents for term in query_terms if term in doc)
+
+    ranked = []
+    for passage, doc in zip(passages, documents):
+        length = sum(doc.values())
+        score = 0.0
+        for term in query_terms:
+            tf = doc.get(term, 0)
+            if tf:
+                idf = math.log(1 + (len(documents) - frequency[term] + 0.5) / (frequency[term] + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+        ranked.append(dict(passage, score=score))
+
+    # Stable sort keeps search-engine order among equally scored passages
+    ranked.sort(key=lambda passage: passage['score'], reverse=True)
+    return ranked
+
+
+def gather_passages(web_search, query, max_pages=3, passage_chars=500, deadline=None):
+    """
+    Search the web and collect ranked passages from the top result pages.
+
+    Pages are fetched concurrently; a page that fails or misses the
+    deadline is represented by its search snippet instead.
+
+    Args:
+        web_search (WebSearch): The web search client
+        query (str): The question
+        max_pages (int): Number of result pages to read
+        passage_chars (int): Maximum characters per passage
+        deadline (float): Seconds allowed for fetching the pages
+
+    Returns:
+        list: Dicts with title, url, text and score, best first
+    """
+    results = [result for result in web_search.search(query) if result.get('url')][:max_pages]
+    if not results:
+        return []
+
+    pages = {}
+    for url, content, error in web_search.get_webpages([r['url'] for r in results],
+                                                       deadline=deadline):
+        if error is None and content:
+            pages[url] = content
+
+    passages = []
+    for result in results:
+        content = pages.get(result['url']) or result['snippet']
+        for start, end in chunk_text(content, chunk_size=passage_chars, overlap=0):
+            passages.append({
+                'title': result['title'],
+                'url': result['url'],
+                'text': ' '.join(content[start:end].split())
+            })
+
+    return rank_passages(query, passages)
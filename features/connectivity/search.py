@@ -2,31 +2,47 @@
 Web search functionality for the Local AI Assistant.
 This module handles web searches and result processing.
 """
-import requests
-from bs4 import BeautifulSoup
 import urllib.parse
-import json
 import os
-import time
+import threading
 from flask import current_app
+from utils.caching import TwoTierCache, normalize_text
+from features.connectivity.fetcher import HttpFetcher
+from features.connectivity.extract import extract_text
+from utils import metrics
+from utils.tracing import span
+
+_web_search = None
+_web_search_lock = threading.Lock()
+
+
+class FetchError(Exception):
+    """Raised when a webpage could not be retrieved."""
+
 
 class SearchCache:
     """Cache for search results to minimize repeated web requests."""
     
-    def __init__(self, cache_dir='cache', max_age=3600):
+    def __init__(self, cache_path=os.path.join('cache', 'search_cache.sqlite'), max_age=3600,
+                 page_max_age=86400, max_memory_entries=256, max_bytes=64 * 1024 * 1024):
         """
         Initialize the search cache.
         
         Args:
-            cache_dir (str): Directory to store cache files
-            max_age (int): Maximum age of cache entries in seconds (default: 1 hour)
+            cache_path (str): SQLite file backing the persistent cache tier
+            max_age (int): Maximum age of search results in seconds (default: 1 hour)
+            page_max_age (int): Maximum age of webpage content in seconds (default: 1 day)
+            max_memory_entries (int): Entries kept in the in-process LRU
+            max_bytes (int): Size budget of the persistent tier
         """
-        self.cache_dir = cache_dir
         self.max_age = max_age
-        
-        # Create cache directory if it doesn't exist
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir)
+        self.page_max_age = page_max_age
+        self.store = TwoTierCache(
+            cache_path,
+            max_memory_entries=max_memory_entries,
+            max_bytes=max_bytes,
+            default_ttl=max_age
+        )
     
     def get(self, query):
         """
@@ -38,22 +54,7 @@ class SearchCache:
         Returns:
             dict or None: Cached results or None if not in cache or expired
         """
-        # Create a filename from the query
-        filename = os.path.join(self.cache_dir, 
-                               f"{hash(query)}.json")
-        
-        # Check if cache file exists and is not expired
-        if os.path.exists(filename):
-            # Check file age
-            file_age = time.time() - os.path.getmtime(filename)
-            if file_age < self.max_age:
-                try:
-                    with open(filename, 'r') as f:
-                        return json.load(f)
-                except:
-                    return None
-        
-        return None
+        return self._lookup('search', normalize_text(query))
     
     def save(self, query, results):
         """
@@ -63,14 +64,50 @@ class SearchCache:
             query (str): The search query
             results (dict): The search results to cache
         """
-        filename = os.path.join(self.cache_dir, 
-                               f"{hash(query)}.json")
+        try:
+            self.store.set('search', normalize_text(query), results, ttl=self.max_age)
+        except Exception as e:
+            current_app.logger.error(f"Error saving to cache: {e}")
+    
+    def get_page(self, url):
+        """
+        Get cached content for a webpage.
+        
+        Args:
+            url (str): The page URL
+            
+        Returns:
+            str or None: Cached content or None if not in cache or expired
+        """
+        return self._lookup('webpage', url.strip())
+    
+    def _lookup(self, kind, key):
+        """Get a cached value, counting the hit or miss."""
+        value = self.store.get(kind, key)
+        metrics.SEARCH_CACHE_LOOKUPS.labels(kind, 'miss' if value is None else 'hit').inc()
+        return value
+    
+    def save_page(self, url, content):
+        """
+        Save extracted webpage content to cache.
         
+        Args:
+            url (str): The page URL
+            content (str): The extracted content
+        """
         try:
-            with open(filename, 'w') as f:
-                json.dump(results, f)
+            self.store.set('webpage', url.strip(), content, ttl=self.page_max_age)
         except Exception as e:
             current_app.logger.error(f"Error saving to cache: {e}")
+    
+    def stats(self):
+        """
+        Get cache hit/miss counters.
+        
+        Returns:
+            dict: Cache statistics
+        """
+        return self.store.stats()
 
 
 class WebSearch:
@@ -78,10 +115,37 @@ class WebSearch:
     
     def __init__(self):
         """Initialize the web search module."""
-        self.cache = SearchCache()
+        config = current_app.config
+        self.cache = SearchCache(
+            cache_path=config['SEARCH_CACHE_PATH'],
+            max_age=config['SEARCH_CACHE_TTL'],
+            page_max_age=config['WEBPAGE_CACHE_TTL'],
+            max_memory_entries=config['SEARCH_CACHE_MEMORY_ENTRIES'],
+            max_bytes=config['SEARCH_CACHE_MAX_BYTES']
+        )
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.fetch_deadline = config['FETCH_DEADLINE']
+        self.max_page_bytes = config['FETCH_MAX_BYTES']
+        self.max_page_chars = config['WEBPAGE_MAX_CHARS']
+        self._fetcher_settings = {
+            'timeout': config['FETCH_TIMEOUT'],
+            'pool_size': config['FETCH_POOL_SIZE'],
+            'per_host_limit': config['FETCH_PER_HOST_LIMIT'],
+            'max_workers': config['FETCH_MAX_WORKERS']
+        }
+        self._fetcher = None
+        self._fetcher_lock = threading.Lock()
+        metrics.SEARCH_CACHE_HIT_RATIO.set_function(lambda: self.cache.stats()['hit_ratio'])
+    
+    @property
+    def fetcher(self):
+        """HttpFetcher: The HTTP client, created on first use to keep startup fast."""
+        with self._fetcher_lock:
+            if self._fetcher is None:
+                self._fetcher = HttpFetcher(headers=self.headers, **self._fetcher_settings)
+            return self._fetcher
     
     def search(self, query, use_cache=True):
         """
@@ -94,6 +158,11 @@ class WebSearch:
         Returns:
             dict: Search results with title, snippet, and URL
         """
+        with span('search', query=query):
+            return self._search(query, use_cache)
+    
+    def _search(self, query, use_cache):
+        """Run a search, going through the cache."""
         # Check cache first if enabled
         if use_cache:
             cached_results = self.cache.get(query)
@@ -106,9 +175,10 @@ class WebSearch:
         try:
             # Use DuckDuckGo as the search engine (more privacy-focused)
             search_url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote(query)}"
-            response = requests.get(search_url, headers=self.headers, timeout=10)
+            response = self.fetcher.get(search_url)
             
             if response.status_code == 200:
+                from bs4 import BeautifulSoup
                 soup = BeautifulSoup(response.text, 'html.parser')
                 
                 # Extract search results
@@ -139,40 +209,103 @@ class WebSearch:
             current_app.logger.error(f"Search error: {e}")
             return []
     
-    def get_webpage_content(self, url):
+    def get_webpage_content(self, url, use_cache=True):
         """
         Get the main content from a webpage.
         
         Args:
             url (str): The URL to fetch
+            use_cache (bool): Whether to use cached content if available
             
         Returns:
             str: Extracted main content
         """
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            return self._fetch_page(url, use_cache)
+        except FetchError as e:
+            return str(e)
+        except Exception as e:
+            return f"Error retrieving webpage: {e}"
+    
+    def get_webpages(self, urls, use_cache=True, deadline=None):
+        """
+        Get the main content of several webpages concurrently.
+        
+        Pages are yielded as soon as each one is ready, fastest first.
+        Pages still loading when the deadline passes are reported as errors.
+        
+        Args:
+            urls (list): The URLs to fetch
+            use_cache (bool): Whether to use cached content if available
+            deadline (float): Seconds allowed for the whole batch, FETCH_DEADLINE if None
             
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Remove script and style elements
-                for script in soup(["script", "style"]):
-                    script.extract()
-                
-                # Get text
-                text = soup.get_text()
-                
-                # Break into lines and remove leading/trailing space
-                lines = (line.strip() for line in text.splitlines())
-                # Break multi-headlines into a line each
-                chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                # Remove blank lines
-                text = '\n'.join(chunk for chunk in chunks if chunk)
-                
-                # Limit text length
-                return text[:3000] + "..." if len(text) > 3000 else text
+        Yields:
+            tuple: (url, content, error); content is None when error is set
+        """
+        deadline = self.fetch_deadline if deadline is None else deadline
+        
+        def fetch(url, deadline_at):
+            return self._fetch_page(url, use_cache, deadline_at)
+        
+        for url, content, error in self.fetcher.map_unordered(fetch, urls, deadline=deadline):
+            if error is not None and not isinstance(error, FetchError):
+                error = f"Error retrieving webpage: {error}"
+            yield url, content, str(error) if error is not None else None
+    
+    def _fetch_page(self, url, use_cache=True, deadline=None):
+        """
+        Fetch a webpage and extract its text, going through the cache.
+        
+        Args:
+            url (str): The URL to fetch
+            use_cache (bool): Whether to use cached content if available
+            deadline (float): Absolute time.monotonic() by which to give up
             
-            return f"Error: Could not retrieve webpage (Status code: {response.status_code})"
+        Returns:
+            str: Extracted main content
             
-        except Exception as e:
-            return f"Error retrieving webpage: {e}"
\ No newline at end of file
+        Raises:
+            FetchError: If the server did not return the page
+            requests.RequestException: On network errors
+        """
+        # Check cache first if enabled
+        if use_cache:
+            cached_content = self.cache.get_page(url)
+            if cached_content is not None:
+                return cached_content
+        
+        with span('fetch', url=url) as fields:
+            response = self.fetcher.get(url, deadline=deadline, stream=True)
+            fields['status'] = response.status_code
+            if response.status_code != 200:
+                response.close()
+                raise FetchError(f"Error: Could not retrieve webpage (Status code: {response.status_code})")
+            
+            # Only as much of the body as extraction needs is downloaded; closing
+            # the response frees its host slot even if extraction stopped early
+            try:
+                chunks = self.fetcher.iter_text(response, max_bytes=self.max_page_bytes,
+                                                deadline=deadline)
+                text = extract_text(chunks, max_chars=self.max_page_chars)
+            finally:
+                response.close()
+            fields['chars'] = len(text)
+        
+        # Only successful extractions are cached; an empty one may be an extractor miss
+        if use_cache and text:
+            self.cache.save_page(url, text)
+        return text
+
+
+def get_web_search():
+    """
+    Get the shared web search client, creating it on first use.
+    
+    Returns:
+        WebSearch: The web search client
+    """
+    global _web_search
+    with _web_search_lock:
+        if _web_search is None:
+            _web_search = WebSearch()
+        return _web_search
@@ -4,41 +4,276 @@ This module creates the database and defines its schema.
 """
 import sqlite3
 import os
+import json
 from flask import current_app
+from utils.sqlite_pool import get_pool
+
+# Expand a row's JSON tags column into normalized tag names
+_TAG_VALUES = "json_each(CASE WHEN json_valid({row}.tags) THEN {row}.tags ELSE '[]' END)"
+
+def _link_tags(row, source=''):
+    """
+    Build the statements that link rows to their tags via the join table.
+
+    Args:
+        row (str): Name of the row being linked (new, or a table name)
+        source (str): Extra FROM clause entry when linking a whole table
+
+    Returns:
+        str: SQL statements
+    """
+    values = _TAG_VALUES.format(row=row)
+    return f'''
+    INSERT OR IGNORE INTO tags (name)
+        SELECT lower(trim(j.value)) FROM {source}{values} AS j
+        WHERE j.type = 'text' AND trim(j.value) != '';
+    INSERT OR IGNORE INTO knowledge_tags (tag_id, knowledge_id)
+        SELECT tags.id, {row}.id FROM {source}{values} AS j
+        JOIN tags ON tags.name = lower(trim(j.value))
+        WHERE j.type = 'text';
+'''
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS knowledge (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tags TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_title ON knowledge(title);
+
+-- Tags are normalized into a join table; the JSON column is kept for display
+DROP INDEX IF EXISTS idx_knowledge_tags;
+
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS knowledge_tags (
+    tag_id INTEGER NOT NULL,
+    knowledge_id INTEGER NOT NULL,
+    PRIMARY KEY (tag_id, knowledge_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_tags_knowledge ON knowledge_tags(knowledge_id);
+
+-- Full-text index over title and content, stored externally in knowledge
+CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+    title, content,
+    content='knowledge', content_rowid='id',
+    tokenize='porter unicode61'
+);
+
+-- Change counter used for ETags on the knowledge listing
+CREATE TABLE IF NOT EXISTS knowledge_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO knowledge_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS knowledge_version_ai AFTER INSERT ON knowledge BEGIN
+    UPDATE knowledge_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS knowledge_version_ad AFTER DELETE ON knowledge BEGIN
+    UPDATE knowledge_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS knowledge_version_au AFTER UPDATE ON knowledge BEGIN
+    UPDATE knowledge_version SET version = version + 1 WHERE id = 1;
+END;
+
+-- Triggers keep the full-text index and tag links in sync with knowledge
+CREATE TRIGGER IF NOT EXISTS knowledge_ai AFTER INSERT ON knowledge BEGIN
+    INSERT INTO knowledge_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    {_link_tags('new')}
+END;
+
+CREATE TRIGGER IF NOT EXISTS knowledge_ad AFTER DELETE ON knowledge BEGIN
+    INSERT INTO knowledge_fts (knowledge_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    DELETE FROM knowledge_tags WHERE knowledge_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS knowledge_au AFTER UPDATE ON knowledge BEGIN
+    INSERT INTO knowledge_fts (knowledge_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    INSERT INTO knowledge_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    DELETE FROM knowledge_tags WHERE knowledge_id = new.id;
+    {_link_tags('new')}
+END;
+'''
+
+# Populate the index and tag links for rows written before they existed
+BACKFILL = f'''
+INSERT INTO knowledge_fts (knowledge_fts) VALUES ('rebuild');
+{_link_tags('knowledge', source='knowledge, ')}
+'''
+
+def create_schema(conn):
+    """
+    Create or migrate the knowledge base schema on an open connection.
+
+    Args:
+        conn (sqlite3.Connection): The database connection
+    """
+    has_index = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge_fts'"
+    ).fetchone() is not None
+
+    conn.executescript(SCHEMA)
+
+    # Index existing rows the first time the search tables are created
+    if not has_index:
+        conn.executescript(BACKFILL)
+
+    conn.commit()
+
+INSERT_ENTRY = '''
+    INSERT INTO knowledge (title, content, tags, created_at)
+    VALUES (?, ?, ?, COALESCE(?, datetime('now')))
+'''
+
+def entry_row(entry):
+    """
+    Validate a knowledge entry and convert it to INSERT_ENTRY parameters.
+    
+    Args:
+        entry (dict): Entry with content and optional title, tags, created_at
+        
+    Returns:
+        tuple: (title, content, tags_json, created_at)
+        
+    Raises:
+        ValueError: If the entry is malformed
+    """
+    if isinstance(entry, Exception):
+        raise ValueError(str(entry))
+    if not isinstance(entry, dict):
+        raise ValueError('Entry must be a JSON object')
+    
+    content = entry.get('content')
+    if not isinstance(content, str) or not content:
+        raise ValueError('No content provided')
+    
+    title = entry.get('title') or 'Untitled'
+    tags = entry.get('tags') or []
+    if isinstance(tags, str):
+        # Accept the JSON-encoded form produced by the export endpoint
+        try:
+            tags = json.loads(tags)
+        except ValueError:
+            tags = [tags]
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError('Tags must be a list of strings')
+    
+    return (str(title), content, json.dumps(tags), entry.get('created_at'))
+
+def _last_id(conn):
+    """Get the highest id ever assigned to a knowledge row."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'knowledge'").fetchone()
+    return row[0] if row else 0
+
+def _write_batch(conn, batch, errors):
+    """
+    Insert a batch of validated rows in a single transaction.
+    
+    If the batch fails as a whole it is retried row by row, so one bad row
+    only costs its own insert and is reported with its index.
+    
+    Returns:
+        list: Ids of the inserted rows
+    """
+    try:
+        with conn:
+            # Holding the write lock makes AUTOINCREMENT ids sequential
+            conn.execute('BEGIN IMMEDIATE')
+            first_id = _last_id(conn) + 1
+            conn.executemany(INSERT_ENTRY, [row for _, row in batch])
+            return list(range(first_id, _last_id(conn) + 1))
+    except sqlite3.Error:
+        pass
+    
+    ids = []
+    for index, row in batch:
+        try:
+            with conn:
+                ids.append(conn.execute(INSERT_ENTRY, row).lastrowid)
+        except sqlite3.Error as e:
+            errors.append({'index': index, 'error': str(e)})
+    return ids
+
+def bulk_insert(conn, entries, batch_size=500):
+    """
+    Insert many knowledge entries with batched, transactional writes.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection
+        entries (Iterable[dict]): Entries to insert, consumed lazily
+        batch_size (int): Number of rows per transaction
+        
+    Returns:
+        dict: Inserted ids and per-row errors keyed by input index
+    """
+    ids = []
+    errors = []
+    batch = []
+    
+    for index, entry in enumerate(entries):
+        try:
+            batch.append((index, entry_row(entry)))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        
+        if len(batch) >= batch_size:
+            ids.extend(_write_batch(conn, batch, errors))
+            batch = []
+    
+    if batch:
+        ids.extend(_write_batch(conn, batch, errors))
+    
+    errors.sort(key=lambda error: error['index'])
+    return {'ids': ids, 'errors': errors}
+
+def get_connection_pool():
+    """
+    Get the connection pool for the configured knowledge database.
+    
+    Returns:
+        ConnectionPool: The shared pool for DB_PATH
+    """
+    config = current_app.config
+    return get_pool(
+        config['DB_PATH'],
+        max_size=config['DB_POOL_SIZE'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        busy_timeout_ms=config['DB_BUSY_TIMEOUT_MS'],
+        mmap_size=config['DB_MMAP_SIZE'],
+        cache_size_kb=config['DB_CACHE_SIZE_KB']
+    )
 
 def init_db():
     """Initialize the database with required tables."""
     db_path = current_app.config['DB_PATH']
-    
+
     # Check if database directory exists
     db_dir = os.path.dirname(db_path)
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir)
-    
+
     # Connect to database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Create knowledge table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS knowledge (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        content TEXT NOT NULL,
-        tags TEXT,
-        created_at TIMESTAMP NOT NULL,
-        updated_at TIMESTAMP
-    )
-    ''')
-    
-    # Create index on title for faster searching
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_title ON knowledge(title)')
-    
-    # Create index on tags for faster filtering
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_tags ON knowledge(tags)')
-    
-    # Commit changes and close connection
-    conn.commit()
+    conn = get_connection_pool().connect()
+
+    # Create tables, indexes and triggers
+    create_schema(conn)
+
+    # Return connection to the pool
     conn.close()
-    
-    current_app.logger.info(f"Database initialized at {db_path}")
\ No newline at end of file
+
+    current_app.logger.info(f"Database initialized at {db_path}")
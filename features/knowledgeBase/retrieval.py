@@ -0,0 +1,243 @@
+"""
+Retrieval over the knowledge base for retrieval-augmented chat.
+This module chunks knowledge entries, embeds them with a local model and
+keeps the vector index in step with the knowledge table.
+"""
+import os
+import threading
+from flask import current_app
+from features.knowledgeBase.database import get_connection_pool
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def chunk_text(text, chunk_size=1000, overlap=150):
+    """
+    Split text into overlapping chunks, preferring paragraph and sentence breaks.
+
+    Args:
+        text (str): The text to split
+        chunk_size (int): Maximum characters per chunk
+        overlap (int): Characters shared between consecutive chunks
+
+    Returns:
+        list: (start, end) character offsets of each chunk
+    """
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            # Break at the last paragraph, line or sentence end in the window
+            window = text[start:end]
+            for separator in ('\n\n', '\n', '. '):
+                cut = window.rfind(separator)
+                if cut > chunk_size // 2:
+                    end = start + cut + len(separator)
+                    break
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+class Embedder:
+    """Computes sentence embeddings with a local GGUF embedding model."""
+
+    def __init__(self, model_path, n_ctx=512):
+        """
+        Load the embedding model.
+
+        Args:
+            model_path (str): Path to the GGUF embedding model
+            n_ctx (int): Context size, which bounds the length of a chunk
+        """
+        from llama_cpp import Llama
+        self.model = Llama(model_path=model_path, embedding=True, n_ctx=n_ctx, verbose=False)
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts (list): The texts to embed
+
+        Returns:
+            list: One embedding vector per text
+        """
+        with self._lock:
+            result = self.model.create_embedding(texts)
+        return [item['embedding'] for item in result['data']]
+
+
+class KnowledgeRetriever:
+    """Keeps a vector index of knowledge chunks and searches it."""
+
+    def __init__(self, pool, index_dir, embedder, chunk_size=1000, chunk_overlap=150):
+        """
+        Initialize the retriever.
+
+        Args:
+            pool (ConnectionPool): Connections to the knowledge database
+            index_dir (str): Directory of the vector index
+            embedder (Embedder): Embedding model, or None to disable retrieval
+            chunk_size (int): Maximum characters per chunk
+            chunk_overlap (int): Characters shared between consecutive chunks
+        """
+        from features.knowledgeBase.vector_index import VectorIndex
+
+        self.pool = pool
+        self.embedder = embedder
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.index = VectorIndex(index_dir) if embedder else None
+        self._write_lock = threading.Lock()
+
+    @property
+    def available(self):
+        """bool: Whether an embedding model is loaded."""
+        return self.embedder is not None
+
+    def add_entry(self, knowledge_id, title, content):
+        """
+        Index a knowledge entry, replacing any chunks it already had.
+
+        Args:
+            knowledge_id (int): The knowledge entry id
+            title (str): The entry title, prepended to every chunk
+            content (str): The entry content
+        """
+        if not self.available:
+            return
+        spans = chunk_text(content, self.chunk_size, self.chunk_overlap)
+        if not spans:
+            return
+        texts = [f"{title}\n{content[start:end]}" for start, end in spans]
+        vectors = self.embedder.embed(texts)
+        with self._write_lock:
+            self.index.remove(knowledge_id)
+            self.index.add(knowledge_id, spans, vectors)
+
+    def remove_entry(self, knowledge_id):
+        """
+        Drop a knowledge entry from the index.
+
+        Args:
+            knowledge_id (int): The knowledge entry id
+        """
+        if self.available:
+            self.index.remove(knowledge_id)
+
+    def sync(self):
+        """
+        Bring the index in line with the knowledge table.
+
+        Entries written while the app was not running are embedded, and
+        deleted entries are dropped; nothing already indexed is recomputed.
+
+        Returns:
+            int: Number of entries added or removed
+        """
+        if not self.available:
+            return 0
+
+        conn = self.pool.connect()
+        try:
+            stored = {row['id'] for row in conn.execute('SELECT id FROM knowledge')}
+            indexed = self.index.ids()
+
+            for knowledge_id in indexed - stored:
+                self.index.remove(knowledge_id)
+
+            missing = sorted(stored - indexed)
+            for knowledge_id in missing:
+                row = conn.execute('SELECT id, title, content FROM knowledge WHERE id = ?',
+                                   (knowledge_id,)).fetchone()
+                if row:
+                    self.add_entry(row['id'], row['title'], row['content'])
+        finally:
+            conn.close()
+
+        return len(indexed - stored) + len(missing)
+
+    def search(self, query, k=3, min_score=0.0):
+        """
+        Find the knowledge chunks most relevant to a query.
+
+        Args:
+            query (str): The query text
+            k (int): Maximum number of chunks
+            min_score (float): Minimum cosine similarity
+
+        Returns:
+            list: Dicts with knowledge_id, title, text and score, best first
+        """
+        if not self.available or len(self.index) == 0:
+            return []
+
+        hits = [hit for hit in self.index.search(self.embedder.embed([query])[0], k)
+                if hit[0] >= min_score]
+        if not hits:
+            return []
+
+        # Chunk text is sliced from the stored content rather than duplicated
+        ids = sorted({knowledge_id for _, knowledge_id, _, _ in hits})
+        conn = self.pool.connect()
+        try:
+            rows = conn.execute(
+                f"SELECT id, title, content FROM knowledge WHERE id IN ({', '.join('?' * len(ids))})",
+                ids
+            ).fetchall()
+        finally:
+            conn.close()
+        entries = {row['id']: row for row in rows}
+
+        results = []
+        for score, knowledge_id, start, end in hits:
+            row = entries.get(knowledge_id)
+            if row is not None:
+                results.append({
+                    'knowledge_id': knowledge_id,
+                    'title': row['title'],
+                    'text': row['content'][start:end].strip(),
+                    'score': score
+                })
+        return results
+
+
+def get_retriever():
+    """
+    Get the shared knowledge retriever, creating it on first use.
+
+    Retrieval is disabled when no embedding model is configured or found.
+
+    Returns:
+        KnowledgeRetriever: The retriever
+    """
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            config = current_app.config
+            model_path = config['EMBEDDING_MODEL_PATH']
+            embedder = None
+            if model_path and os.path.exists(model_path):
+                try:
+                    embedder = Embedder(model_path, n_ctx=config['EMBEDDING_CTX_SIZE'])
+                except Exception as e:
+                    current_app.logger.error(f"Error loading embedding model: {e}")
+            else:
+                current_app.logger.info("No embedding model found, knowledge retrieval disabled")
+
+            _retriever = KnowledgeRetriever(
+                get_connection_pool(),
+                config['KNOWLEDGE_INDEX_DIR'],
+                embedder,
+                chunk_size=config['KNOWLEDGE_CHUNK_SIZE'],
+                chunk_overlap=config['KNOWLEDGE_CHUNK_OVERLAP']
+            )
+        return _retriever
@@ -0,0 +1,244 @@
+"""
+Vector index for knowledge base retrieval.
+This module stores normalized chunk embeddings in memory-mapped NumPy files
+and answers top-k cosine similarity queries.
+"""
+import json
+import os
+import threading
+import numpy as np
+
+# Rows are (knowledge_id, start offset, end offset) of the chunk in the content
+_ROW_FIELDS = 3
+
+
+class VectorIndex:
+    """Append-only, memory-mapped matrix of unit vectors with tombstoned deletes."""
+
+    def __init__(self, directory, initial_capacity=1024):
+        """
+        Open or create an index.
+
+        Args:
+            directory (str): Directory holding the index files
+            initial_capacity (int): Number of rows allocated for a new index
+        """
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self.dim = None
+        self.count = 0
+        self.deleted = 0
+        self._vectors = None
+        self._rows = None
+        self._alive = None
+        self._entries = {}
+        self._lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.directory, 'vectors.npy')
+
+    @property
+    def _rows_path(self):
+        return os.path.join(self.directory, 'rows.npy')
+
+    def __len__(self):
+        """Number of live chunks in the index."""
+        return self.count - self.deleted
+
+    def _open(self):
+        """Map existing index files and rebuild the in-memory lookups."""
+        if not os.path.exists(self._meta_path):
+            return
+
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        self.dim = meta['dim']
+        self.count = meta['count']
+
+        self._vectors = np.load(self._vectors_path, mmap_mode='r+')
+        self._rows = np.load(self._rows_path, mmap_mode='r+')
+        self._rebuild_lookups()
+
+    def _rebuild_lookups(self):
+        """Derive the live mask and knowledge id -> rows map from the row table."""
+        ids = np.asarray(self._rows[:self.count, 0])
+        self._alive = np.zeros(len(self._rows), dtype=bool)
+        self._alive[:self.count] = ids >= 0
+        self.deleted = int(self.count - self._alive.sum())
+
+        self._entries = {}
+        for row, knowledge_id in enumerate(ids.tolist()):
+            if knowledge_id >= 0:
+                self._entries.setdefault(knowledge_id, []).append(row)
+
+    def _write_meta(self):
+        """Flush mapped arrays and atomically record the row count."""
+        self._vectors.flush()
+        self._rows.flush()
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'dim': self.dim, 'count': self.count}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _allocate(self, capacity):
+        """Create mapped arrays of the given capacity, copying existing rows."""
+        vectors_tmp = self._vectors_path + '.tmp'
+        rows_tmp = self._rows_path + '.tmp'
+        vectors = np.lib.format.open_memmap(vectors_tmp, mode='w+', dtype=np.float32,
+                                            shape=(capacity, self.dim))
+        rows = np.lib.format.open_memmap(rows_tmp, mode='w+', dtype=np.int64,
+                                         shape=(capacity, _ROW_FIELDS))
+        rows[:] = -1
+        if self._vectors is not None:
+            vectors[:self.count] = self._vectors[:self.count]
+            rows[:self.count] = self._rows[:self.count]
+        vectors.flush()
+        rows.flush()
+        del vectors, rows
+
+        os.replace(vectors_tmp, self._vectors_path)
+        os.replace(rows_tmp, self._rows_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode='r+')
+        self._rows = np.load(self._rows_path, mmap_mode='r+')
+
+        alive = np.zeros(capacity, dtype=bool)
+        if self._alive is not None:
+            alive[:self.count] = self._alive[:self.count]
+        self._alive = alive
+
+    def contains(self, knowledge_id):
+        """
+        Check whether an entry has any chunks in the index.
+
+        Args:
+            knowledge_id (int): The knowledge entry id
+
+        Returns:
+            bool: True if the entry is indexed
+        """
+        return knowledge_id in self._entries
+
+    def ids(self):
+        """
+        Get the ids of all indexed entries.
+
+        Returns:
+            set: Knowledge entry ids
+        """
+        with self._lock:
+            return set(self._entries)
+
+    def add(self, knowledge_id, spans, vectors):
+        """
+        Add the chunks of one knowledge entry.
+
+        Args:
+            knowledge_id (int): The knowledge entry id
+            spans (list): (start, end) character offsets of each chunk
+            vectors (np.ndarray): One embedding per chunk
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+
+        # Store unit vectors so a dot product is the cosine similarity
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            if self._vectors is None:
+                self._allocate(max(self.initial_capacity, len(vectors)))
+            elif self.count + len(vectors) > len(self._vectors):
+                self._allocate(max(len(self._vectors) * 2, self.count + len(vectors)))
+
+            start, end = self.count, self.count + len(vectors)
+            self._vectors[start:end] = vectors
+            self._rows[start:end, 0] = knowledge_id
+            self._rows[start:end, 1:] = np.asarray(spans, dtype=np.int64)
+            self._alive[start:end] = True
+            self._entries.setdefault(knowledge_id, []).extend(range(start, end))
+            self.count = end
+            self._write_meta()
+
+    def remove(self, knowledge_id):
+        """
+        Remove every chunk of a knowledge entry.
+
+        Args:
+            knowledge_id (int): The knowledge entry id
+
+        Returns:
+            int: Number of chunks removed
+        """
+        with self._lock:
+            rows = self._entries.pop(knowledge_id, [])
+            if not rows:
+                return 0
+            self._rows[rows, 0] = -1
+            self._alive[rows] = False
+            self.deleted += len(rows)
+
+            # Reclaim space once a quarter of the rows are tombstones
+            if self.deleted * 4 > self.count:
+                self._compact()
+            else:
+                self._write_meta()
+            return len(rows)
+
+    def _compact(self):
+        """Rewrite the index without tombstoned rows."""
+        live = np.flatnonzero(self._alive[:self.count])
+        vectors = np.array(self._vectors[live])
+        rows = np.array(self._rows[live])
+
+        self.count = len(live)
+        self._vectors[:self.count] = vectors
+        self._rows[:self.count] = rows
+        self._rows[self.count:] = -1
+        self._rebuild_lookups()
+        self._write_meta()
+
+    def search(self, query_vector, k=5):
+        """
+        Find the chunks most similar to a query.
+
+        Args:
+            query_vector (Sequence[float]): The query embedding
+            k (int): Number of results
+
+        Returns:
+            list: (score, knowledge_id, start, end) tuples, best first
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        with self._lock:
+            count = self.count
+            if count == 0 or len(self) == 0:
+                return []
+
+            scores = self._vectors[:count] @ query
+            scores[~self._alive[:count]] = -np.inf
+
+            # Partial sort: only the top k rows are ordered
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                (float(scores[i]),) + tuple(int(v) for v in self._rows[i])
+                for i in top if np.isfinite(scores[i])
+            ]
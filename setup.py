@@ -4,9 +4,9 @@ This script initializes the environment and downloads required models.
 """
 import os
 import sys
+import argparse
 import requests
 from tqdm import tqdm
-import sqlite3
 import dotenv
 
 def setup_environment():
@@ -66,8 +66,8 @@ def download_model():
             os.remove(model_path)
         return False
 
-def init_database():
-    """Initialize the SQLite database."""
+def get_db_path():
+    """Get the database path for the current FLASK_ENV."""
     from dotenv import load_dotenv
     load_dotenv()
     
@@ -76,39 +76,113 @@ def init_database():
     
     # Determine database path based on environment
     if flask_env == 'testing':
-        db_path = 'test_knowledge.sqlite'
-    else:
-        db_path = 'knowledge.sqlite'
+        return 'test_knowledge.sqlite'
+    return 'knowledge.sqlite'
+
+def init_database():
+    """Initialize the SQLite database."""
+    db_path = get_db_path()
     
     print(f"Initializing database at {db_path}...")
     
-    # Connect to database and create tables
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Create knowledge table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS knowledge (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        content TEXT NOT NULL,
-        tags TEXT,
-        created_at TIMESTAMP NOT NULL,
-        updated_at TIMESTAMP
-    )
-    ''')
-    
-    # Create indexes
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_title ON knowledge(title)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_tags ON knowledge(tags)')
-    
-    # Commit changes and close connection
-    conn.commit()
+    # Connect to database and create tables, search index and triggers
+    from features.knowledgeBase.database import create_schema
+    from utils.sqlite_pool import get_pool
+    conn = get_pool(db_path).connect()
+    create_schema(conn)
     conn.close()
     
     print("Database initialized successfully")
 
-if __name__ == "__main__":
+def read_knowledge_files(directory, tags=None):
+    """
+    Read markdown and text files as knowledge entries.
+    
+    Args:
+        directory (str): Directory searched recursively
+        tags (list): Tags applied to every entry
+        
+    Yields:
+        dict: Entry with title, content and tags
+    """
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.lower().endswith(('.md', '.markdown', '.txt')):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                yield ValueError(f"{path}: {e}")
+                continue
+            
+            # Use the first markdown heading as the title, else the file name
+            title = os.path.splitext(name)[0]
+            for line in content.splitlines():
+                if line.startswith('# '):
+                    title = line[2:].strip()
+                    break
+            
+            yield {'title': title, 'content': content, 'tags': tags or []}
+
+def import_knowledge(directory, tags=None, batch_size=500):
+    """
+    Import a directory of markdown/text files into the knowledge base.
+    
+    Args:
+        directory (str): Directory searched recursively
+        tags (list): Tags applied to every entry
+        batch_size (int): Number of rows per transaction
+    """
+    from features.knowledgeBase.database import create_schema, bulk_insert
+    from utils.sqlite_pool import get_pool
+    
+    db_path = get_db_path()
+    print(f"Importing {directory} into {db_path}...")
+    
+    conn = get_pool(db_path).connect()
+    create_schema(conn)
+    result = bulk_insert(conn, read_knowledge_files(directory, tags), batch_size=batch_size)
+    conn.close()
+    
+    for error in result['errors']:
+        print(f"  Skipped file #{error['index']}: {error['error']}")
+    print(f"Imported {len(result['ids'])} entries ({len(result['errors'])} errors)")
+    print("The vector index is updated the next time the application starts")
+
+def autotune_model(model_path, thread_counts, batch_sizes, prompt_tokens, gen_tokens, repeat, output):
+    """
+    Benchmark thread and batch settings and save the best as a tuning profile.
+    
+    Args:
+        model_path (str): Model to benchmark
+        thread_counts (list): Thread counts to try, a default ladder if empty
+        batch_sizes (list): Prompt batch sizes to try, defaults if empty
+        prompt_tokens (int): Length of the benchmark prompt
+        gen_tokens (int): Tokens generated per measurement
+        repeat (int): Runs per setting
+        output (str): Profile file to write
+    """
+    from core.tuning import autotune, save_profile
+    
+    if not os.path.exists(model_path):
+        print(f"Model not found: {model_path}")
+        sys.exit(1)
+    
+    print(f"Tuning {model_path} on {os.cpu_count()} CPUs")
+    profile = autotune(model_path, thread_counts or None, batch_sizes or None,
+                       prompt_tokens=prompt_tokens, gen_tokens=gen_tokens, repeat=repeat)
+    save_profile(profile, output)
+    
+    print(f"\nBest generation: {profile['n_threads']} threads ({profile['gen_tps']} tok/s)")
+    print(f"Best prompt evaluation: {profile['n_threads_batch']} threads, "
+          f"batch {profile['n_batch']} ({profile['prompt_tps']} tok/s)")
+    print(f"Profile saved to {output}; it is applied when MODEL_THREADS, "
+          f"MODEL_THREADS_BATCH or MODEL_BATCH_SIZE are unset")
+
+def run_setup():
+    """Run the interactive first-time setup."""
     print("=== Local AI Assistant Setup ===")
     
     # Set up environment
@@ -123,4 +197,44 @@ if __name__ == "__main__":
         download_model()
     
     print("\nSetup complete! You can now run the application with:")
-    print("python app.py")
\ No newline at end of file
+    print("python app.py")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local AI Assistant setup and maintenance")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    import_parser = subparsers.add_parser('import-knowledge',
+                                          help="Import markdown/text files into the knowledge base")
+    import_parser.add_argument('directory', help="Directory containing .md/.txt files")
+    import_parser.add_argument('--tags', default='', help="Comma separated tags for every entry")
+    import_parser.add_argument('--batch-size', type=int, default=500,
+                               help="Rows per transaction (default: 500)")
+    
+    from config import Config
+    autotune_parser = subparsers.add_parser('autotune',
+                                            help="Find the fastest thread and batch settings for this CPU")
+    autotune_parser.add_argument('--model', default=Config.MODEL_PATH, help="Model file to benchmark")
+    autotune_parser.add_argument('--threads', default='',
+                                 help="Comma separated thread counts (default: 1, 2, 4, ... up to all CPUs)")
+    autotune_parser.add_argument('--batch-sizes', default='128,256,512,1024',
+                                 help="Comma separated prompt batch sizes")
+    autotune_parser.add_argument('--prompt-tokens', type=int, default=512,
+                                 help="Prompt length to evaluate (default: 512)")
+    autotune_parser.add_argument('--gen-tokens', type=int, default=32,
+                                 help="Tokens to generate per measurement (default: 32)")
+    autotune_parser.add_argument('--repeat', type=int, default=2, help="Runs per setting (default: 2)")
+    autotune_parser.add_argument('--output', default=Config.MODEL_PROFILE_PATH,
+                                 help="Where to save the profile")
+    
+    args = parser.parse_args()
+    
+    if args.command == 'import-knowledge':
+        tags = [tag.strip() for tag in args.tags.split(',') if tag.strip()]
+        import_knowledge(args.directory, tags, args.batch_size)
+    elif args.command == 'autotune':
+        threads = [int(n) for n in args.threads.split(',') if n.strip()]
+        batch_sizes = [int(n) for n in args.batch_sizes.split(',') if n.strip()]
+        autotune_model(args.model, threads, batch_sizes, args.prompt_tokens,
+                       args.gen_tokens, args.repeat, args.output)
+    else:
+        run_setup()
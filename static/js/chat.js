@@ -14,20 +14,49 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // State variables
     let voiceMode = false;
+    let modelStatusElement = null;
+    const pendingResponses = {};
     
-    // Initialize Socket.IO connection
-    const socket = io();
+    // Initialize Socket.IO connection, presenting the conversation token on every (re)connect
+    const socket = io({
+        auth: (callback) => callback({session_token: sessionStorage.getItem('chatSessionToken')})
+    });
     
     // Socket.IO event handlers
     socket.on('connect', function() {
         console.log('Connected to server');
     });
     
+    // The server names the conversation; keep its token across page reloads
+    socket.on('session', function(data) {
+        sessionStorage.setItem('chatSessionToken', data.session_token);
+    });
+    
     socket.on('disconnect', function() {
         console.log('Disconnected from server');
         addSystemMessage('Disconnected from server. Please refresh the page.');
     });
     
+    socket.on('model_status', function(status) {
+        // Keep a single status line that tracks the model while it loads
+        let text = null;
+        if (status.state === 'loading') {
+            text = `Loading model ${status.model}... ${Math.round(status.progress * 100)}%`;
+        } else if (status.state === 'failed') {
+            text = `Model failed to load: ${status.error}`;
+        } else if (modelStatusElement) {
+            text = `Model ready (${status.load_time.toFixed(1)}s).`;
+        }
+        if (text === null) {
+            return;
+        }
+        if (!modelStatusElement) {
+            modelStatusElement = addSystemMessage(text);
+        } else {
+            modelStatusElement.textContent = text;
+        }
+    });
+    
     socket.on('response', function(data) {
         // Remove typing indicator and add the response
         removeTypingIndicator();
@@ -35,6 +64,56 @@ document.addEventListener('DOMContentLoaded', function() {
         scrollToBottom();
     });
     
+    socket.on('queued', function(data) {
+        addSystemMessage(`Waiting for the model, position ${data.position} in queue.`);
+    });
+    
+    socket.on('server_busy', function(data) {
+        removeTypingIndicator();
+        addSystemMessage(data.message);
+    });
+    
+    socket.on('response_chunk', function(data) {
+        // Start a new assistant message on the first chunk of a request
+        let pending = pendingResponses[data.request_id];
+        if (!pending) {
+            removeTypingIndicator();
+            pending = {text: '', element: addAssistantMessage('')};
+            pendingResponses[data.request_id] = pending;
+        }
+        
+        // Append the chunk and re-render the accumulated markdown
+        pending.text += data.chunk;
+        pending.element.innerHTML = marked.parse(pending.text);
+        scrollToBottom();
+    });
+    
+    socket.on('response_error', function(data) {
+        // Keep any partial answer and explain why it stopped
+        delete pendingResponses[data.request_id];
+        removeTypingIndicator();
+        addSystemMessage(data.message);
+        scrollToBottom();
+    });
+    
+    socket.on('response_done', function(data) {
+        let pending = pendingResponses[data.request_id];
+        delete pendingResponses[data.request_id];
+        
+        // Render the final text in case no chunks arrived
+        if (!pending) {
+            removeTypingIndicator();
+            pending = {element: addAssistantMessage('')};
+        }
+        pending.element.innerHTML = marked.parse(data.response);
+        
+        // Apply syntax highlighting once the message is complete
+        pending.element.querySelectorAll('pre code').forEach((block) => {
+            hljs.highlightElement(block);
+        });
+        scrollToBottom();
+    });
+    
     // Event listeners
     sendButton.addEventListener('click', sendMessage);
     userInput.addEventListener('keypress', function(e) {
@@ -45,6 +124,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     clearChatButton.addEventListener('click', function() {
         chatContainer.innerHTML = '';
+        socket.emit('clear_history', {});
         addSystemMessage('Chat history cleared.');
     });
     
@@ -81,7 +161,9 @@ document.addEventListener('DOMContentLoaded', function() {
             // Send message to server via Socket.IO
             socket.emit('chat_message', {
                 message: message,
-                mode: mode
+                mode: mode,
+                request_id: createRequestId(),
+                stream: true
             });
             
             // Add typing indicator
@@ -92,6 +174,14 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    /**
+     * Create a unique id used to match streamed chunks to a request
+     * @returns {string} The request id
+     */
+    function createRequestId() {
+        return Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
+    }
+    
     /**
      * Add a user message to the chat
      * @param {string} message - The message text
@@ -106,6 +196,7 @@ document.addEventListener('DOMContentLoaded', function() {
     /**
      * Add an assistant message to the chat
      * @param {string} message - The message text (markdown supported)
+     * @returns {HTMLElement} The created message element
      */
     function addAssistantMessage(message) {
         // Create message element
@@ -122,11 +213,13 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Add to chat
         chatContainer.appendChild(messageDiv);
+        return messageDiv;
     }
     
     /**
      * Add a system message to the chat
      * @param {string} message - The message text
+     * @returns {HTMLElement} The created message element
      */
     function addSystemMessage(message) {
         const messageDiv = document.createElement('div');
@@ -134,6 +227,7 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.textContent = message;
         chatContainer.appendChild(messageDiv);
         scrollToBottom();
+        return messageDiv;
     }
     
     /**
@@ -0,0 +1,9 @@
+"""
+Shared test setup.
+This module puts the repository root on the import path so tests import
+the application packages the way app.py does.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,134 @@
+"""
+Tests for the agent pool's peer authentication and URL allowlist, and for
+the signed session tokens clients chat with.
+"""
+import pytest
+from flask import Flask, request
+from api.chat import chat_endpoint, clear_endpoint
+from core.agent_pool import FORWARDED_HEADER, TOKEN_HEADER, AgentPool, PeerRejected
+
+SEED = 'http://10.0.0.2:3000'
+TOKEN = 'pool-secret'
+
+
+def describe():
+    return {'name': 'Test', 'modes': ['normal'], 'model': 'fake.gguf', 'ready': True,
+            'queue_depth': 0, 'running': 0, 'workers': 1}
+
+
+def make_pool(**kwargs):
+    return AgentPool('local', 'http://10.0.0.1:3000', describe, TOKEN, seeds=[SEED], **kwargs)
+
+
+def announcement(url, agent_id='peer'):
+    return {'agent_id': agent_id, 'url': url, 'modes': ['normal'], 'ready': True,
+            'queue_depth': 0, 'workers': 64}
+
+
+def test_pool_requires_token():
+    with pytest.raises(ValueError):
+        AgentPool('local', 'http://10.0.0.1:3000', describe, '')
+
+
+def test_authorized_checks_token():
+    pool = make_pool()
+    assert pool.authorized({TOKEN_HEADER: TOKEN})
+    assert not pool.authorized({TOKEN_HEADER: 'wrong'})
+    assert not pool.authorized({})
+
+
+def test_receive_rejects_unknown_url():
+    pool = make_pool()
+    with pytest.raises(PeerRejected):
+        pool.receive(announcement('http://attacker.example'))
+    assert pool.route('normal', 'session-abc') is None
+
+
+def test_receive_accepts_seed_and_allowed_urls():
+    pool = make_pool(allowed_urls=['http://10.0.0.3:3000/'])
+    pool.receive(announcement(SEED + '/', 'seed'))
+    pool.receive(announcement('http://10.0.0.3:3000', 'allowed'))
+    assert {peer.agent_id for peer in pool.live_peers()} == {'seed', 'allowed'}
+
+
+class Processor:
+    """Chat processor answering every message with its text."""
+
+    def __init__(self, agent_pool):
+        self.agent_pool = agent_pool
+        self.cleared = []
+        self.conversations = self
+
+    def forward_message_stream(self, message, mode, session_id):
+        return None
+
+    def process_message_stream(self, message, mode, session_id, client_id=None):
+        self.session_id = session_id
+        yield message
+
+    def clear(self, session_id):
+        self.cleared.append(session_id)
+
+    def clear_conversation(self, session_id):
+        self.cleared.append(session_id)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config.update(MODES={'normal': {}}, AGENT_ID='local', SECRET_KEY='test-secret')
+    processor = Processor(make_pool())
+    app.processor = processor
+
+    @app.route('/api/chat', methods=['POST'])
+    def chat():
+        return chat_endpoint(request, processor)
+
+    @app.route('/api/chat/clear', methods=['POST'])
+    def chat_clear():
+        return clear_endpoint(request, processor)
+
+    return app.test_client()
+
+
+def test_forwarded_chat_requires_token(client):
+    body = {'message': 'hello', 'session_id': 's1'}
+    assert client.post('/api/chat', json=body,
+                       headers={FORWARDED_HEADER: 'peer'}).status_code == 403
+    response = client.post('/api/chat', json=body,
+                           headers={FORWARDED_HEADER: 'peer', TOKEN_HEADER: TOKEN})
+    assert response.status_code == 200
+    assert response.get_json()['response'] == 'hello'
+
+
+def test_forwarded_clear_requires_token(client):
+    body = {'session_id': 's1'}
+    assert client.post('/api/chat/clear', json=body,
+                       headers={FORWARDED_HEADER: 'peer'}).status_code == 403
+    assert client.post('/api/chat/clear', json=body,
+                       headers={FORWARDED_HEADER: 'peer', TOKEN_HEADER: TOKEN}).status_code == 200
+
+
+def test_chat_issues_and_continues_session(client):
+    first = client.post('/api/chat', json={'message': 'hello'}).get_json()
+    session_id = client.application.processor.session_id
+    assert first['session_token'] and session_id
+    second = client.post('/api/chat', json={'message': 'again',
+                                            'session_token': first['session_token']})
+    assert second.status_code == 200
+    assert client.application.processor.session_id == session_id
+
+
+def test_client_cannot_choose_session(client):
+    response = client.post('/api/chat', json={'message': 'hello', 'session_token': 'forged'})
+    assert response.status_code == 400
+    response = client.post('/api/chat', json={'message': 'hello', 'session_id': 's1'})
+    assert client.application.processor.session_id != 's1'
+    assert client.post('/api/chat/clear', json={'session_id': 's1'}).status_code == 400
+    assert client.application.processor.cleared == []
+
+
+def test_clear_with_session_token(client):
+    token = client.post('/api/chat', json={'message': 'hello'}).get_json()['session_token']
+    assert client.post('/api/chat/clear', json={'session_token': token}).status_code == 200
+    assert client.application.processor.cleared == [client.application.processor.session_id]
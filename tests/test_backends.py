@@ -0,0 +1,73 @@
+"""
+Tests for the inference backend interface.
+"""
+import pytest
+from flask import Flask
+from config import TestingConfig
+from core.backends import BACKENDS, InferenceBackend, LlamaServerBackend, backend_class
+from core.model_manager import ModelManager
+
+
+class NoCompleteBackend(InferenceBackend):
+    """Backend that forgot to implement complete()."""
+
+    @classmethod
+    def load(cls, info, config, n_batch, logits_all=False):
+        return cls()
+
+    def tokenize(self, text, add_bos=True):
+        return []
+
+
+def test_incomplete_backend_cannot_be_instantiated():
+    with pytest.raises(TypeError, match='complete'):
+        NoCompleteBackend.load(None, {}, 512)
+    with pytest.raises(TypeError):
+        InferenceBackend()
+
+
+def test_registered_backends_are_complete():
+    for backend in BACKENDS.values():
+        assert not backend.__abstractmethods__
+    server = LlamaServerBackend('http://127.0.0.1:8080/')
+    assert server.url == 'http://127.0.0.1:8080'
+    server.close()
+
+
+def test_unknown_backend_name():
+    with pytest.raises(ValueError, match='MODEL_BACKEND'):
+        backend_class('nope')
+
+
+@pytest.fixture
+def fake_app(tmp_path):
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config.update(
+        MODEL_BACKEND='fake',
+        MODEL_PATH=str(tmp_path / 'missing.gguf'),
+        MODELS_DIR=str(tmp_path),
+        MODEL_PROFILE_PATH=str(tmp_path / 'profile.json'),
+        PROMPT_CACHE_DIR=str(tmp_path / 'prompt_cache'),
+        COMPLETION_CACHE_ENABLED=False,
+        FAKE_MODEL_PROMPT_TPS=1e6,
+        FAKE_MODEL_GEN_TPS=1e6
+    )
+    with app.app_context():
+        yield app
+
+
+def test_fake_backend_needs_no_model_file(fake_app):
+    manager = ModelManager()
+    manager.start_loading().join()
+    assert manager.status()['state'] == 'ready'
+    assert ''.join(manager.generate_stream("USER: hi\nASSISTANT:"))
+
+
+def test_prefill_reuses_evaluated_prefix(fake_app):
+    manager = ModelManager()
+    manager.start_loading().join()
+    prompt = "USER: tell me about caching\nASSISTANT:"
+    evaluated = manager.prefill(prompt)
+    assert evaluated >= manager.count_tokens(prompt)
+    assert 0 < manager.prefill(prompt + " Sure") < evaluated
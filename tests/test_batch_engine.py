@@ -0,0 +1,89 @@
+"""
+Tests for the continuous batching engine.
+"""
+import numpy as np
+import pytest
+from core.batch_engine import BatchEngine, sample
+from core.fake_model import FakeBatchBackend, FakeLlama
+
+
+class RandomLogitsBackend(FakeBatchBackend):
+    """Fake backend returning random logits over a large vocabulary."""
+
+    def __init__(self, model, max_sequences=8, vocab=32000, seed=0):
+        super().__init__(model, max_sequences)
+        self.vocab = vocab
+        self.rng = np.random.default_rng(seed)
+
+    def decode(self, entries):
+        return [self.rng.normal(size=self.vocab).astype(np.float32)
+                for _, _, _, wants_logits in entries if wants_logits]
+
+    def detokenize(self, tokens):
+        return b' x'
+
+
+class FailingDetokenizeBackend(FakeBatchBackend):
+    """Fake backend that cannot turn the sampled tokens of one prompt into text."""
+
+    def __init__(self, model, failing_seq_ids=(), max_sequences=8):
+        super().__init__(model, max_sequences)
+        self.failing_seq_ids = set(failing_seq_ids)
+        self._last_seq_ids = []
+
+    def decode(self, entries):
+        self._last_seq_ids = [seq_id for seq_id, _, _, wants_logits in entries if wants_logits]
+        return super().decode(entries)
+
+    def detokenize(self, tokens):
+        if self.failing_seq_ids & set(self._last_seq_ids):
+            self.failing_seq_ids.clear()
+            raise ValueError("bad token")
+        return super().detokenize(tokens)
+
+
+def fake_model():
+    return FakeLlama('fake.gguf', n_ctx=4096, prompt_tps=1e6, gen_tps=1e6, reply_tokens=8)
+
+
+@pytest.mark.parametrize('top_p', [1.0, 0.95, 0.5])
+def test_sample_handles_any_top_p(top_p):
+    rng = np.random.default_rng(1)
+    for _ in range(500):
+        logits = rng.normal(size=32000).astype(np.float32)
+        token = sample(logits, 0.8, top_p, rng)
+        assert 0 <= token < len(logits)
+
+
+def test_sample_greedy_picks_most_likely():
+    logits = np.array([0.1, 3.0, 0.5], dtype=np.float32)
+    assert sample(logits, 0, 1.0, np.random.default_rng()) == 1
+
+
+def test_engine_finishes_with_top_p_one():
+    engine = BatchEngine(RandomLogitsBackend(fake_model()), max_sequences=4, n_ctx=4096)
+    try:
+        requests = [engine.submit(f"prompt {n}", max_tokens=50, temperature=1.0, top_p=1.0)
+                    for n in range(4)]
+        for request in requests:
+            assert len(list(request.stream())) == 50
+            assert request.finish_reason == 'length'
+    finally:
+        engine.close()
+
+
+def test_sampling_error_fails_only_its_request():
+    engine = BatchEngine(FailingDetokenizeBackend(fake_model(), failing_seq_ids=[0]),
+                         max_sequences=1, n_ctx=4096)
+    try:
+        failed = engine.submit("first prompt", max_tokens=8)
+        with pytest.raises(ValueError):
+            list(failed.stream())
+        assert failed.finish_reason == 'error'
+
+        # The engine keeps serving later requests
+        request = engine.submit("second prompt", max_tokens=8)
+        assert ''.join(request.stream())
+        assert request.finish_reason in ('stop', 'length')
+    finally:
+        engine.close()
@@ -0,0 +1,32 @@
+"""
+Tests for the two-tier cache.
+"""
+import sqlite3
+import time
+from utils.caching import ACCESS_TIME_GRANULARITY, TwoTierCache, cache_key
+
+
+def accessed_at(path, key):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT accessed_at FROM cache_entries WHERE key = ?',
+                            (key,)).fetchone()[0]
+
+
+def test_disk_hits_refresh_access_time_only_when_stale(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = TwoTierCache(path, max_memory_entries=0)
+    cache.set('search', 'query', {'results': [1]})
+    key = cache_key('search', 'query')
+    written = accessed_at(path, key)
+
+    # A recent access time is left alone
+    assert cache.get('search', 'query') == {'results': [1]}
+    assert accessed_at(path, key) == written
+
+    # A stale one is refreshed
+    stale = time.time() - ACCESS_TIME_GRANULARITY - 1
+    with sqlite3.connect(path) as conn:
+        conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (stale, key))
+    assert cache.get('search', 'query') == {'results': [1]}
+    assert accessed_at(path, key) > stale + ACCESS_TIME_GRANULARITY
+    assert cache.disk_hits == 2
@@ -0,0 +1,94 @@
+"""
+Tests for the chat processor's use of conversation history.
+"""
+import pytest
+from flask import Flask
+from core.backends import GenerationError
+from core.chat_processor import ChatProcessor
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class StubModel:
+    """Model manager answering with fixed chunks, counting words as tokens."""
+
+    def __init__(self, chunks=('fine',), error=None, state='ready'):
+        self.chunks = chunks
+        self.error = error
+        self.state = state
+        self.prompts = []
+        self.waited = []
+
+    def status(self):
+        return {'state': self.state}
+
+    def wait_until_loaded(self, timeout=None):
+        self.waited.append(timeout)
+        return self.state == 'ready'
+
+    def count_tokens(self, text):
+        return count_words(text)
+
+    def generate_stream(self, prompt, mode='normal', client_id=None):
+        self.prompts.append(prompt)
+        yield from self.chunks
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(
+        CONVERSATION_MAX_SESSIONS=8,
+        SYSTEM_PROMPT='',
+        RAG_ENABLED=False,
+        MODES={'normal': {'max_tokens': 10}},
+        MODEL_CTX_SIZE=100,
+        MODEL_LOAD_WAIT=0.5,
+        CONTEXT_SUMMARY_TOKENS=0,
+        CONTEXT_TRIM_RATIO=0.75
+    )
+    with app.app_context():
+        yield app
+
+
+def test_completed_answer_becomes_history(app):
+    processor = ChatProcessor(StubModel(chunks=('all ', 'good')))
+    assert processor.process_message('hello', session_id='s1') == 'all good'
+    assert processor.conversations.get('s1').render() == "USER: hello\nASSISTANT: all good\n"
+
+
+def test_failed_answer_is_not_history(app):
+    model = StubModel(chunks=('half',), error=GenerationError())
+    processor = ChatProcessor(model)
+    with pytest.raises(GenerationError):
+        processor.process_message('hello', session_id='s1')
+    assert processor.conversations.get('s1').turns == []
+
+
+def test_loading_model_is_not_waited_for(app):
+    model = StubModel(state='loading')
+    processor = ChatProcessor(model)
+    with pytest.raises(GenerationError, match='still loading'):
+        processor.process_message('hello', session_id='s1')
+    assert model.waited == [0.5]
+    assert model.prompts == []
+
+
+def test_history_fits_what_the_prompt_leaves(app):
+    processor = ChatProcessor(StubModel())
+    history = processor.conversations.get('s1')
+    for n in range(5):
+        history.add_turn(f"question {n} here", f"answer {n}", count_words)
+
+    # 100 context - 10 max_tokens - 2 preamble - 69 reserved leaves 19, so the
+    # 35 tokens of history are trimmed to 75% of that: two 7-token turns
+    rendered = processor._fit_history(history, 'normal', 'be brief', 69)
+    assert rendered == ("USER: question 3 here\nASSISTANT: answer 3\n"
+                        "USER: question 4 here\nASSISTANT: answer 4\n")
+
+    # Nothing fits once the rest of the prompt takes the whole context
+    assert processor._fit_history(history, 'normal', 'be brief', 100) == ''
@@ -0,0 +1,74 @@
+"""
+Tests for conversation history windows, summaries and session tokens.
+"""
+from core.conversation import Conversation, ConversationStore, issue_session, verify_session
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def conversation(turns):
+    """Conversation of turns exchanges of seven words each."""
+    conversation = Conversation()
+    for n in range(turns):
+        conversation.add_turn(f"question {n} here", f"answer {n}", count_words)
+    return conversation
+
+
+def test_fit_keeps_window_until_it_overflows():
+    history = conversation(3)
+    history.fit(21, count_words, summary_budget=0)
+    assert len(history.turns) == 3
+
+    # Trimming goes down to trim_ratio of the budget, so the next turns still fit
+    history.add_turn("question 3 here", "answer 3", count_words)
+    history.fit(21, count_words, summary_budget=0, trim_ratio=0.75)
+    assert [turn.user_message for turn in history.turns] == ["question 2 here", "question 3 here"]
+    assert history.summary == ''
+    history.add_turn("question 4 here", "answer 4", count_words)
+    history.fit(21, count_words, summary_budget=0, trim_ratio=0.75)
+    assert len(history.turns) == 3
+
+
+def test_dropped_turns_are_summarized_within_budget():
+    history = conversation(4)
+    history.fit(20, count_words, summary_budget=12, trim_ratio=0.75)
+
+    # Two summary lines would exceed 12 tokens, so the oldest is dropped, and
+    # the summary then pushes one more turn out of the window
+    assert history.summary == "- The user asked: question 1 here"
+    assert history.summary_tokens == 7
+    assert [turn.user_message for turn in history.turns] == ["question 3 here"]
+    assert history.summary_tokens + sum(turn.tokens for turn in history.turns) <= 20
+    assert history.render().startswith("Summary of earlier conversation:\n- The user asked")
+
+
+def test_summary_lines_are_shortened():
+    history = Conversation()
+    history.add_turn("word " * 100, "answer", count_words)
+    history.add_turn("short", "answer", count_words)
+    history.fit(5, count_words, summary_budget=50)
+    first, second = history.summary.split('\n')
+    assert first.startswith("- The user asked: word word") and first.endswith("...")
+    assert len(first) == len("- The user asked: ") + 120
+    assert second == "- The user asked: short"
+
+
+def test_store_evicts_least_recently_used():
+    store = ConversationStore(max_sessions=2)
+    first = store.get('a')
+    second = store.get('b')
+    assert store.get('a') is first
+    store.get('c')
+    assert store.get('a') is first
+    assert store.get('b') is not second
+
+
+def test_session_tokens_are_signed():
+    session_id, token = issue_session('secret')
+    assert verify_session(token, 'secret') == session_id
+    assert verify_session(token, 'other secret') is None
+    assert verify_session(token[:-2], 'secret') is None
+    assert verify_session(None, 'secret') is None
+    assert verify_session(session_id, 'secret') is None
@@ -0,0 +1,26 @@
+"""
+Tests for main-content extraction.
+"""
+from features.connectivity.extract import extract_text
+
+BODY = ("This paragraph is the real content of the page, with commas, clauses "
+        "and enough words to score as a content block. ") * 3
+
+
+def test_page_wrapped_in_form_keeps_content():
+    html = (f'<html><body><form id="aspnetForm" method="post">'
+            f'<input type="hidden" name="__VIEWSTATE" value="abc">'
+            f'<div id="content"><p>{BODY}</p></div>'
+            f'<button>Submit the form now please</button></form></body></html>')
+    text = extract_text(html)
+    assert text.startswith("This paragraph is the real content")
+    assert 'Submit' not in text
+
+
+def test_article_header_title_is_kept():
+    html = (f'<html><body><header><h1>Site name banner</h1><p>{BODY}</p></header>'
+            f'<article><header><h1>The Article Title</h1></header><p>{BODY}</p></article>'
+            f'</body></html>')
+    text = extract_text(html)
+    assert text.startswith("The Article Title\n")
+    assert 'Site name banner' not in text
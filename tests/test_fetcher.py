@@ -0,0 +1,143 @@
+"""
+Tests for the HTTP fetch layer, against a local stub HTTP server.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import pytest
+from flask import Flask, request
+from config import TestingConfig
+from features.connectivity.fetcher import DeadlineExceeded, HttpFetcher
+
+PAGE = ("<html><body><article><p>" +
+        "Stub page content, long enough and with commas, to be kept as a content block. " * 3 +
+        "</p></article></body></html>")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves /page, /slow?seconds=N and 404 for anything else, counting concurrent requests."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            path, _, query = self.path.partition('?')
+            if path == '/slow':
+                time.sleep(float(parse_qs(query).get('seconds', ['1'])[0]))
+            if path not in ('/page', '/slow'):
+                self.send_error(404)
+                return
+            body = PAGE.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.active = server.peak = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = HttpFetcher(timeout=5, per_host_limit=2, max_workers=8)
+    yield fetcher
+    fetcher.close()
+
+
+def test_per_host_limit(stub_server, fetcher):
+    server, base = stub_server
+    urls = [f'{base}/slow?seconds=0.2&n={n}' for n in range(6)]
+    results = list(fetcher.map_unordered(lambda url, deadline: fetcher.get(url).status_code, urls))
+    assert [error for _, _, error in results] == [None] * 6
+    assert server.peak == 2
+
+
+def test_map_unordered_deadline(stub_server, fetcher):
+    _, base = stub_server
+    fast, slow = f'{base}/page', f'{base}/slow?seconds=3'
+
+    def fetch(url, deadline):
+        return fetcher.get(url, deadline=deadline).status_code
+
+    started = time.monotonic()
+    results = list(fetcher.map_unordered(fetch, [slow, fast], deadline=0.5))
+    assert time.monotonic() - started < 2
+
+    # The fast page comes first
+    assert results[0] == (fast, 200, None)
+    # The slow page fails by the deadline, either abandoned or by its read timeout
+    url, result, error = results[1]
+    assert url == slow and result is None and error is not None
+
+
+def test_webpages_endpoint_streams_ndjson(stub_server, tmp_path, monkeypatch):
+    _, base = stub_server
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config['SEARCH_CACHE_PATH'] = str(tmp_path / 'search_cache.sqlite')
+
+    with app.app_context():
+        from features.connectivity import search as search_module
+        monkeypatch.setattr(search_module, '_web_search', search_module.WebSearch())
+        from api import search as search_api
+        monkeypatch.setattr(search_api, 'web_search', search_module.get_web_search())
+        app.add_url_rule('/api/webpages', 'api_get_webpages',
+                         lambda: search_api.get_webpages_endpoint(request), methods=['POST'])
+
+        urls = [f'{base}/slow?seconds=3', f'{base}/page', f'{base}/missing']
+        response = app.test_client().post('/api/webpages', json={
+            'urls': urls, 'use_cache': False, 'deadline': 1})
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        pages = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        search_api.web_search.fetcher.close()
+
+    by_url = {page['url']: page for page in pages}
+    assert len(pages) == 3 and set(by_url) == set(urls)
+    assert pages[-1]['url'] == urls[0] and 'error' in pages[-1]
+    assert by_url[urls[1]]['content'].startswith("Stub page content")
+    assert '404' in by_url[urls[2]]['error']
+
+
+def test_get_raises_when_deadline_passed(stub_server, fetcher):
+    _, base = stub_server
+    with pytest.raises(DeadlineExceeded):
+        fetcher.get(f'{base}/page', deadline=time.monotonic() - 1)
+
+
+def test_streamed_response_holds_host_slot_until_closed(stub_server):
+    _, base = stub_server
+    fetcher = HttpFetcher(timeout=5, per_host_limit=1)
+    try:
+        response = fetcher.get(f'{base}/page', stream=True)
+        with pytest.raises(DeadlineExceeded):
+            fetcher.get(f'{base}/page', timeout=0.2)
+        response.close()
+        response.close()
+        assert fetcher.get(f'{base}/page').status_code == 200
+        assert fetcher.get(f'{base}/page').status_code == 200
+    finally:
+        fetcher.close()
@@ -0,0 +1,174 @@
+"""
+Tests for the knowledge API: pooled connections, the full-text index kept
+in sync by triggers, tag filtering and search query escaping.
+"""
+import json
+import pytest
+from flask import Flask, request
+from config import TestingConfig
+from api import knowledge as knowledge_api
+from features.knowledgeBase.database import create_schema, get_connection_pool
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config.update(DB_PATH=str(tmp_path / 'knowledge.sqlite'), DB_POOL_SIZE=2,
+                      DB_POOL_TIMEOUT=1.0)
+    with app.app_context():
+        conn = get_connection_pool().connect()
+        create_schema(conn)
+        conn.close()
+        yield app
+
+
+def break_table(name):
+    """Drop a table so the next statement using it fails."""
+    conn = get_connection_pool().connect()
+    conn.execute(f'DROP TABLE {name}')
+    conn.commit()
+    conn.close()
+
+
+def call(app, endpoint, path='/', **kwargs):
+    """Run an endpoint taking the request in a request context."""
+    with app.test_request_context(path, **kwargs):
+        response = endpoint(request)
+        return response if isinstance(response, tuple) else (response, response.status_code)
+
+
+def assert_connections_returned():
+    stats = get_connection_pool().stats()
+    assert stats['in_use'] == 0 and stats['idle'] == stats['open'] > 0
+
+
+def test_failed_listing_returns_its_connection(app):
+    break_table('knowledge_version')
+    for _ in range(3):
+        _, status = call(app, knowledge_api.get_knowledge)
+        assert status == 500
+        assert_connections_returned()
+
+
+def test_failed_search_returns_its_connection(app):
+    break_table('knowledge_fts')
+    for _ in range(3):
+        _, status = call(app, knowledge_api.search_knowledge, '/?q=pool')
+        assert status == 500
+        assert_connections_returned()
+
+
+def test_listing_streams_and_returns_its_connection(app):
+    response, status = call(app, knowledge_api.get_knowledge, '/?format=ndjson')
+    assert status == 200
+    assert response.get_data(as_text=True) == ''
+    response.close()
+    assert_connections_returned()
+
+
+def test_failed_bulk_import_rolls_back_and_returns_its_connection(app, monkeypatch):
+    def failing_insert(conn, entries, batch_size):
+        conn.execute('BEGIN')
+        conn.execute("INSERT INTO knowledge (title, content) VALUES ('partial', 'row')")
+        raise knowledge_api.sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(knowledge_api, 'bulk_insert', failing_insert)
+    _, status = call(app, knowledge_api.bulk_add_knowledge, method='POST',
+                     json=[{'content': 'row'}])
+    assert status == 500
+    assert_connections_returned()
+
+    conn = get_connection_pool().connect()
+    assert conn.execute('SELECT COUNT(*) FROM knowledge').fetchone()[0] == 0
+    conn.close()
+
+
+def test_failed_add_and_delete_return_their_connections(app):
+    break_table('knowledge_fts')
+    _, status = call(app, knowledge_api.add_knowledge, method='POST',
+                     json={'title': 'T', 'content': 'C'})
+    assert status == 500
+    assert_connections_returned()
+
+    break_table('knowledge')
+    with app.test_request_context('/', method='DELETE'):
+        _, status = knowledge_api.delete_knowledge(1)
+    assert status == 500
+    assert_connections_returned()
+
+
+def add_entry(conn, title, content, tags=()):
+    cursor = conn.execute('INSERT INTO knowledge (title, content, tags) VALUES (?, ?, ?)',
+                          (title, content, json.dumps(list(tags))))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def matches(conn, query):
+    return [row[0] for row in conn.execute(
+        'SELECT rowid FROM knowledge_fts WHERE knowledge_fts MATCH ? ORDER BY rowid', (query,))]
+
+
+def tag_names(conn, entry_id):
+    return sorted(row[0] for row in conn.execute(
+        'SELECT t.name FROM knowledge_tags kt JOIN tags t ON t.id = kt.tag_id '
+        'WHERE kt.knowledge_id = ?', (entry_id,)))
+
+
+def test_triggers_keep_index_and_tags_in_sync(app):
+    conn = get_connection_pool().connect()
+    try:
+        entry = add_entry(conn, 'Connection pools', 'Reuse sqlite handles', [' SQLite ', 'Perf'])
+        assert matches(conn, 'pools') == [entry]
+        assert matches(conn, 'handle') == [entry]
+        assert tag_names(conn, entry) == ['perf', 'sqlite']
+
+        conn.execute('UPDATE knowledge SET title = ?, tags = ? WHERE id = ?',
+                     ('Batch inserts', json.dumps(['sqlite']), entry))
+        conn.commit()
+        assert matches(conn, 'pools') == []
+        assert matches(conn, 'batch') == [entry]
+        assert tag_names(conn, entry) == ['sqlite']
+
+        conn.execute('DELETE FROM knowledge WHERE id = ?', (entry,))
+        conn.commit()
+        assert matches(conn, 'batch') == []
+        assert tag_names(conn, entry) == []
+    finally:
+        conn.close()
+
+
+def test_search_filters_by_every_tag(app):
+    conn = get_connection_pool().connect()
+    both = add_entry(conn, 'Tuning', 'Threads and batches', ['python', 'ml'])
+    python_only = add_entry(conn, 'Typing', 'Threads and hints', ['Python'])
+    conn.close()
+
+    response, status = call(app, knowledge_api.search_knowledge, '/?tags=python')
+    assert status == 200
+    assert {row['id'] for row in response.get_json()['results']} == {both, python_only}
+
+    response, _ = call(app, knowledge_api.search_knowledge, '/?tags=python,%20ML')
+    assert [row['id'] for row in response.get_json()['results']] == [both]
+
+    response, _ = call(app, knowledge_api.search_knowledge, '/?q=hints&tags=python')
+    assert [row['id'] for row in response.get_json()['results']] == [python_only]
+
+
+def test_match_query_quotes_every_word():
+    assert knowledge_api._build_match_query('say "hi" OR NOT foo*') == '"say" "hi" "OR" "NOT" "foo"*'
+    assert knowledge_api._build_match_query('  (!) ') == ''
+
+
+def test_search_text_with_fts_syntax(app):
+    conn = get_connection_pool().connect()
+    entry = add_entry(conn, 'Operators', 'NOT every query and answer is plain text')
+    conn.close()
+
+    for query in ('NOT', 'query AND (', '"plain', 'tex'):
+        response, status = call(app, knowledge_api.search_knowledge, '/',
+                                query_string={'q': query})
+        assert status == 200
+        assert [row['id'] for row in response.get_json()['results']] == [entry]
+    assert_connections_returned()
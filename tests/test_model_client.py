@@ -0,0 +1,71 @@
+"""
+Tests for the model server client.
+"""
+import os
+import threading
+import time
+import pytest
+from flask import Flask
+from core.model_client import ModelClient
+from core.model_server import ModelServer
+from core.scheduler import InferenceScheduler
+
+
+class EchoModel:
+    """Model manager streaming its prompt back word by word."""
+
+    def status(self):
+        return {'state': 'ready', 'model': 'echo', 'progress': 1.0, 'error': None,
+                'load_time': 0.0}
+
+    def generate_stream(self, prompt, mode='normal', client_id=None):
+        yield from prompt.split()
+
+    def prefill(self, text, mode='normal', client_id=None):
+        return len(text.split())
+
+
+class RecordingScheduler(InferenceScheduler):
+    """Scheduler remembering the client of every submitted job."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clients = []
+
+    def submit(self, client_id, fn, priority=0, request_id=None):
+        self.clients.append(client_id)
+        return super().submit(client_id, fn, priority, request_id)
+
+
+@pytest.fixture
+def server(tmp_path):
+    app = Flask(__name__)
+    with app.app_context():
+        scheduler = RecordingScheduler(app=app)
+        scheduler.start()
+        server = ModelServer(EchoModel(), str(tmp_path / 'model.sock'), scheduler, app)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not os.path.exists(server.socket_path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        yield server
+        server.shutdown()
+
+
+def test_server_queues_work_for_the_callers_client(server):
+    client = ModelClient(server.socket_path)
+
+    assert list(client.generate_stream("one two", client_id='sid-1')) == ['one', 'two']
+    assert list(client.generate_stream("three", client_id='sid-1')) == ['three']
+    assert client.prefill("a b c", client_id='sid-2') == 3
+    assert server.scheduler.clients == ['sid-1', 'sid-1', 'sid-2']
+
+
+def test_anonymous_work_gets_its_own_client(server):
+    client = ModelClient(server.socket_path)
+
+    list(client.generate_stream("one"))
+    list(client.generate_stream("two"))
+    first, second = server.scheduler.clients
+    assert first != second and first.startswith('anonymous-')
@@ -0,0 +1,112 @@
+"""
+Tests for GGUF metadata parsing and the model registry's LRU under a memory budget.
+"""
+import struct
+import pytest
+from core.model_registry import GGUFError, ModelInfo, ModelRegistry, read_gguf_metadata
+
+UINT32 = 4
+STRING = 8
+ARRAY = 9
+
+
+def write_gguf(path, metadata, version=3):
+    """Write a GGUF header holding metadata; ints are uint32, lists are arrays."""
+    length = '<I' if version == 1 else '<Q'
+
+    def string(text):
+        data = text.encode('utf-8')
+        return struct.pack(length, len(data)) + data
+
+    def value(item):
+        if isinstance(item, str):
+            return STRING, string(item)
+        if isinstance(item, list):
+            item_type = STRING if item and isinstance(item[0], str) else UINT32
+            items = b''.join(value(element)[1] for element in item)
+            return ARRAY, struct.pack('<I', item_type) + struct.pack(length, len(item)) + items
+        return UINT32, struct.pack('<I', item)
+
+    data = b'GGUF' + struct.pack('<I', version)
+    data += struct.pack(length, 0) + struct.pack(length, len(metadata))
+    for key, item in metadata.items():
+        value_type, encoded = value(item)
+        data += string(key) + struct.pack('<I', value_type) + encoded
+    path.write_bytes(data)
+    return path
+
+
+METADATA = {
+    'general.architecture': 'llama',
+    'llama.context_length': 4096,
+    'llama.block_count': 2,
+    'general.tags': ['chat', 'small'],
+    'tokenizer.ggml.tokens': [f'tok{n}' for n in range(100)],
+    'tokenizer.ggml.token_type': list(range(100)),
+    'general.name': 'Tiny'
+}
+
+
+@pytest.mark.parametrize('version', [1, 3])
+def test_read_metadata_skips_long_arrays(tmp_path, version):
+    path = write_gguf(tmp_path / 'tiny.gguf', METADATA, version=version)
+    metadata = read_gguf_metadata(str(path))
+    assert metadata['gguf.version'] == version
+    assert metadata['llama.context_length'] == 4096
+    assert metadata['general.tags'] == ['chat', 'small']
+    assert metadata['tokenizer.ggml.tokens'] == {'type': 'array', 'length': 100}
+    assert metadata['tokenizer.ggml.token_type'] == {'type': 'array', 'length': 100}
+
+    # Keys after the skipped arrays are read from the right offset
+    assert metadata['general.name'] == 'Tiny'
+
+    info = ModelInfo(str(path), metadata)
+    assert (info.architecture, info.context_length, info.layers) == ('llama', 4096, 2)
+
+
+def test_read_metadata_rejects_bad_files(tmp_path):
+    not_gguf = tmp_path / 'weights.gguf'
+    not_gguf.write_bytes(b'GGML' + bytes(20))
+    with pytest.raises(GGUFError):
+        read_gguf_metadata(str(not_gguf))
+
+    truncated = write_gguf(tmp_path / 'truncated.gguf', METADATA)
+    truncated.write_bytes(truncated.read_bytes()[:-3])
+    with pytest.raises(GGUFError):
+        read_gguf_metadata(str(truncated))
+
+
+@pytest.fixture
+def registry(tmp_path):
+    for name in 'abc':
+        write_gguf(tmp_path / f'{name}.gguf', {'general.name': name})
+    size = (tmp_path / 'a.gguf').stat().st_size
+    evicted = []
+    registry = ModelRegistry(str(tmp_path), loader=lambda info: info.name,
+                             memory_budget=2 * size,
+                             on_evict=lambda info, model: evicted.append(info.name))
+    registry.scan()
+    registry.evicted = evicted
+    return registry
+
+
+def test_evicts_least_recently_used(registry):
+    for name in ('a', 'b', 'a', 'c'):
+        with registry.use(name):
+            pass
+    assert registry.evicted == ['b.gguf']
+    assert registry.stats()['loaded'] == ['a.gguf', 'c.gguf']
+
+
+def test_borrowed_models_are_not_evicted(registry):
+    with registry.use('a'), registry.use('b'):
+        # Everything loaded is borrowed, so the budget is overshot for now
+        with registry.use('c') as model:
+            assert model == 'c.gguf'
+            assert registry.stats()['loaded'] == ['a.gguf', 'b.gguf', 'c.gguf']
+            assert registry.evicted == []
+
+        # Returning c brings usage back within the budget without touching a or b
+        assert registry.evicted == ['c.gguf']
+    assert registry.stats()['loaded'] == ['a.gguf', 'b.gguf']
+    assert registry.stats()['in_use'] == {}
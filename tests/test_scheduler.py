@@ -0,0 +1,132 @@
+"""
+Tests for the fair inference queue and how failed jobs reach chat clients.
+"""
+import json
+import pytest
+from flask import Flask, request
+from api.chat import chat_endpoint
+from core.scheduler import ClientQueueFullError, InferenceScheduler, QueueFullError
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(MODES={'normal': {}}, AGENT_ID='local', SECRET_KEY='test-secret')
+    return app
+
+
+def make_scheduler(app, **kwargs):
+    scheduler = InferenceScheduler(app=app, **kwargs)
+    order = []
+
+    def job(client_id, label):
+        def run():
+            order.append(label)
+            yield label
+        return scheduler.submit(client_id, run)
+
+    return scheduler, job, order
+
+
+def test_flooding_client_cannot_starve_others(app):
+    scheduler, job, order = make_scheduler(app, max_per_client=8)
+    jobs = [job('a', 'a1'), job('a', 'a2'), job('a', 'a3'), job('b', 'b1'), job('c', 'c1')]
+    scheduler.start()
+    try:
+        for queued in jobs:
+            queued.result()
+    finally:
+        scheduler.shutdown()
+    assert order == ['a1', 'b1', 'c1', 'a2', 'a3']
+
+
+def test_rejects_when_client_share_is_full(app):
+    scheduler, job, _ = make_scheduler(app, max_queue_size=3, max_per_client=2)
+    job('a', 'a1')
+    job('a', 'a2')
+    with pytest.raises(ClientQueueFullError) as rejected:
+        job('a', 'a3')
+    assert rejected.value.pending == 2
+    assert rejected.value.position is None
+
+
+def test_rejects_when_queue_is_full(app):
+    scheduler, job, _ = make_scheduler(app, max_queue_size=2, max_per_client=2)
+    job('a', 'a1')
+    job('b', 'b1')
+    with pytest.raises(QueueFullError) as rejected:
+        job('c', 'c1')
+    assert not isinstance(rejected.value, ClientQueueFullError)
+    assert rejected.value.position == 3
+    assert scheduler.stats()['rejected'] == 1
+
+
+def test_cancel_client_drops_its_jobs(app):
+    scheduler, job, order = make_scheduler(app)
+    cancelled = [job('a', 'a1'), job('a', 'a2')]
+    kept = job('b', 'b1')
+    assert scheduler.cancel_client('a') == 2
+    assert scheduler.stats()['queue_depth'] == 1
+    scheduler.start()
+    try:
+        assert kept.result() == 'b1'
+        assert [queued.result() for queued in cancelled] == ['', '']
+    finally:
+        scheduler.shutdown()
+    assert order == ['b1']
+
+
+def test_failed_job_keeps_its_error(app):
+    scheduler = InferenceScheduler(app=app)
+
+    def fail():
+        yield 'partial'
+        raise RuntimeError('model crashed')
+
+    job = scheduler.submit('a', fail)
+    scheduler.start()
+    try:
+        assert job.result() == 'partial'
+    finally:
+        scheduler.shutdown()
+    assert isinstance(job.error, RuntimeError)
+
+
+class FailingProcessor:
+    """Chat processor whose generation breaks off after one chunk."""
+
+    agent_pool = None
+
+    def forward_message_stream(self, message, mode, session_id):
+        return None
+
+    def process_message_stream(self, message, mode, session_id, client_id=None):
+        yield 'partial'
+        raise RuntimeError('model crashed')
+
+
+@pytest.fixture
+def client(app):
+    scheduler = InferenceScheduler(app=app)
+    scheduler.start()
+
+    @app.route('/api/chat', methods=['POST'])
+    def chat():
+        return chat_endpoint(request, FailingProcessor(), scheduler)
+
+    yield app.test_client()
+    scheduler.shutdown()
+
+
+def test_chat_reports_failed_job(client):
+    response = client.post('/api/chat', json={'message': 'hello'})
+    assert response.status_code == 500
+    assert 'error' in response.get_json()
+
+
+def test_streamed_chat_ends_with_error(client):
+    response = client.post('/api/chat', json={'message': 'hello', 'stream': True})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[0] == {'chunk': 'partial'}
+    assert 'error' in events[-1]
+    assert not any(event.get('done') for event in events)
@@ -0,0 +1,23 @@
+"""
+Tests for speculative decoding drafters.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('llama_cpp')
+
+from core.speculative import Drafter, PromptLookupDrafter
+
+
+def test_drafter_without_draft_cannot_be_instantiated():
+    class NoDraft(Drafter):
+        pass
+
+    with pytest.raises(TypeError, match='draft'):
+        NoDraft()
+
+
+def test_prompt_lookup_drafts_the_continuation():
+    drafter = PromptLookupDrafter(num_pred_tokens=2, max_ngram_size=2)
+    draft = drafter(np.array([5, 6, 7, 8, 5, 6], dtype=np.intc))
+    assert list(draft) == [7, 8]
@@ -0,0 +1,244 @@
+"""
+Two-tier caching utilities.
+This module provides a thread-safe in-process LRU in front of a persistent
+SQLite store, keyed by stable content digests.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from utils.sqlite_pool import get_pool
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries(accessed_at);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries(expires_at);
+'''
+
+# Disk hits only refresh accessed_at once it is this many seconds old, so most
+# reads stay read-only instead of queueing for the WAL writer lock
+ACCESS_TIME_GRANULARITY = 60
+
+
+def normalize_text(text):
+    """
+    Normalize free text so trivially different queries share a cache entry.
+
+    Args:
+        text (str): The text to normalize
+
+    Returns:
+        str: Case-folded text with collapsed whitespace
+    """
+    return ' '.join(text.casefold().split())
+
+
+def cache_key(namespace, text):
+    """
+    Build a stable cache key.
+
+    Unlike hash(), the digest is the same in every process, so persisted
+    entries are found again after a restart.
+
+    Args:
+        namespace (str): Kind of value being cached
+        text (str): The already normalized lookup text
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(f"{namespace}\0{text}".encode('utf-8')).hexdigest()
+
+
+class TwoTierCache:
+    """In-memory LRU backed by a size-bounded SQLite store with TTLs."""
+
+    def __init__(self, db_path, max_memory_entries=256, max_bytes=64 * 1024 * 1024,
+                 default_ttl=3600):
+        """
+        Initialize the cache.
+
+        Args:
+            db_path (str): Path of the SQLite file for the persistent tier
+            max_memory_entries (int): Entries kept in the in-process LRU
+            max_bytes (int): Size budget of the persistent tier
+            default_ttl (int): Seconds an entry stays valid unless overridden
+        """
+        self.max_memory_entries = max_memory_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.pool = get_pool(db_path, max_size=4)
+
+        conn = self.pool.connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+            conn.commit()
+            self._disk_bytes = conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM cache_entries'
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    def get(self, namespace, text):
+        """
+        Look up a cached value.
+
+        Args:
+            namespace (str): Kind of value being cached
+            text (str): The normalized lookup text
+
+        Returns:
+            object or None: The cached value, or None on a miss
+        """
+        key = cache_key(namespace, text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+        conn = self.pool.connect()
+        try:
+            row = conn.execute(
+                'SELECT value, expires_at, accessed_at FROM cache_entries '
+                'WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+            if row is not None and now - row['accessed_at'] >= ACCESS_TIME_GRANULARITY:
+                conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (now, key))
+                conn.commit()
+        finally:
+            conn.close()
+
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        value = json.loads(row['value'])
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, row['expires_at'], value)
+        return value
+
+    def set(self, namespace, text, value, ttl=None):
+        """
+        Store a value in both tiers.
+
+        Args:
+            namespace (str): Kind of value being cached
+            text (str): The normalized lookup text
+            value (object): JSON-serializable value
+            ttl (int): Seconds until the entry expires, default_ttl if None
+        """
+        key = cache_key(namespace, text)
+        now = time.time()
+        expires_at = now + (self.default_ttl if ttl is None else ttl)
+        payload = json.dumps(value)
+        size = len(payload.encode('utf-8'))
+
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self.writes += 1
+
+        # A single transaction replaces the entry, so readers never see a torn write
+        conn = self.pool.connect()
+        try:
+            with conn:
+                old = conn.execute('SELECT size FROM cache_entries WHERE key = ?', (key,)).fetchone()
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache_entries '
+                    '(key, namespace, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, namespace, payload, size, expires_at, now)
+                )
+            with self._lock:
+                self._disk_bytes += size - (old['size'] if old else 0)
+                over_budget = self._disk_bytes > self.max_bytes
+            if over_budget:
+                self._evict(conn)
+        finally:
+            conn.close()
+
+    def _remember(self, key, expires_at, value):
+        """Insert into the memory tier. Caller holds the lock."""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, conn):
+        """Drop expired, then least recently used entries until under budget."""
+        with conn:
+            conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+
+            # Trim down to 90% so eviction does not run on every write
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries').fetchone()[0]
+            target = int(self.max_bytes * 0.9)
+            if total > target:
+                removed = 0
+                victims = []
+                for row in conn.execute('SELECT key, size FROM cache_entries ORDER BY accessed_at'):
+                    if total - removed <= target:
+                        break
+                    victims.append((row['key'],))
+                    removed += row['size']
+                conn.executemany('DELETE FROM cache_entries WHERE key = ?', victims)
+                total -= removed
+                with self._lock:
+                    self.evictions += len(victims)
+                    for (key,) in victims:
+                        self._memory.pop(key, None)
+
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: Hit/miss counts per tier, hit ratio and sizes
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_entries': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+                'max_bytes': self.max_bytes,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'hit_ratio': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
@@ -0,0 +1,108 @@
+"""
+Async worker support.
+This module switches the server between OS threads and the eventlet or
+gevent event loops, and runs blocking native calls (model inference,
+SQLite) on a real thread pool so they never stall the event loop.
+"""
+import contextvars
+
+ASYNC_MODES = ('threading', 'eventlet', 'gevent')
+
+_mode = 'threading'
+
+
+def monkey_patch(mode):
+    """
+    Patch the standard library for a cooperative async mode.
+
+    Must run before anything else imports socket, threading or ssl.
+
+    Args:
+        mode (str): 'threading', 'eventlet' or 'gevent'
+
+    Returns:
+        str: The mode in effect
+
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    global _mode
+    if mode not in ASYNC_MODES:
+        raise ValueError(f"Unknown async mode {mode!r}, expected one of {ASYNC_MODES}")
+    if mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    _mode = mode
+    return _mode
+
+
+def async_mode():
+    """
+    Get the active async mode.
+
+    Returns:
+        str: 'threading', 'eventlet' or 'gevent'
+    """
+    return _mode
+
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Call a function that blocks in native code without stalling the event loop.
+
+    Under eventlet and gevent the call runs on the loop's native thread pool
+    while the calling green thread yields; in threading mode it runs inline.
+    The caller's context variables (app context, trace id) are visible to fn.
+
+    Args:
+        fn (callable): The blocking function
+        *args: Positional arguments for fn
+        **kwargs: Keyword arguments for fn
+
+    Returns:
+        object: fn's return value
+    """
+    if _mode == 'threading':
+        return fn(*args, **kwargs)
+
+    context = contextvars.copy_context()
+    if _mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(context.run, fn, *args, **kwargs)
+
+    import gevent
+    return gevent.get_hub().threadpool.apply(context.run, (fn,) + args, kwargs)
+
+
+def iterate_blocking(iterable):
+    """
+    Iterate over an iterator whose steps block in native code.
+
+    Each step runs through run_blocking(), so a token stream from llama.cpp
+    lets other green threads run between tokens.
+
+    Args:
+        iterable (iterable): The blocking iterable
+
+    Yields:
+        object: The iterable's items
+    """
+    iterator = iter(iterable)
+    if _mode == 'threading':
+        yield from iterator
+        return
+
+    done = object()
+    try:
+        while True:
+            item = run_blocking(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        # Stopping early must still stop the underlying generation
+        if hasattr(iterator, 'close'):
+            iterator.close()
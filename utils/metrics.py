@@ -0,0 +1,354 @@
+"""
+Prometheus-style metrics.
+This module provides counters, gauges and histograms with labels, renders
+them in the Prometheus text exposition format, and defines the metrics the
+application records.
+"""
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, from cache hits to long generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=()):
+    """Render a label set like {route="/api/search",method="POST"}."""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    """Render a sample value, using Prometheus spellings for infinities."""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric.
+
+        Args:
+            metric (Metric): The metric
+
+        Raises:
+            ValueError: If a metric with the same name exists
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """
+        Render every metric in the text exposition format.
+
+        Returns:
+            str: The metrics page
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """Base class of labelled metrics; one child holds the value per label set."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        """
+        Initialize the metric.
+
+        Args:
+            name (str): Metric name
+            documentation (str): Help text
+            labelnames (tuple): Label names, if the metric is labelled
+            registry (Registry): Where the metric is rendered
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values, **kwargs):
+        """
+        Get the child for a label set, creating it on first use.
+
+        Args:
+            *values: Label values in labelnames order
+            **kwargs: Label values by name
+
+        Returns:
+            Metric child with the metric's recording methods
+        """
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        """The child of an unlabelled metric."""
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class _Value:
+    """A float updated under a lock."""
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def set_function(self, function):
+        """Read the value from a callable when rendering."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float('nan')
+        return self.value
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        """Increase the unlabelled counter."""
+        self._default().inc(amount)
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+                for key, child in self._items()]
+
+
+class Gauge(Counter):
+    """Value that goes up and down."""
+
+    kind = 'gauge'
+
+    def dec(self, amount=1):
+        """Decrease the unlabelled gauge."""
+        self._default().dec(amount)
+
+    def set(self, value):
+        """Set the unlabelled gauge."""
+        self._default().set(value)
+
+    def set_function(self, function):
+        """Read the unlabelled gauge from a callable when rendering."""
+        self._default().set_function(function)
+
+
+class _Histogram:
+    """Bucket counts, sum and count of observations."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self.observe)
+
+
+class _Timer:
+    def __init__(self, observe):
+        self.observe = observe
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.observe(time.perf_counter() - self.started)
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        """
+        Initialize the histogram.
+
+        Args:
+            name (str): Metric name
+            documentation (str): Help text
+            labelnames (tuple): Label names, if the metric is labelled
+            buckets (tuple): Upper bounds of the buckets; +Inf is added
+            registry (Registry): Where the metric is rendered
+        """
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value):
+        """Record a value in the unlabelled histogram."""
+        self._default().observe(value)
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return self._default().time()
+
+    def samples(self):
+        lines = []
+        for key, child in self._items():
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render():
+    """
+    Render the application's metrics.
+
+    Returns:
+        str: The metrics page in the Prometheus text format
+    """
+    return REGISTRY.render()
+
+
+# HTTP and Socket.IO
+HTTP_REQUESTS = Counter('http_requests_total', "HTTP requests by route and status",
+                        ('method', 'route', 'status'))
+HTTP_LATENCY = Histogram('http_request_duration_seconds', "HTTP request latency by route",
+                         ('method', 'route'))
+SOCKETIO_MESSAGES = Counter('socketio_messages_total', "Socket.IO events received", ('event',))
+SOCKETIO_IN_FLIGHT = Gauge('socketio_messages_in_flight', "Chat messages being answered")
+SOCKETIO_CLIENTS = Gauge('socketio_connected_clients', "Connected Socket.IO clients")
+
+# Inference
+TOKENS_GENERATED = Counter('llm_tokens_generated_total', "Tokens generated by mode", ('mode',))
+PROMPT_EVAL_SECONDS = Histogram('llm_prompt_eval_seconds',
+                                "Time from request to first token by mode", ('mode',))
+GENERATION_SECONDS = Histogram('llm_generation_seconds',
+                               "Time from first to last token by mode", ('mode',))
+MODEL_LOAD_SECONDS = Gauge('llm_model_load_seconds', "Seconds the last load of a model took",
+                           ('model',))
+MODEL_LOADS = Counter('llm_model_loads_total', "Model loads", ('model',))
+COMPLETION_CACHE_LOOKUPS = Counter('llm_completion_cache_lookups_total',
+                                   "Completion cache lookups by mode", ('mode', 'result'))
+BATCH_ACTIVE_SEQUENCES = Gauge('llm_batch_active_sequences',
+                               "Sequences decoded together by the batch engine", ('model',))
+SPECULATIVE_DRAFTED_TOKENS = Counter('llm_speculative_drafted_tokens_total',
+                                     "Drafted tokens verified by the main model by mode",
+                                     ('mode',))
+SPECULATIVE_ACCEPTED_TOKENS = Counter('llm_speculative_accepted_tokens_total',
+                                      "Drafted tokens the main model accepted by mode", ('mode',))
+
+# Search and storage
+SEARCH_CACHE_LOOKUPS = Counter('search_cache_lookups_total', "Search cache lookups",
+                               ('kind', 'result'))
+SEARCH_CACHE_HIT_RATIO = Gauge('search_cache_hit_ratio',
+                               "Share of search cache lookups served from cache")
+SQLITE_QUERY_SECONDS = Histogram('sqlite_query_duration_seconds',
+                                 "SQLite statement execution time by statement type",
+                                 ('operation',),
+                                 buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+
+
+def init_app(app):
+    """
+    Record the count and latency of every HTTP request.
+
+    Args:
+        app (Flask): The application
+    """
+    from flask import request, g
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # Route templates keep label values bounded, unlike raw paths
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+        return response
@@ -0,0 +1,276 @@
+"""
+SQLite connection pooling.
+This module keeps tuned, reusable SQLite connections so request handlers do
+not pay for a new connection and cold statement cache on every call.
+"""
+import sqlite3
+import threading
+import time
+from utils.concurrency import run_blocking
+from utils.metrics import SQLITE_QUERY_SECONDS
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free in time."""
+
+
+def _timed(method, sql, *args):
+    """Run an execute method off the event loop, recording its time by statement type."""
+    started = time.perf_counter()
+    try:
+        return run_blocking(method, sql, *args)
+    finally:
+        operation = sql.lstrip().split(None, 1)[0].lower() if sql.strip() else 'empty'
+        SQLITE_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement execution time."""
+
+    def execute(self, sql, *args):
+        return _timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return _timed(super().executemany, sql, *args)
+
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection whose close() hands it back to its pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.checked_out = False
+
+    def cursor(self, factory=TimedCursor):
+        """Create a cursor that records statement times."""
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        """Execute a statement, recording its time."""
+        return _timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        """Execute a statement for each parameter set, recording its time."""
+        return _timed(super().executemany, sql, *args)
+
+    def close(self):
+        """Return the connection to its pool instead of closing it."""
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        """Close the underlying connection for good."""
+        self.pool = None
+        super().close()
+
+    def __del__(self):
+        # A caller that never closed its connection must not leak a pool slot
+        if self.checked_out and self.pool is not None:
+            self.pool.forget(self)
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections sharing one set of pragmas."""
+
+    def __init__(self, db_path, max_size=8, timeout=30.0, busy_timeout_ms=5000,
+                 mmap_size=256 * 1024 * 1024, cache_size_kb=65536, cached_statements=256):
+        """
+        Initialize the pool. Connections are opened lazily.
+
+        Args:
+            db_path (str): Path to the database file
+            max_size (int): Maximum number of open connections
+            timeout (float): Seconds to wait for a free connection
+            busy_timeout_ms (int): How long SQLite retries when the database is locked
+            mmap_size (int): Bytes of the database file to memory-map
+            cache_size_kb (int): Page cache size per connection in KiB
+            cached_statements (int): Prepared statements kept per connection
+        """
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+        # Metrics
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def _open(self):
+        """Open and configure a new connection."""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=PooledConnection
+        )
+        conn.row_factory = sqlite3.Row
+
+        # WAL lets readers run alongside a writer instead of failing with
+        # "database is locked"; NORMAL sync is safe in WAL mode
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def connect(self):
+        """
+        Check out a connection. Call close() on it to return it.
+
+        Returns:
+            PooledConnection: A configured connection
+
+        Raises:
+            PoolTimeoutError: If every connection stays busy for timeout seconds
+        """
+        with self._cond:
+            waited = None
+            while not self._idle and self._size >= self.max_size:
+                if waited is None:
+                    waited = time.monotonic()
+                    self._waits += 1
+                remaining = self.timeout - (time.monotonic() - waited)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No free connection to {self.db_path}")
+                self._cond.wait(remaining)
+            if waited is not None:
+                self._wait_time += time.monotonic() - waited
+
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                # Reserve the slot before releasing the lock to open the file
+                self._size += 1
+                conn = None
+            self._checkouts += 1
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        conn.pool = self
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        """
+        Return a checked out connection to the pool.
+
+        Args:
+            conn (PooledConnection): The connection to return
+        """
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+
+        # Never hand a half-finished transaction to the next caller
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            conn.discard()
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def forget(self, conn):
+        """
+        Drop a checked out connection that will never be returned.
+
+        Args:
+            conn (PooledConnection): The abandoned connection
+        """
+        conn.checked_out = False
+        conn.pool = None
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._cond:
+            for conn in self._idle:
+                conn.discard()
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        """
+        Get pool usage counters.
+
+        Returns:
+            dict: Connection counts, checkouts and wait statistics
+        """
+        with self._cond:
+            return {
+                'db_path': self.db_path,
+                'max_size': self.max_size,
+                'open': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'timeouts': self._timeouts
+            }
+
+
+def get_pool(db_path, **kwargs):
+    """
+    Get the shared pool for a database file, creating it on first use.
+
+    Args:
+        db_path (str): Path to the database file
+        **kwargs: ConnectionPool settings, used only when the pool is created
+
+    Returns:
+        ConnectionPool: The pool for db_path
+    """
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(db_path, **kwargs)
+            _pools[db_path] = pool
+        return pool
+
+
+def all_pool_stats():
+    """
+    Get stats for every pool created in this process.
+
+    Returns:
+        list: One stats dict per pool
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -0,0 +1,121 @@
+"""
+Per-request tracing.
+This module keeps the current trace id in a context variable, so it follows
+a request across threads that copy the context, and logs timed spans as
+structured JSON lines.
+"""
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+_span = contextvars.ContextVar('span', default=None)
+
+logger = logging.getLogger('trace')
+
+
+def new_trace_id():
+    """Generate a short random trace id."""
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    """
+    Get the trace id of the running request.
+
+    Returns:
+        str or None: The trace id, or None outside a trace
+    """
+    return _trace_id.get()
+
+
+def start_trace(trace_id=None):
+    """
+    Make a trace id current in this context.
+
+    Args:
+        trace_id (str): Id to continue, such as a client request id; a new one if None
+
+    Returns:
+        str: The current trace id
+    """
+    trace_id = trace_id or new_trace_id()
+    _trace_id.set(trace_id)
+    _span.set(None)
+    return trace_id
+
+
+@contextmanager
+def span(name, **fields):
+    """
+    Time a block and log it as a span of the current trace.
+
+    Spans nest: each logged span records the name of its parent. Fields
+    may be added while the block runs through the yielded dict.
+
+    Args:
+        name (str): Span name, like 'chat' or 'search'
+        **fields: Extra values logged with the span
+
+    Yields:
+        dict: The span's fields
+    """
+    parent = _span.get()
+    token = _span.set(name)
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield fields
+    except BaseException as e:
+        # Closing a generator mid-stream is how clients stop early, not a failure
+        status = 'cancelled' if isinstance(e, GeneratorExit) else 'error'
+        fields.setdefault('error', str(e) or type(e).__name__)
+        raise
+    finally:
+        _span.reset(token)
+        record = {
+            'trace_id': _trace_id.get(),
+            'span': name,
+            'parent': parent,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            'status': status
+        }
+        record.update(fields)
+        logger.info(json.dumps(record, default=str))
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace id to log records as record.trace_id."""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get() or '-'
+        return True
+
+
+def init_app(app):
+    """
+    Start a trace for every HTTP request and return its id in X-Trace-Id.
+
+    A trace id sent by the client in X-Trace-Id or X-Request-Id is continued.
+
+    Args:
+        app (Flask): The application
+    """
+    from flask import request
+
+    @app.before_request
+    def begin_trace():
+        start_trace(request.headers.get('X-Trace-Id') or request.headers.get('X-Request-Id'))
+
+    @app.after_request
+    def return_trace_id(response):
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers['X-Trace-Id'] = trace_id
+        return response
+
+    for handler in logging.getLogger().handlers + app.logger.handlers:
+        handler.addFilter(TraceIdFilter())